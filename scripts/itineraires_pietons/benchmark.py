@@ -0,0 +1,503 @@
+"""
+Banc d'essai des étapes critiques du pipeline (Application Layer).
+
+Mesure, sur un jeu synthétique (cf. synthetic_data) ou sur les sources
+réelles, la durée et la mémoire de chaque étape critique :
+- chargement des POI et des arrêts (`DataLoader`) ;
+- recherche des paires (`SpatialService.find_nearby_pois`) ;
+- boucle de l'orchestrateur avec un routeur factice (`StubRoutingService`,
+  sans réseau : seul le coût du pipeline est mesuré) ;
+- export des Features dans chaque format de sortie (`ExportService`).
+
+Chaque étape est exécutée BENCHMARK_REPEAT fois (médiane des durées), puis une
+dernière fois sous tracemalloc pour le pic d'allocation (mesuré à part car
+tracemalloc ralentit l'exécution ; les allocations internes de pyarrow ne
+sont pas comptées). Les résultats sont ajoutés à un historique JSONL avec la
+révision du code, et comparés à la mesure précédente sur le même jeu : les
+hausses de durée au-delà de BENCHMARK_REGRESSION_PCT sont signalées.
+
+Usage :
+    python -m itineraires_pietons.benchmark --scale departement
+    python -m itineraires_pietons.benchmark --poi POI_IDF.csv --arrets referentiel.parquet
+"""
+
+import argparse
+import gc
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from routingpy.direction import Direction
+
+from . import __version__
+from .config import (
+    BENCHMARK_DIR,
+    BENCHMARK_HISTORY_FILENAME,
+    BENCHMARK_MAX_ROUTES,
+    BENCHMARK_NOISE_FLOOR_S,
+    BENCHMARK_REGRESSION_PCT,
+    BENCHMARK_REPEAT,
+    LOCAL_WALKING_SPEEDS_KMH,
+    MAX_DISTANCE,
+    OUTPUT_FORMATS,
+    PACKAGE_DIR,
+    SYNTHETIC_SCALES,
+)
+from .data_loader import DataLoader
+from .export_service import ExportService
+from .orchestrator import ItineraryOrchestrator
+from .routing_service import RateLimiter, RoutingService
+from .run_metrics import _max_rss_mb
+from .spatial_service import SpatialService
+from .synthetic_data import ARRETS_FILENAME, POI_FILENAME, SyntheticDataGenerator
+
+logger = logging.getLogger(__name__)
+
+# Routeur factice : détour par rapport au vol d'oiseau et espacement des points
+STUB_DETOUR = 1.25
+STUB_POINT_SPACING_M = 15.0
+
+
+class StubRoutingService(RoutingService):
+    """Routeur factice sans réseau : tracé ondulé entre les deux points."""
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency: attente (s) simulée par requête (0 = aucune)
+        """
+        self.set_profile("pedestrian")
+        self.cache = None
+        self.rate_limiter = RateLimiter()
+        self.requests = Counter()
+        self._requests_lock = threading.Lock()
+        self.latency = latency
+        self.speed_ms = LOCAL_WALKING_SPEEDS_KMH["pedestrian"] / 3.6
+
+    def _fetch_route(self, origin: tuple, destination: tuple):
+        """Tracé d'un point tous les STUB_POINT_SPACING_M, légèrement ondulé."""
+        if self.latency:
+            time.sleep(self.latency)
+        crow = SpatialService.haversine_vectorized(
+            origin[1], origin[0], np.array([destination[1]]), np.array([destination[0]])
+        )[0]
+        distance = crow * STUB_DETOUR
+        t = np.linspace(0.0, 1.0, max(2, int(distance / STUB_POINT_SPACING_M) + 1))
+        lon = origin[0] + t * (destination[0] - origin[0])
+        lat = origin[1] + t * (destination[1] - origin[1])
+        lat = lat + 1e-4 * np.sin(6 * np.pi * t)
+        return Direction(
+            geometry=np.column_stack([lon, lat]).tolist(),
+            duration=round(distance / self.speed_ms),
+            distance=round(distance),
+        )
+
+    def _fetch_matrix(self, origin: tuple, destinations: List[tuple]):
+        """Distances et durées factices (vol d'oiseau x STUB_DETOUR)."""
+        if self.latency:
+            time.sleep(self.latency)
+        destinations = np.asarray(destinations, dtype=np.float64)
+        distances = np.round(
+            SpatialService.haversine_vectorized(
+                origin[1], origin[0], destinations[:, 1], destinations[:, 0]
+            )
+            * STUB_DETOUR
+        )
+        return distances, np.round(distances / self.speed_ms)
+
+
+def code_revision() -> str:
+    """Révision git du code mesuré (version du package à défaut)."""
+    try:
+        result = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=PACKAGE_DIR,
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return __version__
+    return result.stdout.strip() or __version__
+
+
+def synthetic_dataset(n_communes: int, seed: int) -> Tuple[Path, Path]:
+    """
+    Jeu synthétique de BENCHMARK_DIR, généré au premier appel.
+
+    Args:
+        n_communes: nombre de communes
+        seed: graine du générateur
+
+    Returns:
+        Tuple (chemin des POI, chemin des arrêts)
+    """
+    data_dir = BENCHMARK_DIR / f"jeu_{n_communes}_communes_{seed}"
+    poi_path, arrets_path = data_dir / POI_FILENAME, data_dir / ARRETS_FILENAME
+    if not (poi_path.exists() and arrets_path.exists()):
+        SyntheticDataGenerator(n_communes, seed=seed).write(data_dir)
+    return poi_path, arrets_path
+
+
+class BenchmarkSuite:
+    """Mesures de durée et de mémoire des étapes critiques sur un jeu de données."""
+
+    def __init__(
+        self,
+        poi_path: Path,
+        arrets_path: Path,
+        max_routes: int = BENCHMARK_MAX_ROUTES,
+        repeat: int = BENCHMARK_REPEAT,
+        max_distance: float = MAX_DISTANCE,
+    ):
+        """
+        Args:
+            poi_path: CSV (ou parquet) des POI
+            arrets_path: parquet des arrêts
+            max_routes: itinéraires routés et exportés par étape
+            repeat: mesures de durée par étape (médiane retenue)
+            max_distance: rayon de recherche des paires (m)
+        """
+        self.poi_path = Path(poi_path)
+        self.arrets_path = Path(arrets_path)
+        self.max_routes = max_routes
+        self.repeat = repeat
+        self.max_distance = max_distance
+        self.dataset: Dict[str, Any] = {}
+
+    def prepare(self):
+        """Charge les entrées des étapes (non mesuré)."""
+        df_poi, df_arrets = DataLoader.load_data(
+            str(self.poi_path), str(self.arrets_path)
+        )
+        arret_idx, poi_idx, distances = SpatialService.find_nearby_pairs(
+            df_arrets, df_poi, self.max_distance
+        )
+        rng = np.random.default_rng(0)
+        sample = np.sort(
+            rng.choice(
+                len(distances), min(self.max_routes, len(distances)), replace=False
+            )
+        )
+        df_pairs = ItineraryOrchestrator.build_pair_table(
+            arret_idx[sample], poi_idx[sample], distances[sample], df_arrets, df_poi
+        )
+        records = df_pairs.to_dict("records")
+        router = StubRoutingService()
+        routes = [
+            router.calculate_route(
+                (pair["ArRLongitude"], pair["ArRLatitude"]),
+                (pair["poi_lon"], pair["poi_lat"]),
+            )
+            for pair in records
+        ]
+        self.dataset = {
+            "df_poi": df_poi,
+            "df_arrets": df_arrets,
+            "records": records,
+            "routes": routes,
+            "arrets": len(df_arrets),
+            "poi": len(df_poi),
+            "paires": len(distances),
+        }
+        logger.info(
+            f"Jeu mesuré : {len(df_arrets)} arrêts, {len(df_poi)} POI, "
+            f"{len(distances)} paires, {len(records)} itinéraires routés et exportés"
+        )
+
+    def stages(self) -> Dict[str, Callable[[Path], Any]]:
+        """Étapes mesurées : fonction prenant un dossier de travail vierge."""
+        data = self.dataset
+
+        def load_poi(_: Path):
+            return DataLoader.load_poi(str(self.poi_path))
+
+        def load_arrets(_: Path):
+            return DataLoader.load_arrets(str(self.arrets_path))
+
+        def find_pairs(_: Path):
+            return SpatialService.find_nearby_pois(
+                data["df_arrets"], data["df_poi"], self.max_distance
+            )
+
+        def orchestrate(work_dir: Path):
+            orchestrator = ItineraryOrchestrator()
+            orchestrator.routing_service = StubRoutingService()
+            np.random.seed(0)  # échantillon --limit reproductible
+            return orchestrator.generate_itineraries(
+                poi_path=str(self.poi_path),
+                arrets_path=str(self.arrets_path),
+                output_folder=work_dir,
+                max_distance=self.max_distance,
+                limit=self.max_routes,
+                output_format="ndjson",
+            )
+
+        def exporter(output_format: str) -> Callable[[Path], int]:
+            def export(work_dir: Path) -> int:
+                writer = ExportService.create_writer(output_format, work_dir)
+                for route, pair in zip(data["routes"], data["records"]):
+                    feature = ExportService.create_geojson_feature(route, pair)
+                    writer.write(feature, ExportService.generate_filename(pair))
+                writer.close()
+                return writer.count
+
+            return export
+
+        stages = {
+            "chargement_poi": load_poi,
+            "chargement_arrets": load_arrets,
+            "recherche_paires": find_pairs,
+            "orchestrateur": orchestrate,
+        }
+        for output_format in OUTPUT_FORMATS:
+            stages[f"export_{output_format}"] = exporter(output_format)
+        return stages
+
+    def measure(self, func: Callable[[Path], Any], work_dir: Path) -> Dict[str, float]:
+        """
+        Mesure une étape : durées (passes sans instrumentation) puis pic
+        d'allocation (passe sous tracemalloc).
+
+        Args:
+            func: étape (cf. `stages`)
+            work_dir: dossier de travail ; chaque passe a son sous-dossier
+
+        Returns:
+            Durées médiane et minimale (s), pics tracemalloc et RSS (Mo)
+        """
+        durations = []
+        for i in range(self.repeat):
+            gc.collect()
+            start = time.perf_counter()
+            func(work_dir / f"passe_{i}")
+            durations.append(time.perf_counter() - start)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func(work_dir / "passe_memoire")
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            "duree_s": round(statistics.median(durations), 4),
+            "duree_min_s": round(min(durations), 4),
+            "pic_tracemalloc_mo": round(peak / 1e6, 1),
+            "pic_rss_mo": round(_max_rss_mb(), 1),
+        }
+
+    def run(self, names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Mesure les étapes demandées (toutes par défaut).
+
+        Args:
+            names: noms des étapes (cf. `stages`)
+
+        Returns:
+            Entrée d'historique : révision, environnement, jeu et mesures
+        """
+        if not self.dataset:
+            self.prepare()
+        stages = self.stages()
+        results = {}
+        with tempfile.TemporaryDirectory(prefix="benchmark_") as tmp:
+            for name in names or list(stages):
+                logger.info(f"Étape {name} ({self.repeat} passes + mémoire)")
+                results[name] = self.measure(stages[name], Path(tmp) / name)
+                logger.info(f"Étape {name} : {results[name]}")
+        return {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "revision": code_revision(),
+            "environnement": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "pandas": pd.__version__,
+                "machine": platform.machine(),
+            },
+            "jeu": {
+                "poi_path": str(self.poi_path),
+                "arrets": self.dataset["arrets"],
+                "poi": self.dataset["poi"],
+                "paires": self.dataset["paires"],
+                "itineraires": len(self.dataset["records"]),
+                "rayon_m": self.max_distance,
+            },
+            "repetitions": self.repeat,
+            "etapes": results,
+        }
+
+    @staticmethod
+    def same_dataset(entry: Dict[str, Any], other: Dict[str, Any]) -> bool:
+        """Deux mesures portent-elles sur le même jeu (comparables) ?"""
+        keys = ["arrets", "poi", "paires", "itineraires", "rayon_m"]
+        return all(entry["jeu"].get(k) == other["jeu"].get(k) for k in keys)
+
+    @staticmethod
+    def append_history(entry: Dict[str, Any], path: Path) -> Optional[Dict[str, Any]]:
+        """
+        Ajoute une mesure à l'historique.
+
+        Args:
+            entry: mesure (cf. `run`)
+            path: fichier JSONL de l'historique
+
+        Returns:
+            Mesure précédente sur le même jeu, ou None
+        """
+        path = Path(path)
+        previous = None
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        past = json.loads(line)
+                        if BenchmarkSuite.same_dataset(entry, past):
+                            previous = past
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return previous
+
+    @staticmethod
+    def compare(
+        entry: Dict[str, Any],
+        previous: Optional[Dict[str, Any]],
+        threshold_pct: float = BENCHMARK_REGRESSION_PCT,
+    ) -> List[str]:
+        """
+        Affiche les mesures, comparées à la mesure précédente le cas échéant.
+
+        Args:
+            entry: mesure courante
+            previous: mesure précédente sur le même jeu (ou None)
+            threshold_pct: hausse de durée (%) signalée comme régression
+
+        Returns:
+            Noms des étapes en régression
+        """
+        reference = f" (référence : {previous['revision']})" if previous else ""
+        print(f"\nRévision {entry['revision']}{reference}")
+        print(
+            f"{'étape':<20} {'durée (s)':>10} {'précédente':>11} {'écart':>8} "
+            f"{'tracemalloc (Mo)':>17}"
+        )
+        regressions = []
+        for name, stage in entry["etapes"].items():
+            duration = stage["duree_s"]
+            before = ((previous or {}).get("etapes") or {}).get(name)
+            line = f"{name:<20} {duration:>10.3f}"
+            if before:
+                delta = duration - before["duree_s"]
+                pct = 100.0 * delta / before["duree_s"] if before["duree_s"] else 0.0
+                line += f" {before['duree_s']:>11.3f} {pct:>+7.1f}%"
+                if pct > threshold_pct and delta > BENCHMARK_NOISE_FLOOR_S:
+                    regressions.append(name)
+            else:
+                line += f" {'-':>11} {'-':>8}"
+            line += f" {stage['pic_tracemalloc_mo']:>17.1f}"
+            print(line + ("  ⚠ régression" if name in regressions else ""))
+        return regressions
+
+
+def main():
+    """Point d'entrée du banc d'essai."""
+    parser = argparse.ArgumentParser(
+        description="Mesure durée et mémoire des étapes critiques du pipeline"
+    )
+    parser.add_argument(
+        "--scale",
+        choices=list(SYNTHETIC_SCALES),
+        default="departement",
+        help="Échelle du jeu synthétique (défaut: departement)",
+    )
+    parser.add_argument(
+        "--communes",
+        type=int,
+        default=None,
+        help="Nombre de communes du jeu synthétique (remplace --scale)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Graine du jeu synthétique (défaut: 0)"
+    )
+    parser.add_argument(
+        "--poi", default=None, help="Mesure sur ce fichier de POI (avec --arrets)"
+    )
+    parser.add_argument(
+        "--arrets", default=None, help="Mesure sur ce fichier d'arrêts (avec --poi)"
+    )
+    parser.add_argument(
+        "--routes",
+        type=int,
+        default=BENCHMARK_MAX_ROUTES,
+        help=f"Itinéraires routés et exportés par étape (défaut: {BENCHMARK_MAX_ROUTES})",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=BENCHMARK_REPEAT,
+        help=f"Mesures de durée par étape (défaut: {BENCHMARK_REPEAT})",
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        default=None,
+        help="Étapes mesurées (défaut: toutes)",
+    )
+    parser.add_argument(
+        "--history",
+        default=str(BENCHMARK_DIR / BENCHMARK_HISTORY_FILENAME),
+        help="Historique JSONL des mesures (défaut: data/benchmarks/historique.jsonl)",
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help=f"Code de sortie 1 si une étape ralentit de plus de {BENCHMARK_REGRESSION_PCT:g} %%",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Affiche les logs du pipeline"
+    )
+    args = parser.parse_args()
+    if bool(args.poi) != bool(args.arrets):
+        parser.error("--poi et --arrets s'utilisent ensemble")
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    logger.setLevel(logging.INFO)
+
+    if args.poi:
+        poi_path, arrets_path = Path(args.poi), Path(args.arrets)
+    else:
+        poi_path, arrets_path = synthetic_dataset(
+            args.communes or SYNTHETIC_SCALES[args.scale], args.seed
+        )
+
+    suite = BenchmarkSuite(poi_path, arrets_path, args.routes, args.repeat)
+    if args.stages:
+        unknown = set(args.stages) - set(suite.stages())
+        if unknown:
+            parser.error(f"Étapes inconnues : {', '.join(sorted(unknown))}")
+    entry = suite.run(args.stages)
+    previous = BenchmarkSuite.append_history(entry, Path(args.history))
+    regressions = BenchmarkSuite.compare(entry, previous)
+    print(f"\n✓ Mesures ajoutées à {args.history}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
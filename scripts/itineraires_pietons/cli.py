@@ -4,11 +4,37 @@ Point d'entrée CLI pour la génération d'itinéraires piétons.
 
 import argparse
 import logging
+import os
 import sys
 from pathlib import Path
 
 from .orchestrator import ItineraryOrchestrator
-from .config import DEFAULT_POI_PATH, DEFAULT_ARRETS_PATH, OUTPUT_DIR, MAX_DISTANCE
+from .sharding import run_sharded
+from .vector_tiles import VectorTileBuilder
+from .config import (
+    DEFAULT_POI_PATH,
+    DEFAULT_ARRETS_PATH,
+    OUTPUT_DIR,
+    MAX_DISTANCE,
+    STOP_AREA_RADIUS,
+    VALHALLA_CONCURRENCY,
+    VALHALLA_RATE_LIMIT,
+    BATCH_GEOMETRY_MAX_MINUTES,
+    ROUTE_CACHE_PATH,
+    INDEX_DIR,
+    OUTPUT_FORMATS,
+    ROUTERS,
+    DEFAULT_ROUTER,
+    ROUTING_PROFILES,
+    DEFAULT_ROUTING_PROFILE,
+    LOCAL_GRAPH_PATH,
+    DEFAULT_OUTPUT_FORMAT,
+    SIMPLIFY_TOLERANCE_M,
+    SIMPLIFY_MAX_LENGTH_ERROR,
+    SHARD_KEYS,
+    DEFAULT_SHARD_KEY,
+    VECTOR_TILES_FILENAME,
+)
 
 
 def setup_logging(verbose: bool = False):
@@ -21,6 +47,29 @@ def setup_logging(verbose: bool = False):
     )
 
 
+def build_vector_tiles(output_folder: Path, routing_profiles: list):
+    """
+    Découpe les itinéraires générés en tuiles vectorielles (MBTiles).
+
+    Args:
+        output_folder: dossier de sortie de la génération
+        routing_profiles: profils générés (un sous-dossier par profil s'il y
+            en a plusieurs, donc une pyramide par profil)
+    """
+    folders = (
+        [output_folder / name for name in routing_profiles]
+        if len(routing_profiles) > 1
+        else [output_folder]
+    )
+    builder = VectorTileBuilder(workers=os.cpu_count())
+    for folder in folders:
+        stats = builder.build(folder)
+        print(
+            f"✓ {stats['tuiles']} tuiles vectorielles "
+            f"({stats['octets'] / 1e6:.2f} Mo) dans {folder}"
+        )
+
+
 def main():
     """Point d'entrée principal du CLI."""
     parser = argparse.ArgumentParser(
@@ -48,11 +97,57 @@ def main():
         help=f"Dossier de sortie pour les GeoJSON (défaut: {OUTPUT_DIR})",
     )
 
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=OUTPUT_FORMATS,
+        default=DEFAULT_OUTPUT_FORMAT,
+        help="Format de sortie : un GeoJSON par itinéraire (geojson), "
+        "un fichier NDJSON unique (ndjson), un jeu GeoParquet (parquet) ou un "
+        "stockage géométrique colonnaire mappable en mémoire (geostore) "
+        f"(défaut: {DEFAULT_OUTPUT_FORMAT})",
+    )
+
+    parser.add_argument(
+        "--simplify",
+        type=float,
+        nargs="?",
+        const=SIMPLIFY_TOLERANCE_M,
+        default=None,
+        metavar="METRES",
+        help="Simplifie les tracés exportés (Douglas-Peucker) avec cette tolérance en mètres "
+        f"(défaut si la valeur est omise: {SIMPLIFY_TOLERANCE_M}) ; la longueur reste à "
+        f"moins de {SIMPLIFY_MAX_LENGTH_ERROR * 100:g} %% de distance_reelle",
+    )
+
+    parser.add_argument(
+        "--precision",
+        type=int,
+        default=None,
+        help="Nombre de décimales des coordonnées exportées (ex: 5 ~ 1 m ; défaut: inchangé)",
+    )
+
+    parser.add_argument(
+        "--polyline",
+        action="store_true",
+        help='Exporte les tracés en polyline encodée (propriété "polyline", précision 1e-6) '
+        "au lieu de coordonnées GeoJSON (formats geojson et ndjson)",
+    )
+
+    parser.add_argument(
+        "--compact-json",
+        action="store_true",
+        help="Écrit les fichiers GeoJSON sans indentation",
+    )
+
     parser.add_argument(
         "--distance",
         type=float,
-        default=MAX_DISTANCE,
-        help=f"Rayon de recherche en mètres (défaut: {MAX_DISTANCE})",
+        nargs="+",
+        default=[MAX_DISTANCE],
+        help=f"Rayon de recherche en mètres (défaut: {MAX_DISTANCE}) ; avec plusieurs "
+        "rayons (ex: 300 500 800), une seule recherche au plus grand et chaque "
+        'itinéraire porte la propriété "rayon" (plus petit rayon qui le contient)',
     )
 
     parser.add_argument(
@@ -70,6 +165,101 @@ def main():
         help="Filtrer par code(s) INSEE de commune(s) (ex: 75056 pour Paris, 92050 pour Nanterre)",
     )
 
+    parser.add_argument(
+        "--max-per-type",
+        type=int,
+        default=None,
+        metavar="K",
+        help="Ne garde, pour chaque arrêt, que les K POI les plus proches de chaque "
+        "type_lieu dans le rayon (défaut: tous les POI du rayon)",
+    )
+
+    parser.add_argument(
+        "--cluster-stops",
+        action="store_true",
+        help="Regroupe les arrêts d'une même gare (proches et de même nom) : "
+        "un seul itinéraire par zone d'arrêt et par POI",
+    )
+
+    parser.add_argument(
+        "--cluster-radius",
+        type=float,
+        default=STOP_AREA_RADIUS,
+        help=f"Distance maximale entre arrêts d'une même zone en mètres (défaut: {STOP_AREA_RADIUS})",
+    )
+
+    parser.add_argument(
+        "--isochrone-minutes",
+        type=float,
+        default=None,
+        help="Budget de marche en minutes : une isochrone par arrêt (ou zone d'arrêt), "
+        "seuls les POI qu'elle contient sont routés",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reprend une génération interrompue (ignore les paires déjà générées, retente les échecs)",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Ne recalcule que les paires dont l'arrêt ou le POI a changé depuis la "
+        "génération précédente du dossier de sortie, et supprime les sorties obsolètes",
+    )
+
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="Génération répartie en N shards d'arrêts de volumes équilibrés, fusionnés "
+        "à la fin ; relancer la commande sur d'autres nœuds partageant le dossier de "
+        "sortie les fait participer",
+    )
+
+    parser.add_argument(
+        "--shard-by",
+        type=str,
+        choices=list(SHARD_KEYS),
+        default=DEFAULT_SHARD_KEY,
+        help=f"Regroupement des arrêts en shards (défaut: {DEFAULT_SHARD_KEY})",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Avec --shards, nombre de processus de ce nœud (défaut: nombre de cœurs)",
+    )
+
+    parser.add_argument(
+        "--router",
+        type=str,
+        choices=ROUTERS,
+        default=DEFAULT_ROUTER,
+        help="Moteur de routing : serveur Valhalla ou routeur piéton local hors ligne "
+        f"(défaut: {DEFAULT_ROUTER})",
+    )
+
+    parser.add_argument(
+        "--graph",
+        type=str,
+        default=str(LOCAL_GRAPH_PATH),
+        help=f"Graphe piéton .npz du routeur local (défaut: {LOCAL_GRAPH_PATH})",
+    )
+
+    parser.add_argument(
+        "--routing-profiles",
+        type=str,
+        nargs="+",
+        choices=list(ROUTING_PROFILES),
+        default=[DEFAULT_ROUTING_PROFILE],
+        help="Profils de routing : chaque itinéraire est calculé une fois par profil, "
+        "dans un sous-dossier par profil s'il y en a plusieurs "
+        f"(défaut: {DEFAULT_ROUTING_PROFILE})",
+    )
+
     parser.add_argument(
         "--valhalla-url",
         type=str,
@@ -77,6 +267,86 @@ def main():
         help="URL du serveur Valhalla (optionnel)",
     )
 
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=VALHALLA_CONCURRENCY,
+        help=f"Nombre maximal de requêtes Valhalla simultanées (défaut: {VALHALLA_CONCURRENCY})",
+    )
+
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=VALHALLA_RATE_LIMIT,
+        help="Nombre maximal de requêtes Valhalla par seconde (défaut: illimité)",
+    )
+
+    parser.add_argument(
+        "--batch-matrix",
+        action="store_true",
+        help="Groupe les paires par arrêt : une matrice distances/durées par arrêt, "
+        "tracé complet seulement pour les POI proches",
+    )
+
+    parser.add_argument(
+        "--geometry-max-minutes",
+        type=float,
+        default=BATCH_GEOMETRY_MAX_MINUTES,
+        help="En mode --batch-matrix, temps de marche au-delà duquel le tracé "
+        f"n'est pas calculé (défaut: {BATCH_GEOMETRY_MAX_MINUTES} min)",
+    )
+
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default=str(ROUTE_CACHE_PATH),
+        help=f"Fichier SQLite du cache d'itinéraires (défaut: {ROUTE_CACHE_PATH})",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Désactive le cache persistant des itinéraires",
+    )
+
+    parser.add_argument(
+        "--index-dir",
+        type=str,
+        default=str(INDEX_DIR),
+        help=f"Dossier de l'index préparé POI/arrêts (défaut: {INDEX_DIR})",
+    )
+
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Recharge les sources sans utiliser l'index préparé",
+    )
+
+    parser.add_argument(
+        "--poi-parquet-cache",
+        action="store_true",
+        help="Convertit une fois le CSV des POI en parquet partitionné par type et lit cette copie",
+    )
+
+    parser.add_argument(
+        "--vector-tiles",
+        action="store_true",
+        help=f"Découpe ensuite les itinéraires en tuiles vectorielles ({VECTOR_TILES_FILENAME} dans le dossier de sortie)",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile chaque étape (cProfile + tracemalloc) ; profils .prof écrits dans le dossier de sortie",
+    )
+
+    parser.add_argument(
+        "--prometheus",
+        type=str,
+        default=None,
+        help="Écrit aussi les métriques de l'exécution au format texte Prometheus dans ce fichier",
+    )
+
     parser.add_argument(
         "-v",
         "--verbose",
@@ -85,24 +355,84 @@ def main():
     )
 
     args = parser.parse_args()
+    if args.polyline and args.format not in ("geojson", "ndjson"):
+        parser.error(
+            "--polyline n'est disponible que pour les formats geojson et ndjson"
+        )
+    if args.shards and (args.incremental or args.prometheus):
+        parser.error("--shards ne se combine pas avec --incremental ni --prometheus")
+    if args.shards and len(args.routing_profiles) > 1:
+        parser.error("--shards ne se combine pas avec plusieurs --routing-profiles")
+    radii = args.distance if len(args.distance) > 1 else None
 
     # Configuration du logging
     setup_logging(args.verbose)
 
-    # Création de l'orchestrateur
-    orchestrator = ItineraryOrchestrator(valhalla_url=args.valhalla_url)
+    # Options de l'orchestrateur (transmises aux processus en mode réparti)
+    orchestrator_options = dict(
+        valhalla_url=args.valhalla_url,
+        concurrency=args.concurrency,
+        rate_limit=args.rate_limit,
+        cache_path=None if args.no_cache else Path(args.cache),
+        index_dir=None if args.no_index else Path(args.index_dir),
+        poi_parquet_cache=args.poi_parquet_cache,
+        router=args.router,
+        graph_path=Path(args.graph),
+        batch_matrix=args.batch_matrix,
+        geometry_max_minutes=args.geometry_max_minutes,
+        cluster_stops=args.cluster_stops,
+        stop_area_radius=args.cluster_radius,
+        isochrone_minutes=args.isochrone_minutes,
+        simplify_tolerance=args.simplify,
+        coordinate_precision=args.precision,
+        polyline=args.polyline,
+        compact_json=args.compact_json,
+        profile=args.profile,
+        prometheus_path=Path(args.prometheus) if args.prometheus else None,
+    )
 
     # Génération des itinéraires
     try:
+        if args.shards:
+            count = run_sharded(
+                orchestrator_options,
+                output_folder=Path(args.output),
+                n_shards=args.shards,
+                shard_by=args.shard_by,
+                workers=args.workers,
+                poi_path=args.poi,
+                arrets_path=args.arrets,
+                max_distance=max(args.distance),
+                limit=args.limit,
+                communes=args.communes,
+                output_format=args.format,
+                max_per_type=args.max_per_type,
+                radii=radii,
+                routing_profiles=args.routing_profiles,
+            )
+            print(f"\n✓ {count} itinéraires générés avec succès")
+            if args.vector_tiles:
+                build_vector_tiles(Path(args.output), args.routing_profiles)
+            return 0
+
+        orchestrator = ItineraryOrchestrator(**orchestrator_options)
         count = orchestrator.generate_itineraries(
             poi_path=args.poi,
             arrets_path=args.arrets,
             output_folder=Path(args.output),
-            max_distance=args.distance,
+            max_distance=max(args.distance),
             limit=args.limit,
             communes=args.communes,
+            resume=args.resume,
+            output_format=args.format,
+            incremental=args.incremental,
+            max_per_type=args.max_per_type,
+            radii=radii,
+            routing_profiles=args.routing_profiles,
         )
         print(f"\n✓ {count} itinéraires générés avec succès")
+        if args.vector_tiles:
+            build_vector_tiles(Path(args.output), args.routing_profiles)
         return 0
     except Exception as e:
         logging.error(f"Erreur fatale: {e}", exc_info=True)
@@ -9,6 +9,7 @@ from pathlib import Path
 PACKAGE_DIR = Path(__file__).resolve().parent
 DATA_DIR = PACKAGE_DIR / "data"
 OUTPUT_DIR = DATA_DIR / "output"
+CACHE_DIR = DATA_DIR / "cache"
 
 # Fichiers d'entrée
 POI_TYPES_FILE = DATA_DIR / "poi_types_relevant.txt"
@@ -17,6 +18,12 @@ DEFAULT_ARRETS_PATH = DATA_DIR / "referentiel_arret_derniere_version.parquet"
 
 # Colonnes attendues
 POI_COLUMNS = ["id", "nom_poi", "type_lieu", "source", "poi_lat", "poi_lon"]
+POI_DTYPES = {
+    "type_lieu": "category",
+    "source": "category",
+    "poi_lat": "float32",
+    "poi_lon": "float32",
+}
 ARRETS_COLUMNS = [
     "ArRId",
     "ArRName",
@@ -35,11 +42,193 @@ TYPES_ARRETS = ["rail", "metro", "tram"]
 # Paramètres spatiaux
 MAX_DISTANCE = 500  # mètres
 EARTH_RADIUS_M = 6371000.0  # rayon de la Terre en mètres
+# Latitude de référence de la projection équirectangulaire locale (Île-de-France)
+PROJECTION_REF_LAT = 48.85
+PAIR_SEARCH_CHUNK_SIZE = 1024  # arrêts par bloc lors de la recherche des paires
+# Test point-dans-polygone : produit points x segments max par bloc
+POINT_IN_POLYGON_CHUNK_SIZE = 2_000_000
+
+# Zones d'arrêt : arrêts d'une même gare routés une seule fois
+STOP_AREA_RADIUS = 150  # mètres entre deux arrêts d'une même zone
+# Mots ignorés lors de la comparaison des noms ("Gare de Trappes" = "Trappes")
+STOP_NAME_STOPWORDS = {
+    "gare",
+    "station",
+    "de",
+    "du",
+    "des",
+    "d",
+    "l",
+    "le",
+    "la",
+    "les",
+}
+# Un nom prolongeant l'autre ne correspond que sur au moins autant de mots
+# ("saint" ne suffit pas à rapprocher "Saint-Denis" et "Saint-Ouen")
+STOP_NAME_MIN_PREFIX_WORDS = 2
+STOP_AREAS_FILENAME = "zones_arrets.csv"
+
+# Formats de sortie
+OUTPUT_FORMATS = ["geojson", "ndjson", "parquet", "geostore"]
+DEFAULT_OUTPUT_FORMAT = "geojson"  # un fichier GeoJSON par itinéraire (historique)
+NDJSON_FILENAME = "itineraires.ndjson"
+PARQUET_DATASET_DIR = "itineraires_parquet"
+PARQUET_ROW_GROUP_SIZE = 10_000  # lignes par row group
+PARQUET_PART_ROWS = 100_000  # lignes par fichier avant rotation
+# Stockage géométrique : coordonnées quantifiées en int32 (1e-7 degré ~ 1 cm)
+GEOSTORE_DIR = "itineraires_geostore"
+GEOSTORE_SCALE = 10_000_000
+# Réduction des géométries à l'export (--simplify / --precision / --polyline)
+SIMPLIFY_TOLERANCE_M = 1.0  # tolérance de Douglas-Peucker par défaut (m)
+SIMPLIFY_MAX_LENGTH_ERROR = 0.01  # écart de longueur max / distance_reelle
+POLYLINE_PRECISION = 6  # décimales des polylines (format "polyline6" de Valhalla)
+
+# Agrégation des sorties (unify_geojsons)
+UNIFY_FILES_PER_TASK = 64  # fichiers lus par tâche d'un processus
+UNIFY_TASK_BYTES = 16 * 1024**2  # volume max par tâche (NDJSON découpés)
+# Volume d'entrée par partition de dédoublonnage (borne la mémoire)
+UNIFY_PARTITION_BYTES = 256 * 1024**2
+UNIFY_READ_CHUNK = 1024**2  # lecture en flux d'un FeatureCollection (caractères)
+
+# Tuiles vectorielles (MBTiles) des itinéraires pour l'affichage cartographique
+VECTOR_TILES_FILENAME = "itineraires.mbtiles"
+VECTOR_TILES_LAYER = "itineraires"
+VECTOR_TILES_MIN_ZOOM = 11
+VECTOR_TILES_MAX_ZOOM = 16
+VECTOR_TILE_EXTENT = 4096  # unités de coordonnées par côté de tuile
+VECTOR_TILE_BUFFER = 64  # marge (unités de tuile) conservée autour de chaque tuile
+# Tolérance de simplification en unités de tuile (16 unités = 1 pixel de 256)
+VECTOR_TILE_TOLERANCE = 8.0
+VECTOR_TILE_MAX_BYTES = 500 * 1024  # tuile signalée au-delà (compressée)
+VECTOR_TILES_PER_TASK = 256  # tuiles encodées par tâche d'un processus
+# Propriétés des itinéraires conservées dans les tuiles (si présentes)
+VECTOR_TILE_PROPERTIES = [
+    "arret_id",
+    "arret_nom",
+    "poi_id",
+    "poi_nom",
+    "poi_type",
+    "distance_reelle",
+    "duree_marche",
+    "code_insee",
+    "rayon",
+]
+
+# Données synthétiques (cf. synthetic_data) : échelles en nombre de communes
+SYNTHETIC_SCALES = {
+    "commune": 1,
+    "epci": 12,
+    "departement": 160,
+    "idf": 1268,
+    "idf10": 12680,  # 10 fois l'Île-de-France, à densité égale
+}
+ALL_POI_TYPES_FILE = DATA_DIR / "all_poi_types.txt"  # par fréquence décroissante
+SYNTHETIC_CENTER = (2.35, 48.85)  # (lon, lat) du centre de la région générée
+SYNTHETIC_COMMUNE_AREA_KM2 = 9.5  # surface moyenne d'une commune francilienne
+SYNTHETIC_STOPS_PER_COMMUNE = 40  # arrêts (quais) par commune en moyenne
+SYNTHETIC_POI_PER_COMMUNE = 600  # POI (tous types) par commune en moyenne
+# Part des arrêts par type (les lignes de bus dominent, cf. TYPES_ARRETS)
+SYNTHETIC_STOP_TYPES = {"bus": 0.82, "rail": 0.06, "metro": 0.07, "tram": 0.05}
+SYNTHETIC_COMMUNES_PER_EPCI = 12
+SYNTHETIC_COMMUNES_PER_DEPARTEMENT = 160
+SYNTHETIC_DUPLICATE_POI_SHARE = 0.01  # doublons exacts (supprimés au chargement)
+SYNTHETIC_POI_BATCH_SIZE = 1_000_000  # POI générés et écrits par lot
+
+# Banc d'essai des étapes critiques (cf. benchmark)
+BENCHMARK_DIR = DATA_DIR / "benchmarks"
+BENCHMARK_HISTORY_FILENAME = "historique.jsonl"
+BENCHMARK_REPEAT = 3  # mesures de durée par étape (médiane retenue)
+BENCHMARK_MAX_ROUTES = 5000  # itinéraires routés et exportés par étape
+BENCHMARK_REGRESSION_PCT = 10.0  # hausse de durée signalée comme régression
+BENCHMARK_NOISE_FLOOR_S = 0.05  # écarts de durée ignorés en deçà (bruit)
+
+# Exécution répartie par shards (--shards)
+SHARD_KEYS = {"commune": "INSEE_COM", "epci": "nom_epci"}
+DEFAULT_SHARD_KEY = "commune"
+SHARD_PLAN_FILENAME = "plan_shards.json"
+SHARDS_DIR = "shards"  # sous-dossier des sorties par shard
+SHARD_HEARTBEAT_SECONDS = 30  # rafraîchissement de la réservation d'un shard
+SHARD_CLAIM_STALE_SECONDS = 600  # réservation abandonnée au-delà (nœud arrêté)
+
+# Journal d'exécution (reprise après interruption)
+MANIFEST_FILENAME = "manifest.jsonl"
+# Empreintes des arrêts et POI de la dernière génération (mode incrémental)
+INPUT_SNAPSHOT_FILENAME = "empreintes_entrees.parquet"
+
+# Service de requêtes sur les itinéraires générés
+QUERY_SERVICE_HOST = "127.0.0.1"
+QUERY_SERVICE_PORT = 8080
+QUERY_STREAM_BATCH_SIZE = 500  # Features par fragment transmis
+
+# Rapport d'exécution (durées par étape, latences, erreurs)
+RUN_REPORT_FILENAME = "rapport_execution.json"
+PROMETHEUS_PREFIX = "itineraires_pietons"
+# Bornes (s) de l'histogramme Prometheus des latences de routing
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# Classes logarithmiques des percentiles de latence (mémoire fixe) : de 0,1 ms
+# à 1000 s, 50 classes par décade (erreur relative < 5 %)
+LATENCY_HISTOGRAM_RANGE_S = (1e-4, 1e3)
+LATENCY_HISTOGRAM_BINS_PER_DECADE = 50
 
 # Paramètres Valhalla
 VALHALLA_PROFILE = "pedestrian"
+# Profils de routing (--routing-profiles) : options du coût "pedestrian" de
+# Valhalla ; le cache les distingue ("pedestrian_wheelchair")
+ROUTING_PROFILES = {
+    "pedestrian": {},
+    "wheelchair": {"type": "wheelchair"},
+}
+DEFAULT_ROUTING_PROFILE = "pedestrian"
 VALHALLA_FORMAT = "geojson"
 VALHALLA_RETRY_OVER_LIMIT = True
+VALHALLA_CONCURRENCY = 1  # requêtes simultanées max (1 = séquentiel)
+VALHALLA_RATE_LIMIT = None  # requêtes/s max (None = pas de limite)
+VALHALLA_MATRIX_MAX_TARGETS = 100  # destinations max par requête matrice
+# Isochrones : 0 conserve tous les contours (îlots atteignables compris)
+VALHALLA_ISOCHRONE_DENOISE = 0.0
+
+# Serveur Valhalla factice pour les tests de charge hors ligne (cf. stub_valhalla)
+STUB_VALHALLA_HOST = "127.0.0.1"
+STUB_VALHALLA_PORT = 8002  # port par défaut de Valhalla
+STUB_VALHALLA_LATENCY_MS = 20.0  # latence moyenne simulée par requête
+STUB_VALHALLA_LATENCIES = ["constante", "uniforme", "exponentielle", "lognormale"]
+STUB_VALHALLA_LOGNORMAL_SIGMA = 0.8  # dispersion de la latence log-normale
+STUB_VALHALLA_GEOMETRIES = ["ligne", "grille"]
+STUB_VALHALLA_GRID_STEP_M = 80.0  # côté des îlots de la géométrie en grille
+STUB_VALHALLA_POINT_SPACING_M = 15.0  # espacement des points d'un tracé
+# Banc de charge du routing de bout en bout (cf. routing_harness)
+ROUTING_HARNESS_CONCURRENCY = [1, 4, 16]
+ROUTING_HARNESS_ROUTES = 2000
+
+# Mode groupé par arrêt : matrice une-origine/plusieurs-destinations, puis
+# géométrie complète seulement pour les POI sous ce temps de marche
+BATCH_GEOMETRY_MAX_MINUTES = 10.0
+
+# Copie parquet des POI partitionnée par type_lieu
+POI_PARQUET_CACHE_DIR = CACHE_DIR / "poi_parquet"
+
+# Index préparé des POI/arrêts (fichiers mappés en mémoire)
+INDEX_DIR = CACHE_DIR / "index"
+
+# Moteurs de routing disponibles
+ROUTERS = ["valhalla", "local"]
+DEFAULT_ROUTER = "valhalla"
+
+# Routeur piéton local (hors ligne)
+LOCAL_GRAPH_PATH = DATA_DIR / "reseau_pieton.npz"
+LOCAL_PROFILE_PREFIX = "local_"  # distingue ses résultats dans le cache
+# Vitesse de marche par profil (km/h, valeurs par défaut de Valhalla)
+LOCAL_WALKING_SPEEDS_KMH = {"pedestrian": 5.1, "wheelchair": 4.0}
+LOCAL_MAX_DETOUR = 3.0  # longueur max d'un itinéraire / distance à vol d'oiseau
+LOCAL_MIN_SEARCH_RADIUS = 250.0  # rayon de recherche minimal (m)
+
+# Cache persistant des itinéraires
+ROUTE_CACHE_PATH = CACHE_DIR / "routes.sqlite"
+ROUTE_CACHE_PRECISION = 6  # décimales conservées dans la clé (~0,1 m)
+ROUTE_CACHE_MAX_AGE_DAYS = 90  # éviction des entrées plus anciennes
+ROUTE_CACHE_MAX_ENTRIES = 2_000_000  # éviction des plus anciennes au-delà
+# Attente max (s) du verrou d'écriture SQLite (cache partagé entre processus)
+ROUTE_CACHE_BUSY_TIMEOUT = 60.0
 
 
 def load_poi_types():
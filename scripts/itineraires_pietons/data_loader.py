@@ -2,40 +2,131 @@
 Services de chargement et préparation des données (Data Layer).
 """
 
+import json
 import logging
+import os
+import shutil
+import time
 import pandas as pd
-from typing import Tuple
+from pathlib import Path
+from typing import Optional, Set, Tuple
 
 from .config import (
     POI_COLUMNS,
+    POI_DTYPES,
     ARRETS_COLUMNS,
     POI_TYPES,
     TYPES_ARRETS,
     DEFAULT_POI_PATH,
     DEFAULT_ARRETS_PATH,
+    POI_PARQUET_CACHE_DIR,
 )
+from .run_metrics import _max_rss_mb, measure_stage
 
 logger = logging.getLogger(__name__)
 
 
+def _log_load(what: str, df: pd.DataFrame, start: float):
+    """Trace la durée de chargement et l'empreinte mémoire d'un DataFrame."""
+    elapsed = time.perf_counter() - start
+    size_mb = df.memory_usage(deep=True).sum() / 1e6
+    rss_mb = _max_rss_mb()
+    logger.info(
+        f"{what} chargés en {elapsed:.2f}s "
+        f"({size_mb:.1f} Mo en mémoire, pic RSS du processus {rss_mb:.0f} Mo)"
+    )
+
+
 class DataLoader:
     """Chargeur de données pour les POI et arrêts."""
 
     @staticmethod
+    @measure_stage("conversion_poi_parquet")
+    def convert_poi_to_parquet(
+        csv_path: str, dataset_dir: Path = POI_PARQUET_CACHE_DIR
+    ) -> Path:
+        """
+        Convertit le CSV des POI en jeu parquet partitionné par type_lieu.
+
+        La lecture ultérieure ne parcourt alors que les partitions des types
+        pertinents. Le marqueur _SUCCESS enregistre l'identité du CSV source
+        (chemin, taille, date de modification) : la conversion est refaite,
+        anciennes partitions supprimées, dès que le CSV demandé diffère.
+
+        Args:
+            csv_path: chemin du fichier CSV des POI
+            dataset_dir: dossier du jeu parquet
+
+        Returns:
+            Chemin du jeu parquet
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        dataset_dir = Path(dataset_dir)
+        marker = dataset_dir / "_SUCCESS"
+        stat = os.stat(csv_path)
+        source = {
+            "source": str(Path(csv_path).resolve()),
+            "taille": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        if marker.exists():
+            try:
+                if json.loads(marker.read_text(encoding="utf-8")) == source:
+                    return dataset_dir
+            except json.JSONDecodeError:
+                pass
+
+        logger.info(f"Conversion de {csv_path} en parquet partitionné ({dataset_dir})")
+        # Partitions d'une autre source (ou d'une conversion interrompue)
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+        df_poi = pd.read_csv(
+            csv_path, usecols=POI_COLUMNS, engine="pyarrow", dtype=POI_DTYPES
+        )
+        df_poi.dropna(subset=["id", "type_lieu"], inplace=True)
+        table = pa.Table.from_pandas(df_poi, preserve_index=False)
+        ds.write_dataset(
+            table,
+            dataset_dir,
+            format="parquet",
+            partitioning=["type_lieu"],
+            partitioning_flavor="hive",
+            existing_data_behavior="delete_matching",
+        )
+        marker.write_text(json.dumps(source), encoding="utf-8")
+        return dataset_dir
+
+    @staticmethod
+    @measure_stage("chargement_poi")
     def load_poi(poi_path: str = None) -> pd.DataFrame:
         """
         Charge et nettoie les données POI.
 
+        Le CSV est lu avec le moteur pyarrow (types catégoriels et float32). Un
+        jeu parquet (fichier ou dossier, cf. `convert_poi_to_parquet`) est lu en
+        ne retenant que les types pertinents dès la lecture.
+
         Args:
-            poi_path: chemin vers le fichier CSV des POI (optionnel)
+            poi_path: chemin vers le fichier CSV ou le jeu parquet des POI (optionnel)
 
         Returns:
             DataFrame des POI nettoyés et filtrés
         """
         path = poi_path or str(DEFAULT_POI_PATH)
         logger.info(f"Chargement des POIs depuis {path}")
-
-        df_poi = pd.read_csv(path, usecols=POI_COLUMNS)
+        start = time.perf_counter()
+
+        if Path(path).is_dir() or str(path).endswith(".parquet"):
+            df_poi = pd.read_parquet(
+                path,
+                columns=POI_COLUMNS,
+                filters=[("type_lieu", "in", POI_TYPES)],
+            ).astype(POI_DTYPES)
+        else:
+            df_poi = pd.read_csv(
+                path, usecols=POI_COLUMNS, engine="pyarrow", dtype=POI_DTYPES
+            )
         df_poi.dropna(subset=["id"], inplace=True)
 
         # Suppression des doublons exacts
@@ -47,35 +138,95 @@ class DataLoader:
 
         # Filtrage par types pertinents
         df_poi = df_poi[df_poi["type_lieu"].isin(POI_TYPES)]
+        df_poi["type_lieu"] = df_poi["type_lieu"].cat.remove_unused_categories()
         logger.info(f"{len(df_poi)} POIs après filtrage par types pertinents")
 
+        _log_load("POIs", df_poi, start)
         return df_poi
 
     @staticmethod
-    def load_arrets(arrets_path: str = None) -> pd.DataFrame:
+    @measure_stage("chargement_arrets")
+    def load_arrets(
+        arrets_path: str = None, communes: Optional[list] = None
+    ) -> pd.DataFrame:
         """
         Charge et filtre les données d'arrêts.
 
+        Les filtres sur le type d'arrêt et, le cas échéant, sur les communes sont
+        appliqués pendant la lecture du parquet (statistiques des row groups).
+
         Args:
             arrets_path: chemin vers le fichier parquet des arrêts (optionnel)
+            communes: liste de codes INSEE de communes à conserver (optionnel)
 
         Returns:
             DataFrame des arrêts filtrés
         """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
         path = arrets_path or str(DEFAULT_ARRETS_PATH)
         logger.info(f"Chargement des arrêts depuis {path}")
+        start = time.perf_counter()
+
+        filters = [("ArRType", "in", TYPES_ARRETS)]
+        if communes:
+            # Les codes sont convertis au type de la colonne INSEE_COM du fichier
+            insee_type = pq.read_schema(path).field("INSEE_COM").type
+            if pa.types.is_integer(insee_type):
+                values = [int(c) for c in communes]
+            else:
+                values = [str(c) for c in communes]
+            filters.append(("INSEE_COM", "in", values))
+
+        df_arrets = pd.read_parquet(path, columns=ARRETS_COLUMNS, filters=filters)
+        logger.info(f"{len(df_arrets)} arrêts après filtrage par type {TYPES_ARRETS}")
+        if communes:
+            logger.info(f"{len(df_arrets)} arrêts après filtrage par communes")
+
+        _log_load("Arrêts", df_arrets, start)
+        return df_arrets
 
-        df_arrets = pd.read_parquet(path, columns=ARRETS_COLUMNS)
+    @staticmethod
+    def load_stop_ids(arrets_path: str = None) -> Set[str]:
+        """
+        Identifiants de tous les arrêts de la source (filtre de type seul),
+        sans charger leurs attributs.
 
-        # Filtrage par types d'arrêts
-        df_arrets = df_arrets[df_arrets["ArRType"].isin(TYPES_ARRETS)]
-        logger.info(f"{len(df_arrets)} arrêts après filtrage par type {TYPES_ARRETS}")
+        Args:
+            arrets_path: chemin vers le fichier parquet des arrêts (optionnel)
 
+        Returns:
+            Ensemble des ArRId (texte)
+        """
+        path = arrets_path or str(DEFAULT_ARRETS_PATH)
+        df = pd.read_parquet(
+            path, columns=["ArRId"], filters=[("ArRType", "in", TYPES_ARRETS)]
+        )
+        return set(df["ArRId"].astype(str))
+
+    @staticmethod
+    def filter_communes(df_arrets: pd.DataFrame, communes: list) -> pd.DataFrame:
+        """
+        Filtre des arrêts déjà chargés par code(s) INSEE de commune.
+
+        Args:
+            df_arrets: DataFrame des arrêts
+            communes: liste de codes INSEE
+
+        Returns:
+            DataFrame des arrêts des communes demandées
+        """
+        communes_str = [str(c) for c in communes]
+        df_arrets = df_arrets[df_arrets["INSEE_COM"].astype(str).isin(communes_str)]
+        logger.info(f"{len(df_arrets)} arrêts après filtrage par communes")
         return df_arrets
 
     @staticmethod
     def load_data(
-        poi_path: str = None, arrets_path: str = None
+        poi_path: str = None,
+        arrets_path: str = None,
+        communes: Optional[list] = None,
     ) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
         Charge à la fois les POI et les arrêts.
@@ -83,10 +234,11 @@ class DataLoader:
         Args:
             poi_path: chemin vers le fichier CSV des POI
             arrets_path: chemin vers le fichier parquet des arrêts
+            communes: liste de codes INSEE de communes à conserver (optionnel)
 
         Returns:
             Tuple (DataFrame POI, DataFrame arrêts)
         """
         df_poi = DataLoader.load_poi(poi_path)
-        df_arrets = DataLoader.load_arrets(arrets_path)
+        df_arrets = DataLoader.load_arrets(arrets_path, communes)
         return df_poi, df_arrets
@@ -5,79 +5,172 @@ Service d'export des itinéraires en GeoJSON (Business Logic Layer).
 import json
 import logging
 from pathlib import Path
-from typing import Dict, Any
-import pandas as pd
-
-from .config import OUTPUT_DIR
+from typing import Dict, Any, Mapping, Optional, Set
+
+from .config import OUTPUT_DIR, DEFAULT_OUTPUT_FORMAT
+from .export_writers import (
+    CommitCallback,
+    FeatureWriter,
+    PairLocations,
+    GeoJSONFilesWriter,
+    NDJSONWriter,
+    ParquetWriter,
+    GeometryStoreWriter,
+)
+from .geometry_reduction import GeometryReducer
+from .run_metrics import get_run_metrics
 
 logger = logging.getLogger(__name__)
 
 
+WRITERS = {
+    "geojson": GeoJSONFilesWriter,
+    "ndjson": NDJSONWriter,
+    "parquet": ParquetWriter,
+    "geostore": GeometryStoreWriter,
+}
+
+
 class ExportService:
     """Service d'export des itinéraires calculés."""
 
+    @staticmethod
+    def create_writer(
+        output_format: str = DEFAULT_OUTPUT_FORMAT,
+        output_folder: Path = OUTPUT_DIR,
+        append: bool = False,
+        on_commit: Optional[CommitCallback] = None,
+        compact_json: bool = False,
+    ) -> FeatureWriter:
+        """
+        Crée l'écrivain de sortie correspondant au format demandé.
+
+        Args:
+            output_format: "geojson" (un fichier par itinéraire), "ndjson",
+                "parquet" ou "geostore"
+            output_folder: dossier de sortie
+            append: complète la sortie existante (reprise) au lieu de la remplacer
+            on_commit: fonction (arret_id, poi_id, emplacement) appelée pour
+                chaque Feature écrite durablement
+            compact_json: fichiers GeoJSON sans indentation (les autres formats
+                sont toujours compacts)
+
+        Returns:
+            Écrivain de Features
+        """
+        if output_format not in WRITERS:
+            raise ValueError(
+                f"Format de sortie inconnu : {output_format} "
+                f"(formats disponibles : {', '.join(WRITERS)})"
+            )
+        options = (
+            {"indent": None} if compact_json and output_format == "geojson" else {}
+        )
+        return WRITERS[output_format](
+            output_folder, append=append, on_commit=on_commit, **options
+        )
+
+    @staticmethod
+    def remove_outputs(
+        output_format: str,
+        output_folder: Path,
+        removed: PairLocations,
+        in_use: Optional[Set[str]] = None,
+    ) -> Dict[str, str]:
+        """
+        Supprime les Features de paires devenues obsolètes d'une sortie existante.
+
+        Args:
+            output_format: format de la sortie existante
+            output_folder: dossier de sortie
+            removed: paires à supprimer et emplacement de leur Feature
+            in_use: emplacements encore référencés par des paires conservées
+
+        Returns:
+            Nouveaux emplacements des Features déplacées (ancien -> nouveau)
+        """
+        if not removed:
+            return {}
+        return WRITERS[output_format].remove_features(output_folder, removed, in_use)
+
     @staticmethod
     def create_geojson_feature(
-        route_obj, arret: pd.Series, poi: pd.Series, distance: float
+        route_obj, pair: Mapping[str, Any], reducer: Optional[GeometryReducer] = None
     ) -> Dict[str, Any]:
         """
         Crée une Feature GeoJSON à partir d'un itinéraire calculé.
 
         Args:
             route_obj: objet route retourné par Valhalla
-            arret: Series pandas de l'arrêt
-            poi: Series pandas du POI
-            distance: distance à vol d'oiseau (m)
+            pair: enregistrement de la table des paires (colonnes arrêt + POI
+                + "distance" à vol d'oiseau en mètres, et "rayon" si plusieurs
+                rayons sont comparés)
+            reducer: réduction du tracé (simplification, arrondi, polyline) ;
+                None = tracé de Valhalla inchangé
 
         Returns:
             Dictionnaire représentant une Feature GeoJSON
         """
-        geometry = {"type": "LineString", "coordinates": route_obj.geometry}
-
-        distance_reelle = getattr(route_obj, "distance", 0)
-        time_seconds = getattr(route_obj, "time", 0)
+        distance_reelle = getattr(route_obj, "distance", 0) or 0
+        time_seconds = getattr(route_obj, "duration", 0) or 0
+
+        # Itinéraire issu d'une matrice (mode groupé) : pas de tracé
+        geometry, polyline = None, None
+        if route_obj.geometry is not None:
+            coordinates = route_obj.geometry
+            if reducer is not None:
+                coordinates, polyline = reducer.reduce(coordinates, distance_reelle)
+            if coordinates is not None:
+                geometry = {"type": "LineString", "coordinates": coordinates}
 
         properties = {
-            "arret_id": str(arret["ArRId"]),
-            "arret_nom": arret.get("ArRName", ""),
-            "arret_type": arret["ArRType"],
-            "poi_id": str(poi["id"]),
-            "poi_nom": poi.get("nom_poi", ""),
-            "poi_type": poi["type_lieu"],
-            "distance_vol_oiseau": round(distance, 2),
+            "arret_id": str(pair["ArRId"]),
+            "arret_nom": pair.get("ArRName", ""),
+            "arret_type": pair["ArRType"],
+            "poi_id": str(pair["id"]),
+            "poi_nom": pair.get("nom_poi", ""),
+            "poi_type": pair["type_lieu"],
+            "distance_vol_oiseau": round(pair["distance"], 2),
             "distance_reelle": round(distance_reelle, 2),
             "duree_marche": round(time_seconds / 60, 2),
-            "code_insee": str(arret["INSEE_COM"]),
-            "commune": arret["nom_commune_standard"],
-            "epci": arret["nom_epci"],
-            "departement": arret["nom_departement"],
+            "code_insee": str(pair["INSEE_COM"]),
+            "commune": pair["nom_commune_standard"],
+            "epci": pair["nom_epci"],
+            "departement": pair["nom_departement"],
         }
+        if "rayon" in pair:
+            # Plus petit des rayons comparés contenant la paire
+            properties["rayon"] = pair["rayon"]
+        if polyline is not None:
+            properties["polyline"] = polyline
 
         return {"type": "Feature", "geometry": geometry, "properties": properties}
 
     @staticmethod
-    def generate_filename(arret: pd.Series, poi: pd.Series) -> str:
+    def generate_filename(pair: Mapping[str, Any]) -> str:
         """
         Génère un nom de fichier stable pour l'itinéraire.
 
         Args:
-            arret: Series pandas de l'arrêt
-            poi: Series pandas du POI
+            pair: enregistrement de la table des paires (colonnes arrêt + POI)
 
         Returns:
             Nom de fichier (sans chemin)
         """
-        code_insee = str(arret.get("INSEE_COM", "unknown_insee")).strip()
+        code_insee = str(pair.get("INSEE_COM", "unknown_insee")).strip()
         nom_arret = (
-            str(arret.get("ArRName", arret.get("ArRId"))).strip().replace(" ", "_")
+            str(pair.get("ArRName", pair.get("ArRId"))).strip().replace(" ", "_")
         )
-        poi_id = str(poi["id"]).strip().replace("/", "_").replace("\\", "_")
+        poi_id = str(pair["id"]).strip().replace("/", "_").replace("\\", "_")
 
         return f"{code_insee}_{nom_arret}_{poi_id}.geojson"
 
     @staticmethod
     def save_geojson(
-        feature: Dict[str, Any], filename: str, output_folder: Path = OUTPUT_DIR
+        feature: Dict[str, Any],
+        filename: str,
+        output_folder: Path = OUTPUT_DIR,
+        indent: Optional[int] = 2,
     ) -> Path:
         """
         Sauvegarde une Feature GeoJSON dans un fichier.
@@ -86,6 +179,7 @@ class ExportService:
             feature: Feature GeoJSON à sauvegarder
             filename: nom du fichier de sortie
             output_folder: dossier de sortie
+            indent: indentation du JSON (None = compact)
 
         Returns:
             Path du fichier créé
@@ -96,7 +190,16 @@ class ExportService:
         geojson = {"type": "FeatureCollection", "features": [feature]}
         output_file = output_folder / filename
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(geojson, f, ensure_ascii=False, indent=2)
+        metrics = get_run_metrics()
+        with metrics.timer("serialisation"):
+            content = json.dumps(
+                geojson,
+                ensure_ascii=False,
+                indent=indent,
+                separators=None if indent else (",", ":"),
+            )
+        with metrics.timer("ecriture_disque"):
+            with open(output_file, "w", encoding="utf-8") as f:
+                f.write(content)
 
         return output_file
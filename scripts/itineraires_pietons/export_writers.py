@@ -0,0 +1,596 @@
+"""
+Écrivains de sortie en flux pour les itinéraires (Business Logic Layer).
+
+Quatre formats sont disponibles :
+- "geojson" : un fichier FeatureCollection par itinéraire (format historique)
+- "ndjson" : un seul fichier, une Feature GeoJSON par ligne, écrite au fil de l'eau
+- "parquet" : jeu de données GeoParquet (géométrie WKB), écrit par row groups
+- "geostore" : stockage géométrique colonnaire mappable en mémoire
+  (cf. `geometry_store`)
+
+Chaque écrivain appelle `on_commit(arret_id, poi_id, emplacement)` dès qu'une
+Feature est écrite de façon durable, ce qui alimente le journal d'exécution.
+"""
+
+import json
+import logging
+import math
+import os
+import shutil
+import struct
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .config import (
+    NDJSON_FILENAME,
+    PARQUET_DATASET_DIR,
+    PARQUET_ROW_GROUP_SIZE,
+    PARQUET_PART_ROWS,
+    GEOSTORE_DIR,
+)
+from .geometry_store import (
+    COORDS_FILENAME,
+    OFFSETS_DTYPE,
+    OFFSETS_FILENAME,
+    GeometryStore,
+)
+from .run_metrics import get_run_metrics
+
+logger = logging.getLogger(__name__)
+
+# Types des propriétés connues (cf. ExportService.create_geojson_feature) : un
+# NaN ou un type inattendu dans un lot ultérieur ne change pas le schéma
+PROPERTY_TYPES = {
+    "arret_id": "string",
+    "arret_nom": "string",
+    "arret_type": "string",
+    "poi_id": "string",
+    "poi_nom": "string",
+    "poi_type": "string",
+    "distance_vol_oiseau": "float64",
+    "distance_reelle": "float64",
+    "duree_marche": "float64",
+    "code_insee": "string",
+    "commune": "string",
+    "epci": "string",
+    "departement": "string",
+    "rayon": "float64",
+    "polyline": "string",
+}
+
+CommitCallback = Callable[[str, str, str], None]
+# (arret_id, poi_id) -> emplacement de la Feature (cf. journal d'exécution)
+PairLocations = Dict[Tuple[str, str], str]
+
+
+class FeatureWriter:
+    """Interface commune des écrivains de Features."""
+
+    def __init__(
+        self,
+        output_folder: Path,
+        append: bool = False,
+        on_commit: Optional[CommitCallback] = None,
+    ):
+        """
+        Args:
+            output_folder: dossier de sortie
+            append: complète une sortie existante au lieu de la remplacer (reprise)
+            on_commit: fonction appelée pour chaque Feature écrite durablement
+        """
+        self.output_folder = Path(output_folder)
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        self.append = append
+        self.on_commit = on_commit
+        self.count = 0
+
+    def _commit(self, properties: Dict[str, Any], location: str):
+        self.count += 1
+        if self.on_commit is not None:
+            self.on_commit(properties["arret_id"], properties["poi_id"], location)
+
+    def write(self, feature: Dict[str, Any], filename: str):
+        """Écrit une Feature (filename n'est utilisé que par le format fichier)."""
+        raise NotImplementedError
+
+    def close(self):
+        """Termine l'écriture."""
+
+    @classmethod
+    def remove_features(
+        cls,
+        output_folder: Path,
+        removed: PairLocations,
+        in_use: Optional[Set[str]] = None,
+    ) -> Dict[str, str]:
+        """
+        Supprime des Features d'une sortie existante (génération incrémentale).
+
+        Args:
+            output_folder: dossier de sortie
+            removed: paires à supprimer et emplacement de leur Feature
+            in_use: emplacements encore référencés par des paires conservées
+
+        Returns:
+            Nouveaux emplacements des Features conservées qui ont été déplacées
+            (ancien emplacement -> nouveau)
+        """
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GeoJSONFilesWriter(FeatureWriter):
+    """Un fichier GeoJSON par itinéraire (format historique)."""
+
+    def __init__(
+        self,
+        output_folder: Path,
+        append: bool = False,
+        on_commit=None,
+        indent: Optional[int] = 2,
+    ):
+        super().__init__(output_folder, append, on_commit)
+        self.indent = indent
+
+    def write(self, feature: Dict[str, Any], filename: str):
+        from .export_service import ExportService
+
+        output_file = ExportService.save_geojson(
+            feature, filename, self.output_folder, indent=self.indent
+        )
+        self._commit(feature["properties"], str(output_file))
+
+    @classmethod
+    def remove_features(
+        cls,
+        output_folder: Path,
+        removed: PairLocations,
+        in_use: Optional[Set[str]] = None,
+    ) -> Dict[str, str]:
+        # Les quais d'une même gare partagent un nom de fichier : un fichier
+        # encore référencé par une paire conservée n'est pas supprimé
+        in_use = in_use or set()
+        for location in set(removed.values()) - in_use:
+            if location:
+                Path(location).unlink(missing_ok=True)
+        return {}
+
+
+class NDJSONWriter(FeatureWriter):
+    """Une Feature GeoJSON compacte par ligne dans un fichier unique."""
+
+    def __init__(self, output_folder: Path, append: bool = False, on_commit=None):
+        super().__init__(output_folder, append, on_commit)
+        self.path = self.output_folder / NDJSON_FILENAME
+        self._file = open(self.path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, feature: Dict[str, Any], filename: str):
+        metrics = get_run_metrics()
+        with metrics.timer("serialisation"):
+            line = json.dumps(feature, ensure_ascii=False, separators=(",", ":"))
+        with metrics.timer("ecriture_disque"):
+            offset = self._file.tell()
+            self._file.write(line + "\n")
+            # Vidage du tampon à chaque ligne : une Feature journalisée est écrite
+            self._file.flush()
+        self._commit(feature["properties"], f"{self.path}@{offset}")
+
+    def close(self):
+        self._file.close()
+
+    @classmethod
+    def remove_features(
+        cls,
+        output_folder: Path,
+        removed: PairLocations,
+        in_use: Optional[Set[str]] = None,
+    ) -> Dict[str, str]:
+        """Réécrit le fichier sans les paires supprimées (décalages mis à jour)."""
+        path = Path(output_folder) / NDJSON_FILENAME
+        if not removed or not path.exists():
+            return {}
+
+        relocated = {}
+        tmp = path.with_suffix(".tmp")
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            offset = 0
+            for line in src:
+                try:
+                    properties = json.loads(line)["properties"]
+                    key = (properties["arret_id"], properties["poi_id"])
+                except (json.JSONDecodeError, KeyError):
+                    # Ligne tronquée par une interruption : abandonnée
+                    key = None
+                if key is not None and key not in removed:
+                    new_offset = dst.tell()
+                    if new_offset != offset:
+                        relocated[f"{path}@{offset}"] = f"{path}@{new_offset}"
+                    dst.write(line)
+                offset += len(line)
+        os.replace(tmp, path)
+        return relocated
+
+
+def linestring_to_wkb(coordinates) -> Optional[bytes]:
+    """
+    Encode une LineString [[lon, lat], ...] en WKB (little-endian).
+
+    Args:
+        coordinates: liste de coordonnées [lon, lat]
+
+    Returns:
+        Géométrie WKB, ou None si pas de coordonnées
+    """
+    if coordinates is None:
+        return None
+    coords = np.asarray(coordinates, dtype="<f8").reshape(-1, 2)
+    return b"\x01" + struct.pack("<II", 2, len(coords)) + coords.tobytes()
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def properties_schema(rows: List[Dict[str, Any]]):
+    """
+    Schéma Arrow des propriétés d'un premier lot de lignes.
+
+    Les propriétés connues ont le type de PROPERTY_TYPES ; les autres sont
+    inférées du lot (texte si elles y sont toujours nulles).
+
+    Args:
+        rows: lignes (dictionnaires de propriétés)
+
+    Returns:
+        pyarrow.Schema
+    """
+    import pyarrow as pa
+
+    inferred = pa.Table.from_pylist(rows).schema
+    fields = []
+    for field in inferred:
+        if field.name in PROPERTY_TYPES:
+            field = field.with_type(getattr(pa, PROPERTY_TYPES[field.name])())
+        elif pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def rows_to_table(rows: List[Dict[str, Any]], schema):
+    """
+    Table Arrow des lignes, convertie vers le schéma déclaré.
+
+    Les valeurs manquantes (None, NaN) deviennent nulles, les valeurs d'une
+    colonne texte sont converties en texte, et celles d'une colonne numérique
+    qui ne sont pas des nombres deviennent nulles.
+
+    Args:
+        rows: lignes (dictionnaires de propriétés)
+        schema: schéma cible (cf. `properties_schema`)
+
+    Returns:
+        pyarrow.Table
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    columns = []
+    for field in schema:
+        values = [row.get(field.name) for row in rows]
+        if pa.types.is_string(field.type):
+            values = [None if _is_missing(v) else str(v) for v in values]
+            columns.append(pa.array(values, type=field.type))
+            continue
+        try:
+            columns.append(pa.array(values, type=field.type, from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            if not (
+                pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+            ):
+                raise
+            numbers = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+            columns.append(
+                pa.array(numbers, from_pandas=True).cast(field.type, safe=False)
+            )
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def wkb_to_linestring(wkb: Optional[bytes]) -> Optional[List[List[float]]]:
+    """
+    Décode une LineString WKB little-endian (cf. `linestring_to_wkb`).
+
+    Args:
+        wkb: géométrie WKB
+
+    Returns:
+        Liste de coordonnées [lon, lat], ou None si pas de géométrie
+    """
+    if wkb is None:
+        return None
+    count = struct.unpack_from("<I", wkb, 5)[0]
+    return (
+        np.frombuffer(wkb, dtype="<f8", count=2 * count, offset=9)
+        .reshape(-1, 2)
+        .tolist()
+    )
+
+
+class ParquetWriter(FeatureWriter):
+    """
+    Jeu de données GeoParquet : géométrie WKB et une colonne par propriété.
+
+    Les lignes sont tamponnées par row group (PARQUET_ROW_GROUP_SIZE) et les
+    fichiers tournent tous les PARQUET_PART_ROWS lignes. Un fichier Parquet
+    n'étant lisible qu'une fois son pied de page écrit, chaque fichier est écrit
+    sous un nom temporaire (préfixe "_", ignoré par les lecteurs du jeu) puis
+    renommé à sa fermeture, et les Features ne sont journalisées qu'alors.
+    """
+
+    def __init__(self, output_folder: Path, append: bool = False, on_commit=None):
+        import pyarrow  # noqa: F401  (dépendance requise pour ce format)
+
+        super().__init__(output_folder, append, on_commit)
+        self.dataset_dir = self.output_folder / PARQUET_DATASET_DIR
+        self.dataset_dir.mkdir(parents=True, exist_ok=True)
+
+        # Fichiers inachevés d'une exécution interrompue (non journalisés)
+        for partial in self.dataset_dir.glob("_part-*.tmp"):
+            partial.unlink()
+        existing = sorted(self.dataset_dir.glob("part-*.parquet"))
+        if not append:
+            for part in existing:
+                part.unlink()
+            existing = []
+        # Après une suppression incrémentale, les numéros ne sont plus contigus :
+        # on repart après le plus grand pour ne pas écraser un fichier existant
+        self._part_index = max(
+            (int(part.stem.split("-")[1]) + 1 for part in existing), default=0
+        )
+
+        self._schema = None
+        self._writer = None
+        self._part_path: Optional[Path] = None
+        self._part_rows = 0
+        self._rows: List[Dict[str, Any]] = []
+        # (arret_id, poi_id) écrits dans le fichier en cours
+        self._uncommitted: List[Dict[str, str]] = []
+
+    def write(self, feature: Dict[str, Any], filename: str):
+        with get_run_metrics().timer("serialisation"):
+            geometry = feature.get("geometry") or {}
+            row = dict(feature["properties"])
+            row["geometry"] = linestring_to_wkb(geometry.get("coordinates"))
+        self._rows.append(row)
+        if len(self._rows) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush_row_group()
+
+    def _flush_row_group(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._rows:
+            return
+
+        if self._schema is None:
+            schema = properties_schema(self._rows)
+            schema = schema.set(
+                schema.get_field_index("geometry"), pa.field("geometry", pa.binary())
+            )
+            geo = {
+                "version": "1.0.0",
+                "primary_column": "geometry",
+                "columns": {
+                    "geometry": {"encoding": "WKB", "geometry_types": ["LineString"]}
+                },
+            }
+            self._schema = schema.with_metadata({"geo": json.dumps(geo)})
+
+        if self._writer is None:
+            self._part_path = self.dataset_dir / f"part-{self._part_index:05d}.parquet"
+            self._writer = pq.ParquetWriter(self._tmp_path, self._schema)
+
+        metrics = get_run_metrics()
+        with metrics.timer("serialisation"):
+            table = rows_to_table(self._rows, self._schema)
+        with metrics.timer("ecriture_disque"):
+            self._writer.write_table(table, row_group_size=len(self._rows))
+
+        self._uncommitted.extend(
+            {"arret_id": row["arret_id"], "poi_id": row["poi_id"]} for row in self._rows
+        )
+        self._part_rows += len(self._rows)
+        self._rows = []
+
+        if self._part_rows >= PARQUET_PART_ROWS:
+            self._close_part()
+
+    @property
+    def _tmp_path(self) -> Path:
+        return self._part_path.with_name(f"_{self._part_path.stem}.tmp")
+
+    def _close_part(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        os.replace(self._tmp_path, self._part_path)
+        self._part_index += 1
+        self._part_rows = 0
+        location = str(self._part_path)
+        for properties in self._uncommitted:
+            self._commit(properties, location)
+        self._uncommitted = []
+
+    def close(self):
+        self._flush_row_group()
+        self._close_part()
+
+    @classmethod
+    def remove_features(
+        cls,
+        output_folder: Path,
+        removed: PairLocations,
+        in_use: Optional[Set[str]] = None,
+    ) -> Dict[str, str]:
+        """Réécrit les fichiers du jeu contenant des paires supprimées."""
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        removed_keys = list(removed)
+        parts = {location for location in removed.values() if location}
+        for part in sorted(parts):
+            part = Path(part)
+            if not part.exists():
+                continue
+            table = pq.read_table(part)
+            keys = pd.MultiIndex.from_arrays(
+                [
+                    table.column("arret_id").to_pandas().astype(str),
+                    table.column("poi_id").to_pandas().astype(str),
+                ]
+            )
+            keep = ~keys.isin(removed_keys)
+            if keep.all():
+                continue
+            if not keep.any():
+                part.unlink()
+                continue
+            tmp = part.with_suffix(".tmp")
+            pq.write_table(
+                table.filter(pa.array(keep)),
+                tmp,
+                row_group_size=PARQUET_ROW_GROUP_SIZE,
+            )
+            os.replace(tmp, part)
+        return {}
+
+
+class GeometryStoreWriter(FeatureWriter):
+    """
+    Stockage géométrique colonnaire (cf. `geometry_store`) : coordonnées
+    quantifiées dans un tableau plat, offsets par itinéraire, attributs Parquet.
+
+    Les itinéraires sont tamponnés par blocs de PARQUET_ROW_GROUP_SIZE ; chaque
+    bloc ajoute ses coordonnées et offsets puis un fichier d'attributs, et
+    n'est journalisé qu'une fois ce fichier écrit.
+    """
+
+    def __init__(self, output_folder: Path, append: bool = False, on_commit=None):
+        import pyarrow  # noqa: F401  (dépendance requise pour ce format)
+
+        super().__init__(output_folder, append, on_commit)
+        self.store_dir = self.output_folder / GEOSTORE_DIR
+        if append and GeometryStore.is_store(self.store_dir):
+            GeometryStore.repair(self.store_dir)
+        else:
+            GeometryStore.create(self.store_dir)
+        self._part_index = len(list(self.store_dir.glob("attributs-*.parquet")))
+        offsets_path = self.store_dir / OFFSETS_FILENAME
+        self._n_points = int(np.fromfile(offsets_path, dtype=OFFSETS_DTYPE)[-1])
+        self._coords_file = open(self.store_dir / COORDS_FILENAME, "ab")
+        self._offsets_file = open(offsets_path, "ab")
+        self._schema = None
+        self._rows: List[Dict[str, Any]] = []
+        self._coords: List[np.ndarray] = []
+
+    def write(self, feature: Dict[str, Any], filename: str):
+        with get_run_metrics().timer("serialisation"):
+            geometry = feature.get("geometry") or {}
+            self._coords.append(GeometryStore.quantise(geometry.get("coordinates")))
+            self._rows.append(dict(feature["properties"]))
+        if len(self._rows) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._rows:
+            return
+        metrics = get_run_metrics()
+        with metrics.timer("serialisation"):
+            lengths = np.array([len(c) for c in self._coords], dtype=OFFSETS_DTYPE)
+            offsets = self._n_points + np.cumsum(lengths)
+            if self._schema is None:
+                self._schema = properties_schema(self._rows)
+            table = rows_to_table(self._rows, self._schema)
+        with metrics.timer("ecriture_disque"):
+            for coords in self._coords:
+                self._coords_file.write(coords.tobytes())
+            self._coords_file.flush()
+            self._offsets_file.write(offsets.astype(OFFSETS_DTYPE).tobytes())
+            self._offsets_file.flush()
+            # Le fichier d'attributs valide le bloc (cf. `GeometryStore.repair`)
+            part = self.store_dir / f"attributs-{self._part_index:05d}.parquet"
+            tmp = part.with_suffix(".tmp")
+            pq.write_table(table, tmp)
+            os.replace(tmp, part)
+
+        self._part_index += 1
+        if len(offsets):
+            self._n_points = int(offsets[-1])
+        location = str(self.store_dir)
+        for row in self._rows:
+            self._commit(row, location)
+        self._rows, self._coords = [], []
+
+    def close(self):
+        self._flush()
+        self._coords_file.close()
+        self._offsets_file.close()
+
+    @classmethod
+    def remove_features(
+        cls,
+        output_folder: Path,
+        removed: PairLocations,
+        in_use: Optional[Set[str]] = None,
+    ) -> Dict[str, str]:
+        """Réécrit le stockage sans les paires supprimées (emplacement inchangé)."""
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        store_dir = Path(output_folder) / GEOSTORE_DIR
+        if not removed or not GeometryStore.is_store(store_dir):
+            return {}
+        store = GeometryStore(store_dir)
+        keys = pd.MultiIndex.from_arrays(
+            [
+                store.attributes.column("arret_id").to_pandas().astype(str),
+                store.attributes.column("poi_id").to_pandas().astype(str),
+            ]
+        )
+        keep = np.flatnonzero(~keys.isin(list(removed)))
+        if len(keep) == len(store):
+            return {}
+
+        tmp_dir = store_dir.with_name(store_dir.name + ".tmp")
+        GeometryStore.create(tmp_dir)
+        starts, ends = store.offsets[:-1][keep], store.offsets[1:][keep]
+        with open(tmp_dir / COORDS_FILENAME, "wb") as f:
+            for start, end in zip(starts, ends):
+                f.write(store.coords[start:end].tobytes())
+        np.concatenate([[0], np.cumsum(ends - starts)]).astype(OFFSETS_DTYPE).tofile(
+            tmp_dir / OFFSETS_FILENAME
+        )
+        for i, start in enumerate(range(0, len(keep), PARQUET_PART_ROWS)):
+            pq.write_table(
+                store.attributes.take(
+                    pa.array(keep[start : start + PARQUET_PART_ROWS])
+                ),
+                tmp_dir / f"attributs-{i:05d}.parquet",
+            )
+        del store
+        shutil.rmtree(store_dir)
+        os.replace(tmp_dir, store_dir)
+        return {}
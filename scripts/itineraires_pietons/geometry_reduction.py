@@ -0,0 +1,282 @@
+"""
+Réduction des géométries d'itinéraires à l'export (Business Logic Layer).
+
+Trois réductions, combinables :
+- simplification de Douglas-Peucker avec une tolérance en mètres, vectorisée
+  (tous les segments en attente d'un même niveau de récursion sont traités en
+  une passe numpy) ;
+- arrondi des coordonnées à une précision donnée (6 décimales ~ 0,1 m,
+  5 décimales ~ 1 m) ;
+- encodage en polyline (algorithme Google, toujours en précision 1e-6 comme
+  les "polyline6" de Valhalla, quelle que soit la précision d'arrondi) à la
+  place des coordonnées GeoJSON.
+
+La longueur du tracé réduit reste à moins de SIMPLIFY_MAX_LENGTH_ERROR (en
+proportion de `distance_reelle`) de celle du tracé d'origine : sinon la
+tolérance est divisée par deux, jusqu'à renoncer à la simplification.
+"""
+
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import (
+    EARTH_RADIUS_M,
+    SIMPLIFY_TOLERANCE_M,
+    SIMPLIFY_MAX_LENGTH_ERROR,
+    POLYLINE_PRECISION,
+)
+from .spatial_service import SpatialService
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY_ENCODINGS = ["geojson", "polyline"]
+# Nombre de divisions par deux de la tolérance avant de renoncer
+MAX_TOLERANCE_HALVINGS = 3
+
+
+class GeometryReducer:
+    """Simplifie, arrondit et encode les tracés exportés, et mesure le gain."""
+
+    def __init__(
+        self,
+        tolerance_m: Optional[float] = SIMPLIFY_TOLERANCE_M,
+        precision: Optional[int] = None,
+        encoding: str = "geojson",
+        max_length_error: float = SIMPLIFY_MAX_LENGTH_ERROR,
+    ):
+        """
+        Args:
+            tolerance_m: tolérance de Douglas-Peucker en mètres (None ou 0 =
+                pas de simplification)
+            precision: nombre de décimales conservées (None = inchangé)
+            encoding: "geojson" (coordonnées) ou "polyline" (propriété
+                "polyline", géométrie nulle)
+            max_length_error: écart de longueur maximal dû à la réduction, en
+                proportion de distance_reelle
+        """
+        if encoding not in GEOMETRY_ENCODINGS:
+            raise ValueError(f"Encodage de géométrie inconnu : {encoding}")
+        self.tolerance_m = tolerance_m or 0.0
+        self.precision = precision
+        self.encoding = encoding
+        self.max_length_error = max_length_error
+        self.stats = {
+            "itineraires": 0,
+            "points_avant": 0,
+            "points_apres": 0,
+            "octets_avant": 0,
+            "octets_apres": 0,
+            "tolerance_reduite": 0,
+            "non_simplifies": 0,
+        }
+
+    @staticmethod
+    def simplify_mask(
+        xy: np.ndarray, tolerance: float, offsets: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Douglas-Peucker vectorisé : points conservés d'une ou plusieurs polylignes.
+
+        À chaque niveau, les distances de tous les points intérieurs de tous
+        les segments en attente à leur segment [début, fin] sont calculées en
+        une passe ; chaque segment dont le point le plus éloigné dépasse la
+        tolérance est coupé en ce point.
+
+        Args:
+            xy: coordonnées projetées en mètres, tableau (N, 2)
+            tolerance: distance maximale (m) d'un point supprimé au tracé simplifié
+            offsets: début de chaque polyligne dans xy, suivi de N, pour
+                simplifier plusieurs polylignes concaténées en une passe
+                (None = une seule polyligne)
+
+        Returns:
+            Masque booléen des points conservés (extrémités toujours conservées)
+        """
+        n = len(xy)
+        keep = np.zeros(n, dtype=bool)
+        if n == 0:
+            return keep
+        if offsets is None:
+            offsets = np.array([0, n])
+        offsets = np.asarray(offsets)
+        lines = np.flatnonzero(np.diff(offsets) > 0)
+        starts, ends = offsets[lines], offsets[lines + 1] - 1
+        keep[starts] = True
+        keep[ends] = True
+        while len(starts):
+            counts = ends - starts - 1
+            pending = counts > 0
+            starts, ends, counts = starts[pending], ends[pending], counts[pending]
+            if not len(starts):
+                break
+
+            # Points intérieurs de chaque segment, segment par segment
+            segment = np.repeat(np.arange(len(starts)), counts)
+            first = np.cumsum(counts) - counts
+            points = starts[segment] + 1 + np.arange(counts.sum()) - first[segment]
+
+            a, b, p = xy[starts[segment]], xy[ends[segment]], xy[points]
+            ab = b - a
+            ab_sq = np.einsum("ij,ij->i", ab, ab)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = np.where(ab_sq > 0, np.einsum("ij,ij->i", p - a, ab) / ab_sq, 0.0)
+            projection = a + np.clip(t, 0.0, 1.0)[:, None] * ab
+            dist = np.hypot(*(p - projection).T)
+
+            # Point le plus éloigné de chaque segment
+            max_dist = np.maximum.reduceat(dist, first)
+            farthest_rows = np.flatnonzero(dist == max_dist[segment])
+            _, first_hit = np.unique(segment[farthest_rows], return_index=True)
+            farthest = points[farthest_rows[first_hit]]
+
+            split = max_dist > tolerance
+            keep[farthest[split]] = True
+            starts, ends = (
+                np.concatenate([starts[split], farthest[split]]),
+                np.concatenate([farthest[split], ends[split]]),
+            )
+        return keep
+
+    @staticmethod
+    def polyline_length(coords: np.ndarray) -> float:
+        """Longueur (m) d'une polyligne (lon, lat) par sommes de haversines."""
+        if len(coords) < 2:
+            return 0.0
+        lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+        a = (
+            np.sin(np.diff(lat) / 2) ** 2
+            + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+        )
+        return float(EARTH_RADIUS_M * np.sum(2 * np.arcsin(np.sqrt(a))))
+
+    @staticmethod
+    def encode_polyline(coords: np.ndarray, precision: int = POLYLINE_PRECISION) -> str:
+        """
+        Encode une polyligne (lon, lat) au format polyline (ordre lat, lon).
+
+        Args:
+            coords: tableau (N, 2) de (lon, lat) en degrés
+            precision: décimales encodées (5 = Google, 6 = Valhalla)
+
+        Returns:
+            Chaîne encodée
+        """
+        if len(coords) == 0:
+            return ""
+        values = np.round(np.asarray(coords)[:, ::-1] * 10**precision).astype(np.int64)
+        deltas = np.diff(values, axis=0, prepend=0).ravel()
+        # Signe dans le bit de poids faible, puis blocs de 5 bits (poids faibles d'abord)
+        zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+        chunks = (zigzag[:, None] >> (5 * np.arange(7))) & 0x1F
+        n_chunks = np.maximum(
+            1, (np.floor(np.log2(np.maximum(zigzag, 1))).astype(np.int64) // 5) + 1
+        )
+        used = np.arange(7) < n_chunks[:, None]
+        more = np.arange(7) < (n_chunks - 1)[:, None]
+        encoded = (chunks | np.where(more, 0x20, 0)) + 63
+        return encoded[used].astype(np.uint8).tobytes().decode("ascii")
+
+    @staticmethod
+    def decode_polyline(
+        encoded: str, precision: int = POLYLINE_PRECISION
+    ) -> List[List[float]]:
+        """
+        Décode une polyline (cf. `encode_polyline`).
+
+        Returns:
+            Liste de coordonnées [lon, lat]
+        """
+        data = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64)
+        if not len(data):
+            return []
+        data -= 63
+        # Fin de chaque valeur : bloc sans bit de continuation
+        last = (data & 0x20) == 0
+        value_id = np.concatenate([[0], np.cumsum(last)[:-1]])
+        start = np.flatnonzero(np.concatenate([[True], last[:-1]]))
+        shift = 5 * (np.arange(len(data)) - start[value_id])
+        zigzag = np.bincount(
+            value_id, weights=((data & 0x1F) << shift).astype(np.float64)
+        ).astype(np.int64)
+        deltas = np.where(zigzag & 1, ~(zigzag >> 1), zigzag >> 1)
+        values = np.cumsum(deltas.reshape(-1, 2), axis=0) / 10**precision
+        return values[:, ::-1].tolist()
+
+    def _reduce_coordinates(self, raw: np.ndarray, tolerance: float) -> np.ndarray:
+        reduced = raw
+        if tolerance > 0 and len(raw) > 2:
+            xy = SpatialService.project_to_metric(
+                raw[:, 1], raw[:, 0], ref_lat=float(raw[:, 1].mean())
+            )
+            reduced = raw[self.simplify_mask(xy, tolerance)]
+        if self.precision is not None:
+            reduced = np.round(reduced, self.precision)
+            # Points confondus après arrondi
+            distinct = np.ones(len(reduced), dtype=bool)
+            distinct[1:] = np.any(reduced[1:] != reduced[:-1], axis=1)
+            distinct[-1] = True
+            reduced = reduced[distinct]
+        return reduced
+
+    def reduce(
+        self, coordinates, reference_length: float = 0.0
+    ) -> Tuple[Optional[List[List[float]]], Optional[str]]:
+        """
+        Réduit un tracé.
+
+        Args:
+            coordinates: liste de coordonnées [lon, lat]
+            reference_length: distance_reelle de l'itinéraire (m), base de
+                l'écart de longueur admis (longueur du tracé si nulle)
+
+        Returns:
+            Tuple (coordonnées réduites, polyline) : l'un des deux est None
+            selon l'encodage
+        """
+        raw = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        raw_length = self.polyline_length(raw)
+        allowed = self.max_length_error * (reference_length or raw_length)
+
+        tolerance = self.tolerance_m
+        for attempt in range(MAX_TOLERANCE_HALVINGS + 2):
+            if attempt > MAX_TOLERANCE_HALVINGS:
+                tolerance = 0.0
+            reduced = self._reduce_coordinates(raw, tolerance)
+            if abs(self.polyline_length(reduced) - raw_length) <= allowed:
+                break
+            if tolerance == 0.0:
+                reduced = raw
+                self.stats["non_simplifies"] += 1
+                break
+            tolerance /= 2
+        if tolerance < self.tolerance_m and len(reduced) != len(raw):
+            self.stats["tolerance_reduite"] += 1
+
+        compact = (",", ":")
+        self.stats["itineraires"] += 1
+        self.stats["points_avant"] += len(raw)
+        self.stats["points_apres"] += len(reduced)
+        self.stats["octets_avant"] += len(json.dumps(coordinates, separators=compact))
+        if self.encoding == "polyline":
+            polyline = self.encode_polyline(reduced)
+            self.stats["octets_apres"] += len(polyline) + 2
+            return None, polyline
+        coords = reduced.tolist()
+        self.stats["octets_apres"] += len(json.dumps(coords, separators=compact))
+        return coords, None
+
+    def report(self) -> Dict[str, float]:
+        """Statistiques de réduction (volumes avant/après et gain en %)."""
+        stats = dict(self.stats)
+        before = stats["octets_avant"]
+        stats["reduction_octets_pct"] = (
+            round(100 * (1 - stats["octets_apres"] / before), 1) if before else 0.0
+        )
+        points = stats["points_avant"]
+        stats["reduction_points_pct"] = (
+            round(100 * (1 - stats["points_apres"] / points), 1) if points else 0.0
+        )
+        return stats
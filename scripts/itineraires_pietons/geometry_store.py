@@ -0,0 +1,401 @@
+"""
+Stockage géométrique colonnaire des itinéraires (Data Layer).
+
+Toutes les coordonnées sont rangées dans un seul tableau plat d'entiers int32
+(degrés quantifiés à 1/GEOSTORE_SCALE), avec un tableau d'offsets par
+itinéraire et les attributs en colonnes Parquet à côté :
+
+    itineraires_geostore/
+    ├── meta.json                 # version, échelle de quantification
+    ├── coords.i32                # (lon, lat) x points, int32 little-endian
+    ├── offsets.i64               # n_itineraires + 1 offsets (en points)
+    └── attributs-00000.parquet   # une ligne par itinéraire, par bloc écrit
+
+Les fichiers sont mappés en mémoire à l'ouverture : le tracé d'un itinéraire
+est une vue (sans copie) de `coords[offsets[i]:offsets[i + 1]]`. Un itinéraire
+sans géométrie a zéro point.
+
+Usage :
+    python -m itineraires_pietons.geometry_store convert sortie_geojson sortie_geostore
+    python -m itineraires_pietons.geometry_store benchmark itineraires_pietons/data/output_SQY
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .config import GEOSTORE_DIR, GEOSTORE_SCALE, EARTH_RADIUS_M
+
+logger = logging.getLogger(__name__)
+
+GEOSTORE_VERSION = 1
+META_FILENAME = "meta.json"
+COORDS_FILENAME = "coords.i32"
+OFFSETS_FILENAME = "offsets.i64"
+COORDS_DTYPE = np.dtype("<i4")
+OFFSETS_DTYPE = np.dtype("<i8")
+
+
+class GeometryStore:
+    """Lecture d'un stockage géométrique mappé en mémoire."""
+
+    def __init__(self, store_dir: Path):
+        """
+        Ouvre un stockage (seuls les itinéraires dont les attributs ont été
+        écrits sont visibles, cf. `GeometryStore.repair`).
+
+        Args:
+            store_dir: dossier du stockage
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / META_FILENAME, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != GEOSTORE_VERSION:
+            raise ValueError(
+                f"Version de stockage géométrique non prise en charge : {meta.get('version')}"
+            )
+        self.scale = float(meta["echelle"])
+
+        tables = [
+            pq.read_table(part, memory_map=True) for part in self.attribute_parts()
+        ]
+        self.attributes = (
+            pa.concat_tables(tables, promote_options="default")
+            if tables
+            else pa.table({})
+        )
+        n = self.attributes.num_rows
+        self.offsets = self._map(self.store_dir / OFFSETS_FILENAME, OFFSETS_DTYPE)[
+            : n + 1
+        ]
+        if len(self.offsets) == 0:
+            self.offsets = np.zeros(1, dtype=OFFSETS_DTYPE)
+        self.coords = self._map(self.store_dir / COORDS_FILENAME, COORDS_DTYPE)[
+            : 2 * int(self.offsets[-1])
+        ].reshape(-1, 2)
+
+    @staticmethod
+    def _map(path: Path, dtype: np.dtype) -> np.ndarray:
+        """Mappe un fichier binaire en mémoire (tableau vide si fichier vide)."""
+        if not path.exists() or path.stat().st_size < dtype.itemsize:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def attribute_parts(self):
+        return sorted(self.store_dir.glob("attributs-*.parquet"))
+
+    @staticmethod
+    def is_store(path: Path) -> bool:
+        """Indique si `path` est un dossier de stockage géométrique."""
+        return (Path(path) / META_FILENAME).is_file()
+
+    @staticmethod
+    def create(store_dir: Path):
+        """Crée un stockage vide (en remplaçant un stockage existant)."""
+        store_dir = Path(store_dir)
+        if store_dir.exists():
+            shutil.rmtree(store_dir)
+        store_dir.mkdir(parents=True)
+        with open(store_dir / META_FILENAME, "w", encoding="utf-8") as f:
+            json.dump({"version": GEOSTORE_VERSION, "echelle": GEOSTORE_SCALE}, f)
+        (store_dir / COORDS_FILENAME).touch()
+        np.zeros(1, dtype=OFFSETS_DTYPE).tofile(store_dir / OFFSETS_FILENAME)
+
+    @staticmethod
+    def repair(store_dir: Path) -> int:
+        """
+        Tronque coordonnées et offsets écrits après le dernier bloc d'attributs
+        (écriture interrompue), avant de compléter un stockage existant.
+
+        Args:
+            store_dir: dossier du stockage
+
+        Returns:
+            Nombre d'itinéraires du stockage
+        """
+        import pyarrow.parquet as pq
+
+        store_dir = Path(store_dir)
+        n = sum(
+            pq.read_metadata(part).num_rows
+            for part in sorted(store_dir.glob("attributs-*.parquet"))
+        )
+        offsets_path = store_dir / OFFSETS_FILENAME
+        offsets = np.fromfile(offsets_path, dtype=OFFSETS_DTYPE)[: n + 1]
+        with open(offsets_path, "r+b") as f:
+            f.truncate(len(offsets) * OFFSETS_DTYPE.itemsize)
+        with open(store_dir / COORDS_FILENAME, "r+b") as f:
+            f.truncate(2 * int(offsets[-1]) * COORDS_DTYPE.itemsize)
+        return n
+
+    @staticmethod
+    def quantise(coordinates, scale: float = GEOSTORE_SCALE) -> np.ndarray:
+        """
+        Quantifie une liste de coordonnées [lon, lat] en int32.
+
+        Args:
+            coordinates: coordonnées en degrés (None = pas de géométrie)
+            scale: unités par degré
+
+        Returns:
+            Tableau (N, 2) int32 (N = 0 si pas de géométrie)
+        """
+        if coordinates is None:
+            return np.zeros((0, 2), dtype=COORDS_DTYPE)
+        coords = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        return np.round(coords * scale).astype(COORDS_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def n_points(self) -> int:
+        return len(self.coords)
+
+    def quantised(self, i: int) -> np.ndarray:
+        """Vue (sans copie) des coordonnées int32 de l'itinéraire i."""
+        return self.coords[self.offsets[i] : self.offsets[i + 1]]
+
+    def coordinates(self, i: int) -> np.ndarray:
+        """Coordonnées (lon, lat) en degrés de l'itinéraire i (float64)."""
+        return self.quantised(i) / self.scale
+
+    def route_lengths(self) -> np.ndarray:
+        """
+        Longueur (m) de chaque tracé, calculée en une passe sur le tableau
+        plat des coordonnées (haversine entre points consécutifs).
+
+        Returns:
+            Longueurs en mètres (0 pour un itinéraire sans géométrie)
+        """
+        lengths = np.zeros(len(self))
+        if self.n_points < 2:
+            return lengths
+        lon, lat = np.radians(self.coords[:, 0] / self.scale), np.radians(
+            self.coords[:, 1] / self.scale
+        )
+        a = (
+            np.sin(np.diff(lat) / 2) ** 2
+            + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+        )
+        segments = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+        # Longueur d'un tracé [s, e[ : segments s à e - 2 (ceux reliant deux
+        # itinéraires consécutifs ne sont jamais comptés)
+        cumulative = np.concatenate([[0.0], np.cumsum(segments)])
+        starts, ends = np.asarray(self.offsets[:-1]), np.asarray(self.offsets[1:])
+        has_segments = ends - starts > 1
+        lengths[has_segments] = (
+            cumulative[ends[has_segments] - 1] - cumulative[starts[has_segments]]
+        )
+        return lengths
+
+    def feature(self, i: int) -> Dict[str, Any]:
+        """Feature GeoJSON de l'itinéraire i."""
+        return next(self.iter_features(i, i + 1))
+
+    def iter_features(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Reconstitue les Features GeoJSON d'une plage d'itinéraires.
+
+        Args:
+            start: premier itinéraire
+            end: fin de plage exclue (None = jusqu'au dernier)
+
+        Returns:
+            Itérateur de Features
+        """
+        end = len(self) if end is None else min(end, len(self))
+        step = 10_000
+        for block in range(start, end, step):
+            block_end = min(block + step, end)
+            rows = self.attributes.slice(block, block_end - block).to_pylist()
+            for i, properties in zip(range(block, block_end), rows):
+                coords = self.coordinates(i)
+                yield {
+                    "type": "Feature",
+                    "geometry": (
+                        {"type": "LineString", "coordinates": coords.tolist()}
+                        if len(coords)
+                        else None
+                    ),
+                    "properties": properties,
+                }
+
+
+def _directory_size(path: Path) -> int:
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def convert(inputs, output_folder: Path) -> GeometryStore:
+    """
+    Convertit des sorties GeoJSON / NDJSON / stockage en stockage géométrique.
+
+    Args:
+        inputs: dossiers ou fichiers d'entrée (cf. `unify_geojsons`)
+        output_folder: dossier de sortie (le stockage y est créé)
+
+    Returns:
+        Stockage créé
+    """
+    from .export_writers import GeometryStoreWriter
+    from .unify_geojsons import iter_input_features
+
+    with GeometryStoreWriter(output_folder) as writer:
+        for feature in iter_input_features(inputs):
+            writer.write(feature, "")
+    return GeometryStore(Path(output_folder) / GEOSTORE_DIR)
+
+
+def _drop_page_cache(paths) -> bool:
+    """
+    Retire des fichiers du cache de pages du système (lecture suivante depuis
+    le disque), après les avoir synchronisés.
+
+    Returns:
+        False si le système ne le permet pas (posix_fadvise absent)
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def _files(path: Path) -> List[Path]:
+    """Fichiers d'une entrée (fichier, ou contenu d'un dossier de stockage)."""
+    return [f for f in path.iterdir() if f.is_file()] if path.is_dir() else [path]
+
+
+def benchmark(inputs) -> Dict[str, Dict[str, float]]:
+    """
+    Compare la lecture des sorties GeoJSON / NDJSON et celle du stockage
+    géométrique : chargement des tracés en tableaux numpy float64 (degrés)
+    puis calcul de la longueur de chaque itinéraire.
+
+    Des deux côtés, les coordonnées sont effectivement lues et copiées (pas
+    de vue paresseuse), et les fichiers sont d'abord retirés du cache de pages
+    quand le système le permet (cf. "cache_vide") : sinon, le stockage, tout
+    juste écrit, serait lu depuis la mémoire.
+
+    Args:
+        inputs: dossiers ou fichiers GeoJSON / NDJSON
+
+    Returns:
+        Mesures par format (taille disque, durées de lecture et de calcul)
+    """
+    from .unify_geojsons import iter_input_features, list_input_files
+
+    files = list_input_files(inputs)
+    results = {}
+
+    cold = _drop_page_cache([f for path in files for f in _files(path)])
+    start = time.perf_counter()
+    routes = [
+        np.asarray((f.get("geometry") or {}).get("coordinates") or [], np.float64)
+        for f in iter_input_features(inputs)
+    ]
+    read_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for coords in routes:
+        if len(coords) > 1:
+            lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+            a = (
+                np.sin(np.diff(lat) / 2) ** 2
+                + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+            )
+            (2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))).sum()
+    results["geojson"] = {
+        "itineraires": len(routes),
+        "points": sum(len(coords) for coords in routes),
+        "cache_vide": cold,
+        "taille_mo": sum(_directory_size(f) for f in files) / 1024**2,
+        "lecture_s": read_s,
+        "longueurs_s": time.perf_counter() - start,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        convert(inputs, Path(tmp))
+        store_dir = Path(tmp) / GEOSTORE_DIR
+        cold = _drop_page_cache(_files(store_dir))
+        start = time.perf_counter()
+        store = GeometryStore(store_dir)
+        routes = [np.array(store.coordinates(i)) for i in range(len(store))]
+        read_s = time.perf_counter() - start
+        start = time.perf_counter()
+        store.route_lengths()
+        results["geostore"] = {
+            "itineraires": len(store),
+            "points": sum(len(coords) for coords in routes),
+            "cache_vide": cold,
+            "taille_mo": _directory_size(store_dir) / 1024**2,
+            "lecture_s": read_s,
+            "longueurs_s": time.perf_counter() - start,
+        }
+    return results
+
+
+def main():
+    """Conversion en stockage géométrique et comparaison avec GeoJSON."""
+    parser = argparse.ArgumentParser(
+        description="Stockage géométrique colonnaire des itinéraires"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser(
+        "convert", help="Convertit des sorties GeoJSON / NDJSON en stockage"
+    )
+    convert_parser.add_argument("inputs", nargs="+", help="Dossiers ou fichiers")
+    convert_parser.add_argument("output", help="Dossier de sortie")
+    benchmark_parser = commands.add_parser(
+        "benchmark", help="Compare la lecture GeoJSON et la lecture du stockage"
+    )
+    benchmark_parser.add_argument("inputs", nargs="+", help="Dossiers ou fichiers")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    if args.command == "convert":
+        store = convert(args.inputs, Path(args.output))
+        print(
+            f"✓ {len(store)} itinéraires ({store.n_points} points) enregistrés "
+            f"dans {store.store_dir}"
+        )
+        return 0
+
+    results = benchmark(args.inputs)
+    print(
+        f"{'format':<10} {'itinéraires':>12} {'points':>12} {'taille (Mo)':>12} "
+        f"{'lecture (s)':>12} {'longueurs (s)':>14}"
+    )
+    for name, r in results.items():
+        print(
+            f"{name:<10} {r['itineraires']:>12} {r['points']:>12} "
+            f"{r['taille_mo']:>12.2f} {r['lecture_s']:>12.3f} {r['longueurs_s']:>14.3f}"
+        )
+    if not all(r["cache_vide"] for r in results.values()):
+        print("(cache de pages non vidé : lectures depuis la mémoire possibles)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Empreintes des arrêts et POI d'une génération (Data Layer).
+
+À la fin de chaque génération, une empreinte (hachage 64 bits) de chaque arrêt
+et de chaque POI est enregistrée dans le dossier de sortie : identifiant,
+coordonnées et attributs repris dans les itinéraires. En mode incrémental, la
+comparaison avec ces empreintes indique les arrêts et POI ajoutés ou modifiés,
+dont seules les paires sont recalculées.
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from .config import ARRETS_COLUMNS, POI_COLUMNS, INPUT_SNAPSHOT_FILENAME
+
+logger = logging.getLogger(__name__)
+
+# Type d'entité -> (colonne identifiant, colonnes prises en compte)
+SNAPSHOT_COLUMNS = {
+    "arret": ("ArRId", ARRETS_COLUMNS),
+    "poi": ("id", POI_COLUMNS),
+}
+COORDINATE_COLUMNS = {"ArRLatitude", "ArRLongitude", "poi_lat", "poi_lon"}
+# Précision des coordonnées comparées (1e-7 degré ~ 1 cm)
+COORDINATE_DECIMALS = 7
+
+
+class InputSnapshot:
+    """Empreintes par arrêt et par POI, enregistrées entre deux générations."""
+
+    @staticmethod
+    def fingerprint_rows(df: pd.DataFrame, kind: str) -> pd.Series:
+        """
+        Calcule l'empreinte de chaque ligne.
+
+        Les coordonnées sont arrondies et toutes les colonnes comparées sous
+        forme de texte, pour ne pas dépendre des types de chargement
+        (float32/float64, catégories).
+
+        Args:
+            df: DataFrame des arrêts ou des POI
+            kind: "arret" ou "poi"
+
+        Returns:
+            Série d'empreintes uint64 indexée par identifiant (texte)
+        """
+        id_column, columns = SNAPSHOT_COLUMNS[kind]
+        normalised = pd.DataFrame(
+            {
+                column: (
+                    df[column].to_numpy(dtype=np.float64).round(COORDINATE_DECIMALS)
+                    if column in COORDINATE_COLUMNS
+                    else df[column].astype(str).to_numpy()
+                )
+                for column in columns
+                if column in df.columns
+            }
+        )
+        hashes = pd.util.hash_pandas_object(normalised, index=False).to_numpy()
+        return pd.Series(hashes, index=df[id_column].astype(str).to_numpy())
+
+    @staticmethod
+    def save(
+        output_folder: Path,
+        df_arrets: pd.DataFrame,
+        df_poi: pd.DataFrame,
+        merge: bool = False,
+    ) -> Path:
+        """
+        Enregistre les empreintes des arrêts et POI d'une génération.
+
+        Args:
+            output_folder: dossier de sortie
+            df_arrets: DataFrame des arrêts de la génération
+            df_poi: DataFrame des POI de la génération
+            merge: génération sur un périmètre partiel (communes) ; les
+                empreintes précédentes des arrêts hors du périmètre sont
+                conservées
+
+        Returns:
+            Path du fichier créé
+        """
+        frames = []
+        for kind, df in (("arret", df_arrets), ("poi", df_poi)):
+            hashes = InputSnapshot.fingerprint_rows(df, kind)
+            frames.append(
+                pd.DataFrame(
+                    {"type": kind, "id": hashes.index, "empreinte": hashes.to_numpy()}
+                )
+            )
+        previous = InputSnapshot.load(output_folder) if merge else None
+        if previous is not None and "arret" in previous:
+            before = previous["arret"]
+            kept = before[~before.index.isin(frames[0]["id"])]
+            frames.append(
+                pd.DataFrame(
+                    {"type": "arret", "id": kept.index, "empreinte": kept.to_numpy()}
+                )
+            )
+        path = Path(output_folder) / INPUT_SNAPSHOT_FILENAME
+        tmp = path.with_suffix(".tmp")
+        pd.concat(frames, ignore_index=True).to_parquet(tmp, index=False)
+        tmp.replace(path)
+        return path
+
+    @staticmethod
+    def load(output_folder: Path) -> Optional[Dict[str, pd.Series]]:
+        """
+        Relit les empreintes de la génération précédente.
+
+        Args:
+            output_folder: dossier de sortie
+
+        Returns:
+            Dictionnaire {"arret": série, "poi": série} d'empreintes indexées
+            par identifiant, ou None si aucune génération précédente
+        """
+        path = Path(output_folder) / INPUT_SNAPSHOT_FILENAME
+        if not path.exists():
+            return None
+        df = pd.read_parquet(path)
+        return {
+            kind: pd.Series(
+                group["empreinte"].to_numpy(), index=group["id"].astype(str).to_numpy()
+            )
+            for kind, group in df.groupby("type", observed=True)
+        }
+
+    @staticmethod
+    def changed_mask(
+        df: pd.DataFrame, kind: str, previous: Dict[str, pd.Series]
+    ) -> np.ndarray:
+        """
+        Repère les lignes ajoutées ou modifiées depuis la génération précédente.
+
+        Args:
+            df: DataFrame courant des arrêts ou des POI
+            kind: "arret" ou "poi"
+            previous: empreintes précédentes (cf. `load`)
+
+        Returns:
+            Masque booléen aligné sur les positions de df
+        """
+        current = InputSnapshot.fingerprint_rows(df, kind)
+        before = previous.get(kind, pd.Series(dtype=np.uint64))
+        before = before[~before.index.duplicated()]
+        known = before.reindex(current.index)
+        return (known.isna() | (known.to_numpy() != current.to_numpy())).to_numpy()
@@ -0,0 +1,246 @@
+"""
+Test de charge du service de requêtes (cf. query_service).
+
+Des clients asyncio à connexion persistante envoient un mélange de requêtes
+(par arrêt, par bbox, plus proches voisins) et le test rapporte le débit et
+les latences p50/p95/p99.
+
+Usage :
+    python -m itineraires_pietons.load_test --url http://127.0.0.1:8080 --requests 5000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import List, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+from .config import QUERY_SERVICE_HOST, QUERY_SERVICE_PORT
+
+# Part des requêtes par arrêt / bbox / plus proches voisins
+QUERY_MIX = {"arret": 0.7, "bbox": 0.15, "proches": 0.15}
+BBOX_HALF_SIZE_DEG = 0.005  # ~500 m
+
+
+class HttpConnection:
+    """Connexion HTTP/1.1 persistante minimale (GET uniquement)."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def get(self, target: str) -> Tuple[int, bytes]:
+        """
+        Envoie une requête GET et lit la réponse complète.
+
+        Returns:
+            Tuple (code HTTP, corps)
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        self.writer.write(
+            f"GET {target} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode("latin-1")
+        )
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if headers.get("transfer-encoding") == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                data = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                body += data[:-2]
+        else:
+            body = await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection") == "close":
+            await self.close()
+        return status, bytes(body)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def build_queries(
+    arret_ids: List[str], stats: dict, n: int, max_minutes: float, seed: int
+) -> List[str]:
+    """Tire `n` requêtes selon QUERY_MIX."""
+    rng = random.Random(seed)
+    min_lon, min_lat, max_lon, max_lat = stats.get("emprise") or (0, 0, 0, 0)
+    types = stats.get("types_poi") or []
+    queries = []
+    for _ in range(n):
+        kind = rng.choices(list(QUERY_MIX), weights=list(QUERY_MIX.values()))[0]
+        params = {"max_minutes": max_minutes}
+        if types and rng.random() < 0.3:
+            params["poi_type"] = rng.choice(types)
+        if kind == "arret" or not stats.get("emprise"):
+            params["arret_id"] = rng.choice(arret_ids)
+            path = "/itineraires"
+        else:
+            lon, lat = rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)
+            if kind == "bbox":
+                params["bbox"] = ",".join(
+                    f"{v:.6f}"
+                    for v in (
+                        lon - BBOX_HALF_SIZE_DEG,
+                        lat - BBOX_HALF_SIZE_DEG,
+                        lon + BBOX_HALF_SIZE_DEG,
+                        lat + BBOX_HALF_SIZE_DEG,
+                    )
+                )
+                path = "/itineraires/bbox"
+            else:
+                params.update(lon=f"{lon:.6f}", lat=f"{lat:.6f}", k=10)
+                path = "/itineraires/proches"
+        queries.append(f"{path}?{urlencode(params)}")
+    return queries
+
+
+async def run_load_test(
+    host: str,
+    port: int,
+    n_requests: int,
+    concurrency: int,
+    max_minutes: float,
+    seed: int = 0,
+) -> dict:
+    """
+    Exécute le test de charge.
+
+    Args:
+        host, port: adresse du service
+        n_requests: nombre total de requêtes
+        concurrency: nombre de connexions simultanées
+        max_minutes: durée de marche maximale demandée
+        seed: graine du tirage des requêtes
+
+    Returns:
+        Rapport (débit, latences en ms, erreurs, volume transféré)
+    """
+    setup = HttpConnection(host, port)
+    _, body = await setup.get("/arrets")
+    arret_ids = json.loads(body)
+    _, body = await setup.get("/stats")
+    stats = json.loads(body)
+    await setup.close()
+    if not arret_ids:
+        raise RuntimeError("Le service ne contient aucun itinéraire")
+
+    queue = asyncio.Queue()
+    for query in build_queries(arret_ids, stats, n_requests, max_minutes, seed):
+        queue.put_nowait(query)
+    latencies, errors, transferred = [], 0, 0
+
+    async def worker():
+        nonlocal errors, transferred
+        connection = HttpConnection(host, port)
+        while not queue.empty():
+            query = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                status, body = await connection.get(query)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors += 1
+                await connection.close()
+                continue
+            latencies.append(time.perf_counter() - start)
+            transferred += len(body)
+            if status != 200:
+                errors += 1
+        await connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0, 0, 0)
+    return {
+        "requetes": len(latencies),
+        "erreurs": errors,
+        "concurrence": concurrency,
+        "duree_s": round(elapsed, 2),
+        "requetes_par_s": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "max_ms": round(float(values.max()), 2) if len(values) else 0,
+        "octets_moyens": int(transferred / len(latencies)) if latencies else 0,
+    }
+
+
+def main():
+    """Point d'entrée du test de charge."""
+    parser = argparse.ArgumentParser(
+        description="Test de charge du service de requêtes d'itinéraires"
+    )
+    parser.add_argument(
+        "--url",
+        default=f"http://{QUERY_SERVICE_HOST}:{QUERY_SERVICE_PORT}",
+        help="URL du service (défaut: %(default)s)",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=2000, help="Nombre de requêtes (défaut: 2000)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="Connexions simultanées (défaut: 16)",
+    )
+    parser.add_argument(
+        "--max-minutes",
+        type=float,
+        default=10,
+        help="Durée de marche maximale demandée (défaut: 10)",
+    )
+    parser.add_argument("--json", action="store_true", help="Sortie JSON")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    report = asyncio.run(
+        run_load_test(
+            url.hostname,
+            url.port or 80,
+            args.requests,
+            args.concurrency,
+            args.max_minutes,
+        )
+    )
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(
+            f"{report['requetes']} requêtes en {report['duree_s']}s "
+            f"({report['requetes_par_s']} req/s, {report['erreurs']} erreurs, "
+            f"concurrence {report['concurrence']})\n"
+            f"latence p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms, "
+            f"p99 {report['p99_ms']} ms, max {report['max_ms']} ms"
+        )
+    return 0 if report["erreurs"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
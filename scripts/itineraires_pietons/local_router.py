@@ -0,0 +1,385 @@
+"""
+Routeur piéton local, alternative hors ligne à Valhalla (Business Logic Layer).
+
+Le réseau piéton est converti une fois pour toutes, depuis un GeoJSON de
+LineStrings (voies piétonnes extraites d'OSM, par ex. avec osmium ou ogr2ogr),
+en tableaux CSR compacts (.npz). Les points sont rattachés au nœud le plus proche
+par KDTree et le plus court chemin est calculé par Dijkstra (scipy) sur le
+sous-graphe contenu dans l'ellipse des chemins admissibles : un chemin de
+longueur L entre A et B reste dans le disque de rayon L/2 centré sur le milieu
+de [AB].
+
+Usage (construction du graphe) :
+    python -m itineraires_pietons.local_router reseau.geojson reseau_pieton.npz
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+from routingpy.direction import Direction
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from .config import (
+    LOCAL_GRAPH_PATH,
+    LOCAL_PROFILE_PREFIX,
+    LOCAL_WALKING_SPEEDS_KMH,
+    DEFAULT_ROUTING_PROFILE,
+    LOCAL_MAX_DETOUR,
+    LOCAL_MIN_SEARCH_RADIUS,
+)
+from .routing_service import RateLimiter, RoutingService
+from .spatial_service import SpatialService
+
+if TYPE_CHECKING:
+    from .route_cache import RouteCache
+
+logger = logging.getLogger(__name__)
+
+
+class PedestrianGraph:
+    """Graphe piéton non orienté au format CSR (longueurs d'arêtes en mètres)."""
+
+    def __init__(
+        self,
+        node_lat: np.ndarray,
+        node_lon: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+    ):
+        self.node_lat = node_lat
+        self.node_lon = node_lon
+        n = len(node_lat)
+        self.matrix = csr_matrix((weights, indices, indptr), shape=(n, n))
+        self.node_xy = SpatialService.project_to_metric(node_lat, node_lon)
+        self.tree = cKDTree(self.node_xy)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_lat)
+
+    @classmethod
+    def from_geojson(cls, path: str) -> "PedestrianGraph":
+        """
+        Construit le graphe depuis un GeoJSON de LineStrings / MultiLineStrings.
+
+        Les sommets identiques (à 1e-7 degré près) sont fusionnés en nœuds ;
+        chaque segment devient une arête dans les deux sens.
+
+        Args:
+            path: chemin du fichier GeoJSON
+
+        Returns:
+            Graphe piéton
+        """
+        with open(path, encoding="utf-8") as f:
+            features = json.load(f)["features"]
+
+        lines = []
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "LineString":
+                lines.append(geometry["coordinates"])
+            elif geometry.get("type") == "MultiLineString":
+                lines.extend(geometry["coordinates"])
+        lines = [np.asarray(line, dtype=np.float64)[:, :2] for line in lines]
+        lines = [line for line in lines if len(line) >= 2]
+        if not lines:
+            raise ValueError(f"Aucune LineString exploitable dans {path}")
+
+        coords = np.concatenate(lines)
+        lengths = np.array([len(line) for line in lines])
+        # Un segment relie chaque sommet au suivant, sauf en fin de ligne
+        ends = np.cumsum(lengths) - 1
+        seg_start = np.setdiff1d(np.arange(len(coords) - 1), ends)
+
+        quantised = np.round(coords * 1e7).astype(np.int64)
+        _, first, vertex_node = np.unique(
+            quantised, axis=0, return_index=True, return_inverse=True
+        )
+        vertex_node = vertex_node.ravel()
+        node_lon, node_lat = coords[first, 0], coords[first, 1]
+
+        u = vertex_node[seg_start]
+        v = vertex_node[seg_start + 1]
+        w = SpatialService.haversine_vectorized(
+            node_lat[u], node_lon[u], node_lat[v], node_lon[v]
+        )
+        keep = u != v
+        u, v, w = u[keep], v[keep], w[keep]
+
+        # Arêtes dans les deux sens, en gardant la plus courte des arêtes parallèles
+        src = np.concatenate([u, v])
+        dst = np.concatenate([v, u])
+        w = np.concatenate([w, w])
+        order = np.lexsort((w, dst, src))
+        src, dst, w = src[order], dst[order], w[order]
+        first_edge = np.ones(len(src), dtype=bool)
+        first_edge[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        src, dst, w = src[first_edge], dst[first_edge], w[first_edge]
+
+        indptr = np.zeros(len(node_lat) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(node_lat)), out=indptr[1:])
+
+        graph = cls(
+            node_lat, node_lon, indptr, dst.astype(np.int32), w.astype(np.float32)
+        )
+        logger.info(
+            f"Graphe piéton construit : {graph.n_nodes} nœuds, {len(dst)} arêtes"
+        )
+        return graph
+
+    def save(self, path: Path):
+        """Enregistre le graphe au format .npz (tableaux CSR)."""
+        np.savez(
+            path,
+            node_lat=self.node_lat,
+            node_lon=self.node_lon,
+            indptr=self.matrix.indptr,
+            indices=self.matrix.indices,
+            weights=self.matrix.data,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "PedestrianGraph":
+        """Charge un graphe enregistré avec `save`."""
+        with np.load(path) as data:
+            return cls(
+                data["node_lat"],
+                data["node_lon"],
+                data["indptr"],
+                data["indices"],
+                data["weights"],
+            )
+
+    def snap(self, point: tuple) -> Tuple[int, float]:
+        """
+        Rattache un point (lon, lat) au nœud le plus proche.
+
+        Returns:
+            Tuple (indice du nœud, distance de rattachement en mètres)
+        """
+        xy = SpatialService.project_to_metric(
+            np.array([point[1]]), np.array([point[0]])
+        )[0]
+        dist, node = self.tree.query(xy)
+        return int(node), float(dist)
+
+    def subgraph(self, center: np.ndarray, radius: float) -> np.ndarray:
+        """Indices des nœuds situés dans le disque (centre projeté, rayon en m)."""
+        nodes = self.tree.query_ball_point(center, r=radius, return_sorted=True)
+        return np.asarray(nodes, dtype=np.int64)
+
+    def shortest_path(
+        self, source: int, target: int, max_length: float
+    ) -> Optional[Tuple[np.ndarray, float]]:
+        """
+        Plus court chemin entre deux nœuds, limité à `max_length` mètres.
+
+        Args:
+            source: nœud de départ
+            target: nœud d'arrivée
+            max_length: longueur maximale admise (m)
+
+        Returns:
+            Tuple (nœuds du chemin, longueur en mètres), ou None si aucun chemin
+        """
+        if source == target:
+            return np.array([source]), 0.0
+
+        center = (self.node_xy[source] + self.node_xy[target]) / 2
+        nodes = self.subgraph(center, max_length / 2)
+        local_source, local_target = np.searchsorted(nodes, [source, target])
+        if (
+            local_source >= len(nodes)
+            or local_target >= len(nodes)
+            or nodes[local_source] != source
+            or nodes[local_target] != target
+        ):
+            return None
+
+        sub = self.matrix[nodes][:, nodes]
+        dist, pred = dijkstra(
+            sub,
+            directed=True,
+            indices=local_source,
+            return_predecessors=True,
+            limit=max_length,
+        )
+        if not np.isfinite(dist[local_target]):
+            return None
+
+        path = [local_target]
+        while path[-1] != local_source:
+            path.append(pred[path[-1]])
+        return nodes[np.array(path[::-1])], float(dist[local_target])
+
+    def distances_from(
+        self, source: int, targets: np.ndarray, max_length: float
+    ) -> np.ndarray:
+        """
+        Longueurs des plus courts chemins d'un nœud vers plusieurs nœuds
+        (un seul Dijkstra sur le disque de rayon `max_length`).
+
+        Args:
+            source: nœud de départ
+            targets: nœuds d'arrivée
+            max_length: longueur maximale admise (m)
+
+        Returns:
+            Longueurs en mètres (inf si pas de chemin dans la limite)
+        """
+        nodes = self.subgraph(self.node_xy[source], max_length)
+        local = np.searchsorted(nodes, targets).clip(max=len(nodes) - 1)
+        reachable = nodes[local] == targets
+        lengths = np.full(len(targets), np.inf)
+
+        sub = self.matrix[nodes][:, nodes]
+        dist = dijkstra(
+            sub,
+            directed=True,
+            indices=int(np.searchsorted(nodes, source)),
+            limit=max_length,
+        )
+        lengths[reachable] = dist[local[reachable]]
+        return lengths
+
+
+class LocalRoutingService(RoutingService):
+    """Service de routing piéton hors ligne sur un graphe local."""
+
+    def __init__(
+        self,
+        graph_path: Optional[Path] = None,
+        cache: Optional["RouteCache"] = None,
+    ):
+        """
+        Initialise le routeur local.
+
+        Args:
+            graph_path: graphe piéton .npz (cf. `PedestrianGraph.save`)
+            cache: cache persistant des itinéraires (optionnel)
+        """
+        graph_path = Path(graph_path or LOCAL_GRAPH_PATH)
+        if not graph_path.exists():
+            raise FileNotFoundError(f"Graphe piéton introuvable : {graph_path}")
+        self.set_profile(DEFAULT_ROUTING_PROFILE)
+        self.cache = cache
+        self.rate_limiter = RateLimiter()
+        self.requests = Counter()
+        self._requests_lock = threading.Lock()
+        self.graph = PedestrianGraph.load(graph_path)
+        logger.info(f"Service de routing local initialisé ({self.graph.n_nodes} nœuds)")
+
+    def set_profile(self, name: str):
+        """
+        Sélectionne le profil de routing : sur le graphe local, seule la
+        vitesse de marche change (LOCAL_WALKING_SPEEDS_KMH).
+        """
+        if name not in LOCAL_WALKING_SPEEDS_KMH:
+            raise ValueError(
+                f"Profil non disponible avec le routeur local : {name} "
+                f"(profils disponibles : {', '.join(LOCAL_WALKING_SPEEDS_KMH)})"
+            )
+        self.profile_name = name
+        self.costing_options = {}
+        self.profile = f"{LOCAL_PROFILE_PREFIX}{name}"
+        self.speed_ms = LOCAL_WALKING_SPEEDS_KMH[name] / 3.6
+
+    def _fetch_route(self, origin: tuple, destination: tuple):
+        """Calcule l'itinéraire sur le graphe local (None si pas de chemin)."""
+        source, snap_origin = self.graph.snap(origin)
+        target, snap_destination = self.graph.snap(destination)
+
+        crow = SpatialService.haversine_vectorized(
+            origin[1], origin[0], np.array([destination[1]]), np.array([destination[0]])
+        )[0]
+        max_length = max(LOCAL_MAX_DETOUR * crow, LOCAL_MIN_SEARCH_RADIUS)
+        result = self.graph.shortest_path(source, target, max_length)
+        if result is None:
+            return None
+        nodes, length = result
+
+        geometry = [[float(origin[0]), float(origin[1])]]
+        geometry += np.column_stack(
+            [self.graph.node_lon[nodes], self.graph.node_lat[nodes]]
+        ).tolist()
+        geometry.append([float(destination[0]), float(destination[1])])
+
+        distance = length + snap_origin + snap_destination
+        return Direction(
+            geometry=geometry,
+            duration=round(distance / self.speed_ms),
+            distance=round(distance),
+        )
+
+    def _fetch_matrix(
+        self, origin: tuple, destinations: List[tuple]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Distances et durées depuis l'origine sur le graphe local (NaN si pas de chemin)."""
+        destinations = np.asarray(destinations, dtype=np.float64)
+        source, snap_origin = self.graph.snap(origin)
+        dest_xy = SpatialService.project_to_metric(
+            destinations[:, 1], destinations[:, 0]
+        )
+        snap_destinations, targets = self.graph.tree.query(dest_xy)
+
+        crow = SpatialService.haversine_vectorized(
+            origin[1], origin[0], destinations[:, 1], destinations[:, 0]
+        )
+        max_length = max(LOCAL_MAX_DETOUR * float(crow.max()), LOCAL_MIN_SEARCH_RADIUS)
+        lengths = self.graph.distances_from(source, targets, max_length)
+
+        distances = np.round(lengths + snap_origin + snap_destinations)
+        distances[~np.isfinite(distances)] = np.nan
+        durations = np.round(distances / self.speed_ms)
+        return distances, durations
+
+    def reachable_mask(
+        self, origin: tuple, destinations: List[tuple], max_duration: float
+    ) -> Optional[np.ndarray]:
+        """
+        Destinations atteignables en `max_duration` secondes sur le graphe local.
+
+        Le Dijkstra depuis l'origine donne directement la durée de marche vers
+        chaque destination : pas de polygone d'isochrone à construire.
+        """
+        matrix = self.calculate_matrix(origin, destinations)
+        if matrix is None:
+            return None
+        _, durations = matrix
+        return durations <= max_duration
+
+
+def main():
+    """Construit le graphe piéton .npz depuis un GeoJSON de voies piétonnes."""
+    parser = argparse.ArgumentParser(
+        description="Conversion d'un réseau piéton GeoJSON en graphe CSR (.npz)"
+    )
+    parser.add_argument("source", help="GeoJSON des voies piétonnes (LineStrings)")
+    parser.add_argument(
+        "output",
+        nargs="?",
+        default=str(LOCAL_GRAPH_PATH),
+        help=f"Fichier .npz de sortie (défaut: {LOCAL_GRAPH_PATH})",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    graph = PedestrianGraph.from_geojson(args.source)
+    graph.save(args.output)
+    print(f"✓ Graphe enregistré dans {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,17 +2,39 @@
 Orchestrateur principal - coordonne les différents services (Application Layer).
 """
 
-import random
 import logging
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
 from tqdm import tqdm
 
 from .data_loader import DataLoader
 from .spatial_service import SpatialService
+from .stop_areas import StopAreaService
 from .routing_service import RoutingService
+from .local_router import LocalRoutingService
 from .export_service import ExportService
-from .config import OUTPUT_DIR, MAX_DISTANCE
+from .geometry_reduction import GeometryReducer
+from .route_cache import RouteCache
+from .run_manifest import RunManifest
+from .input_snapshot import InputSnapshot
+from .prepared_index import PreparedIndex
+from .run_metrics import get_run_metrics, measure_stage, new_run_metrics
+from .config import (
+    OUTPUT_DIR,
+    DEFAULT_POI_PATH,
+    MAX_DISTANCE,
+    DEFAULT_OUTPUT_FORMAT,
+    DEFAULT_ROUTER,
+    VALHALLA_CONCURRENCY,
+    VALHALLA_RATE_LIMIT,
+    BATCH_GEOMETRY_MAX_MINUTES,
+    STOP_AREA_RADIUS,
+    RUN_REPORT_FILENAME,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,17 +42,310 @@ logger = logging.getLogger(__name__)
 class ItineraryOrchestrator:
     """Orchestre la génération complète des itinéraires piétons."""
 
-    def __init__(self, valhalla_url: Optional[str] = None):
+    def __init__(
+        self,
+        valhalla_url: Optional[str] = None,
+        concurrency: int = VALHALLA_CONCURRENCY,
+        rate_limit: Optional[float] = VALHALLA_RATE_LIMIT,
+        cache_path: Optional[Path] = None,
+        index_dir: Optional[Path] = None,
+        poi_parquet_cache: bool = False,
+        router: str = DEFAULT_ROUTER,
+        graph_path: Optional[Path] = None,
+        batch_matrix: bool = False,
+        geometry_max_minutes: float = BATCH_GEOMETRY_MAX_MINUTES,
+        cluster_stops: bool = False,
+        stop_area_radius: float = STOP_AREA_RADIUS,
+        isochrone_minutes: Optional[float] = None,
+        simplify_tolerance: Optional[float] = None,
+        coordinate_precision: Optional[int] = None,
+        polyline: bool = False,
+        compact_json: bool = False,
+        profile: bool = False,
+        prometheus_path: Optional[Path] = None,
+    ):
         """
         Initialise l'orchestrateur.
 
         Args:
             valhalla_url: URL du serveur Valhalla (optionnel)
+            concurrency: nombre maximal de requêtes Valhalla simultanées
+            rate_limit: nombre maximal de requêtes Valhalla par seconde (optionnel)
+            cache_path: fichier SQLite du cache d'itinéraires (None = sans cache)
+            index_dir: dossier des index préparés POI/arrêts (None = chargement
+                direct des sources à chaque exécution)
+            poi_parquet_cache: convertit le CSV des POI en parquet partitionné
+                par type (une seule fois) et lit cette copie
+            router: moteur de routing ("valhalla" ou "local")
+            graph_path: graphe piéton .npz du routeur local (optionnel)
+            batch_matrix: mode groupé par arrêt (une matrice par arrêt, tracé
+                seulement pour les POI proches)
+            geometry_max_minutes: en mode groupé, temps de marche (min) au-delà
+                duquel le tracé n'est pas calculé
+            cluster_stops: regroupe les arrêts d'une même gare en zones d'arrêt
+                (un seul itinéraire par zone et par POI, recopié pour chaque arrêt)
+            stop_area_radius: distance maximale entre arrêts d'une zone (m)
+            isochrone_minutes: budget de marche (min) ; une isochrone par arrêt
+                (ou zone d'arrêt) et seuls les POI qu'elle contient sont routés
+                (None = tous les POI du rayon)
+            simplify_tolerance: tolérance (m) de simplification des tracés
+                exportés par Douglas-Peucker (None = tracés inchangés)
+            coordinate_precision: décimales conservées dans les coordonnées
+                exportées (None = précision de Valhalla)
+            polyline: exporte les tracés en polyline encodée (propriété
+                "polyline") au lieu de coordonnées GeoJSON
+            compact_json: fichiers GeoJSON sans indentation
+            profile: profile les étapes avec cProfile et tracemalloc
+            prometheus_path: fichier texte Prometheus des métriques (optionnel)
         """
-        self.routing_service = RoutingService(valhalla_url)
+        self.index_dir = index_dir
+        self.poi_parquet_cache = poi_parquet_cache
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.batch_matrix = batch_matrix
+        self.geometry_max_minutes = geometry_max_minutes
+        self.cluster_stops = cluster_stops
+        self.stop_area_radius = stop_area_radius
+        self.isochrone_minutes = isochrone_minutes
+        self.compact_json = compact_json
+        self.geometry_reducer = None
+        if simplify_tolerance or coordinate_precision is not None or polyline:
+            self.geometry_reducer = GeometryReducer(
+                tolerance_m=simplify_tolerance,
+                precision=coordinate_precision,
+                encoding="polyline" if polyline else "geojson",
+            )
+        self.profile = profile
+        self.prometheus_path = prometheus_path
+        self.route_cache = RouteCache(cache_path) if cache_path else None
+        if router == "local":
+            self.routing_service = LocalRoutingService(
+                graph_path, cache=self.route_cache
+            )
+        else:
+            self.routing_service = RoutingService(valhalla_url, cache=self.route_cache)
         self.spatial_service = SpatialService()
         self.export_service = ExportService()
 
+    @staticmethod
+    def load_inputs(
+        poi_path: Optional[str] = None,
+        arrets_path: Optional[str] = None,
+        communes: Optional[list] = None,
+        index_dir: Optional[Path] = None,
+        poi_parquet_cache: bool = False,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, Optional[cKDTree]]:
+        """
+        Charge les POI et les arrêts, depuis l'index préparé si possible.
+
+        Args:
+            poi_path: chemin vers le fichier POI
+            arrets_path: chemin vers le fichier arrêts
+            communes: liste de codes INSEE de communes à filtrer (optionnel)
+            index_dir: dossier des index préparés (None = sources lues directement)
+            poi_parquet_cache: lit les POI depuis leur copie parquet partitionnée
+
+        Returns:
+            Tuple (df_poi, df_arrets, KDTree des POI ou None)
+        """
+        if communes:
+            logger.info(f"Filtrage des arrêts pour les communes: {communes}")
+        if poi_parquet_cache:
+            poi_path = DataLoader.convert_poi_to_parquet(poi_path or DEFAULT_POI_PATH)
+
+        if index_dir:
+            index = PreparedIndex.load_or_build(poi_path, arrets_path, index_dir)
+            df_arrets = index.df_arrets
+            if communes:
+                df_arrets = DataLoader.filter_communes(df_arrets, communes)
+            return index.df_poi, df_arrets, index.poi_tree
+
+        # Filtres type d'arrêt / communes appliqués à la lecture du parquet
+        df_poi, df_arrets = DataLoader.load_data(poi_path, arrets_path, communes)
+        return df_poi, df_arrets, None
+
+    @staticmethod
+    def build_pair_table(
+        arret_idx: np.ndarray,
+        poi_idx: np.ndarray,
+        distances: np.ndarray,
+        df_arrets: pd.DataFrame,
+        df_poi: pd.DataFrame,
+    ) -> pd.DataFrame:
+        """
+        Construit la table des paires jointe aux attributs des arrêts et des POI.
+
+        Les attributs sont récupérés par position (`take`) à partir des tableaux
+        renvoyés par la recherche spatiale : aucun filtrage des DataFrames par
+        identifiant n'est nécessaire.
+
+        Args:
+            arret_idx: positions des arrêts dans df_arrets
+            poi_idx: positions des POI dans df_poi
+            distances: distances à vol d'oiseau (m)
+            df_arrets: DataFrame des arrêts
+            df_poi: DataFrame des POI
+
+        Returns:
+            DataFrame avec une ligne par paire : colonnes arrêt, colonnes POI
+            et colonne "distance" (m)
+        """
+        arrets = df_arrets.take(arret_idx).reset_index(drop=True)
+        pois = df_poi.take(poi_idx).reset_index(drop=True)
+        df_pairs = pd.concat([arrets, pois], axis=1)
+        df_pairs["distance"] = distances
+        return df_pairs
+
+    def _filter_by_isochrone(
+        self,
+        routing_service: RoutingService,
+        origin_idx: np.ndarray,
+        poi_idx: np.ndarray,
+        df_origins: pd.DataFrame,
+        df_poi: pd.DataFrame,
+    ) -> np.ndarray:
+        """
+        Garde les paires dont le POI est dans l'isochrone de marche de l'origine.
+
+        Une isochrone est demandée par origine (arrêt ou zone d'arrêt) et tous
+        ses POI candidats y sont classés d'un coup : un seul appel remplace les
+        itinéraires vers les POI proches à vol d'oiseau mais longs à rejoindre
+        (voies ferrées, cours d'eau, emprises closes). En cas d'erreur, les
+        paires de l'origine sont conservées.
+
+        Args:
+            routing_service: service de routing (profil) des isochrones
+            origin_idx: positions des origines dans df_origins, groupées
+            poi_idx: positions des POI dans df_poi
+            df_origins: DataFrame des arrêts ou des zones d'arrêt
+            df_poi: DataFrame des POI
+
+        Returns:
+            Masque booléen des paires à router
+        """
+        if len(origin_idx) == 0:
+            return np.ones(0, dtype=bool)
+        starts = np.flatnonzero(np.r_[True, origin_idx[1:] != origin_idx[:-1]])
+        ends = np.append(starts[1:], len(origin_idx))
+        origin_lon = df_origins["ArRLongitude"].to_numpy(dtype=np.float64)
+        origin_lat = df_origins["ArRLatitude"].to_numpy(dtype=np.float64)
+        poi_lon = df_poi["poi_lon"].to_numpy(dtype=np.float64)
+        poi_lat = df_poi["poi_lat"].to_numpy(dtype=np.float64)
+
+        # POI distincts par origine (les arrêts d'une zone partagent leurs POI)
+        groups = [
+            np.unique(poi_idx[s:e], return_inverse=True) for s, e in zip(starts, ends)
+        ]
+        requests = (
+            (
+                (origin_lon[origin_idx[s]], origin_lat[origin_idx[s]]),
+                np.column_stack([poi_lon[pois], poi_lat[pois]]).tolist(),
+            )
+            for s, (pois, _) in zip(starts, groups)
+        )
+        masks = routing_service.calculate_reachable(
+            requests,
+            self.isochrone_minutes * 60,
+            concurrency=self.concurrency,
+            rate_limit=self.rate_limit,
+        )
+
+        keep = np.ones(len(origin_idx), dtype=bool)
+        with measure_stage("isochrones"):
+            for s, e, (_, inverse), mask in tqdm(
+                zip(starts, ends, groups, masks),
+                total=len(starts),
+                desc="Isochrones",
+            ):
+                if mask is not None:
+                    keep[s:e] = mask[inverse]
+        logger.info(
+            f"Isochrones de {self.isochrone_minutes:g} min : {int(keep.sum())} paires "
+            f"sur {len(keep)} conservées pour {len(starts)} origines"
+        )
+        return keep
+
+    def _apply_input_changes(
+        self,
+        previous: dict,
+        keys: pd.MultiIndex,
+        arret_idx: np.ndarray,
+        poi_idx: np.ndarray,
+        df_arrets: pd.DataFrame,
+        df_poi: pd.DataFrame,
+        zone_of: Optional[np.ndarray],
+        manifest: RunManifest,
+        output_format: str,
+        output_folder: Path,
+        source_stop_ids: Optional[Set[str]] = None,
+    ) -> np.ndarray:
+        """
+        Applique les changements d'entrées depuis la génération précédente.
+
+        Les paires dont l'arrêt ou le POI a été ajouté ou modifié sont à
+        recalculer ; les sorties des paires disparues (arrêt ou POI supprimé,
+        déplacé hors du rayon) ou à recalculer sont supprimées, et le journal
+        est compacté en conséquence. Avec un périmètre partiel (communes ou
+        arrêts choisis), les paires des arrêts hors du périmètre mais toujours
+        présents dans la source sont conservées telles quelles ; seuls les
+        arrêts absents de la source sont considérés comme supprimés.
+
+        Args:
+            previous: empreintes de la génération précédente
+            keys: paires courantes (arret_id, poi_id)
+            arret_idx: positions des arrêts des paires dans df_arrets
+            poi_idx: positions des POI des paires dans df_poi
+            df_arrets: DataFrame des arrêts
+            df_poi: DataFrame des POI
+            zone_of: zone d'arrêt de chaque arrêt (regroupement), ou None
+            manifest: journal d'exécution (ouvert en reprise)
+            output_format: format de la sortie existante
+            output_folder: dossier de sortie
+            source_stop_ids: identifiants des arrêts de la source complète si
+                le périmètre est partiel (None = périmètre complet)
+
+        Returns:
+            Masque des paires courantes touchées par un changement
+        """
+        changed_arrets = InputSnapshot.changed_mask(df_arrets, "arret", previous)
+        changed_poi = InputSnapshot.changed_mask(df_poi, "poi", previous)
+        if zone_of is not None:
+            # L'origine d'une zone dépend de tous ses membres
+            changed_arrets = np.isin(zone_of, zone_of[changed_arrets])
+        affected = changed_arrets[arret_idx] | changed_poi[poi_idx]
+
+        # Une sortie reste valable si sa paire existe toujours et n'a pas changé
+        done = manifest.done_pairs()
+        valid = set(keys[~affected]) & done
+        out_of_scope = set()
+        if source_stop_ids is not None:
+            in_scope = set(df_arrets["ArRId"].astype(str))
+            out_of_scope = {
+                key
+                for key in done - valid
+                if key[0] not in in_scope and key[0] in source_stop_ids
+            }
+            valid |= out_of_scope
+        removed = {key: manifest.entries[key].get("output") for key in done - valid}
+        in_use = {manifest.entries[key].get("output") for key in valid}
+        relocated = self.export_service.remove_outputs(
+            output_format, output_folder, removed, in_use
+        )
+        manifest.compact(removed, relocated)
+
+        logger.info(
+            f"Génération incrémentale : {int(changed_arrets.sum())} arrêts et "
+            f"{int(changed_poi.sum())} POI ajoutés ou modifiés, "
+            f"{int(affected.sum())} paires à recalculer, "
+            f"{len(removed)} sorties obsolètes supprimées"
+            + (
+                f", {len(out_of_scope)} sorties hors du périmètre conservées"
+                if source_stop_ids is not None
+                else ""
+            )
+        )
+        return affected
+
     def generate_itineraries(
         self,
         poi_path: Optional[str] = None,
@@ -39,6 +354,13 @@ class ItineraryOrchestrator:
         max_distance: float = MAX_DISTANCE,
         limit: Optional[int] = None,
         communes: Optional[list] = None,
+        resume: bool = False,
+        output_format: str = DEFAULT_OUTPUT_FORMAT,
+        incremental: bool = False,
+        stop_ids: Optional[list] = None,
+        max_per_type: Optional[int] = None,
+        radii: Optional[List[float]] = None,
+        routing_profiles: Optional[List[str]] = None,
     ) -> int:
         """
         Pipeline complet de génération des itinéraires.
@@ -50,74 +372,403 @@ class ItineraryOrchestrator:
             max_distance: rayon de recherche (m)
             limit: limite du nombre d'itinéraires à générer (pour tests)
             communes: liste de codes INSEE de communes à filtrer (optionnel)
+            resume: reprend une génération interrompue à partir du journal du
+                dossier de sortie (les paires terminées sont ignorées, celles en
+                échec sont retentées)
+            output_format: format de sortie ("geojson", "ndjson", "parquet" ou
+                "geostore")
+            incremental: ne recalcule que les paires dont l'arrêt ou le POI a
+                été ajouté ou modifié depuis la génération précédente du dossier
+                de sortie, et supprime les sorties devenues obsolètes
+            stop_ids: identifiants (ArRId) des seuls arrêts à traiter, par
+                exemple ceux d'un shard (optionnel)
+            max_per_type: ne route, pour chaque arrêt (ou zone d'arrêt), que
+                les `max_per_type` POI les plus proches de chaque type_lieu du
+                rayon (None = tous les POI du rayon)
+            radii: rayons (m) à comparer ; la recherche spatiale est faite une
+                fois au plus grand (qui remplace max_distance) et chaque paire
+                reçoit la propriété "rayon", plus petit rayon qui la contient
+            routing_profiles: profils de routing (cf. ROUTING_PROFILES) ; chaque
+                itinéraire est calculé une fois par profil, dans le sous-dossier
+                du profil s'il y en a plusieurs (None = profil par défaut)
 
         Returns:
-            Nombre d'itinéraires générés
+            Nombre d'itinéraires générés (tous profils confondus)
         """
         logger.info("=== Démarrage de la génération des itinéraires ===")
+        metrics = new_run_metrics(profile=self.profile)
+        self.routing_service.requests.clear()
+        # Un service par profil (validé avant tout chargement)
+        routing_services = {
+            name: (
+                self.routing_service
+                if name == self.routing_service.profile_name
+                else self.routing_service.with_profile(name)
+            )
+            for name in routing_profiles or [self.routing_service.profile_name]
+        }
+        if radii:
+            radii = sorted(set(radii))
+            max_distance = radii[-1]
 
         # 1. Chargement des données
-        df_poi, df_arrets = DataLoader.load_data(poi_path, arrets_path)
-
-        # 1b. Filtrage par communes si spécifié
-        if communes:
-            logger.info(f"Filtrage des arrêts pour les communes: {communes}")
-            # Convertir INSEE_COM en string pour la comparaison
-            df_arrets["INSEE_COM"] = df_arrets["INSEE_COM"].astype(str)
-            communes_str = [str(c) for c in communes]
-            df_arrets = df_arrets[df_arrets["INSEE_COM"].isin(communes_str)]
-            logger.info(f"{len(df_arrets)} arrêts après filtrage par communes")
+        df_poi, df_arrets, poi_tree = self.load_inputs(
+            poi_path, arrets_path, communes, self.index_dir, self.poi_parquet_cache
+        )
+        if stop_ids is not None:
+            stop_ids = [str(stop_id) for stop_id in stop_ids]
+            df_arrets = df_arrets[df_arrets["ArRId"].astype(str).isin(stop_ids)]
 
-            if len(df_arrets) == 0:
-                logger.warning(f"Aucun arrêt trouvé pour les communes: {communes}")
-                return 0
+        if communes and len(df_arrets) == 0:
+            logger.warning(f"Aucun arrêt trouvé pour les communes: {communes}")
+            return 0
 
-        # 2. Recherche spatiale
-        pairs = self.spatial_service.find_nearby_pois(df_arrets, df_poi, max_distance)
+        # 2. Recherche spatiale (depuis les zones d'arrêt si regroupement)
+        if self.cluster_stops:
+            df_zones, zone_of = StopAreaService.build_stop_areas(
+                df_arrets, self.stop_area_radius
+            )
+            # Rayon élargi : couvre les POI de chaque arrêt membre de la zone
+            zone_idx, poi_idx, _ = self.spatial_service.find_nearby_pairs(
+                df_zones,
+                df_poi,
+                max_distance + float(df_zones["rayon_zone"].max()),
+                poi_tree=poi_tree,
+            )
+            arret_idx, poi_idx, distances, origin_idx = StopAreaService.expand_pairs(
+                zone_idx,
+                poi_idx,
+                zone_of,
+                df_arrets,
+                df_poi,
+                max_distance,
+                max_per_type,
+            )
+            df_origins = df_zones
+        else:
+            arret_idx, poi_idx, distances = self.spatial_service.find_nearby_pairs(
+                df_arrets,
+                df_poi,
+                max_distance,
+                poi_tree=poi_tree,
+                max_per_type=max_per_type,
+            )
+            origin_idx, df_origins = arret_idx, df_arrets
 
-        if not pairs:
+        if len(distances) == 0:
             logger.warning("Aucune paire arrêt-POI trouvée dans le rayon spécifié")
             return 0
 
-        # 3. Génération des itinéraires
-        output_folder = output_folder or OUTPUT_DIR
-        pairs_to_process = random.sample(pairs, limit) if limit else pairs
+        # 3. Génération des itinéraires, une fois par profil de routing
+        output_folder = Path(output_folder or OUTPUT_DIR)
+        if self.cluster_stops:
+            StopAreaService.save_stop_areas(df_arrets, df_zones, zone_of, output_folder)
 
-        generated_count = 0
-        for arret_id, poi_id, distance in tqdm(
-            pairs_to_process, desc="Calcul des itinéraires"
-        ):
-            try:
-                arret = df_arrets[df_arrets["ArRId"] == arret_id].iloc[0]
-                poi = df_poi[df_poi["id"] == poi_id].iloc[0]
-
-                # Coordonnées pour Valhalla (lon, lat)
-                origin = (arret["ArRLongitude"], arret["ArRLatitude"])
-                destination = (poi["poi_lon"], poi["poi_lat"])
-
-                # Calcul de l'itinéraire
-                route = self.routing_service.calculate_route(origin, destination)
-                if route is None:
-                    continue
-
-                # Création de la feature GeoJSON
-                feature = self.export_service.create_geojson_feature(
-                    route, arret, poi, distance
+        pairs = {
+            "arret_idx": arret_idx,
+            "poi_idx": poi_idx,
+            "distances": distances,
+            "origin_idx": origin_idx,
+        }
+        if radii:
+            # Plus petit rayon contenant chaque paire (les rayons sont emboîtés)
+            bands = np.asarray(radii)
+            if np.all(bands == np.round(bands)):
+                bands = bands.astype(np.int64)
+            band_idx = np.searchsorted(bands, distances, side="left")
+            pairs["rayon"] = bands[np.minimum(band_idx, len(bands) - 1)]
+            per_radius = {
+                str(radius): int(count)
+                for radius, count in zip(
+                    bands,
+                    np.cumsum(np.bincount(band_idx, minlength=len(bands)))[
+                        : len(bands)
+                    ],
                 )
+            }
+            logger.info(
+                "Paires par rayon : "
+                + ", ".join(f"{r} m : {n}" for r, n in per_radius.items())
+            )
+            metrics.set_value("paires_par_rayon", per_radius)
 
-                # Génération du nom de fichier et sauvegarde
-                filename = self.export_service.generate_filename(arret, poi)
-                self.export_service.save_geojson(feature, filename, output_folder)
-
-                generated_count += 1
+        # Périmètre partiel : ce qui n'est pas chargé n'est pas pour autant supprimé
+        source_stop_ids = (
+            DataLoader.load_stop_ids(arrets_path)
+            if communes or stop_ids is not None
+            else None
+        )
+        generated_count = 0
+        stats_by_profile = {}
+        for name, routing_service in routing_services.items():
+            folder = (
+                output_folder if len(routing_services) == 1 else output_folder / name
+            )
+            stats = self._generate_for_profile(
+                routing_service,
+                folder,
+                pairs,
+                df_arrets,
+                df_poi,
+                df_origins,
+                zone_of if self.cluster_stops else None,
+                limit,
+                resume,
+                output_format,
+                incremental,
+                source_stop_ids,
+            )
+            stats_by_profile[name] = stats
+            generated_count += stats["itineraires_generes"]
 
-            except Exception as e:
-                logger.error(
-                    f"Erreur lors du traitement de la paire {arret_id}-{poi_id}: {e}"
-                )
-                continue
+        if self.route_cache is not None:
+            self.route_cache.flush()
+            logger.info(f"Cache d'itinéraires : {self.route_cache.stats()}")
+        if self.geometry_reducer is not None:
+            reduction = self.geometry_reducer.report()
+            logger.info(
+                f"Réduction des géométries : {reduction['points_avant']} -> "
+                f"{reduction['points_apres']} points "
+                f"(-{reduction['reduction_points_pct']} %), "
+                f"{reduction['octets_avant']} -> {reduction['octets_apres']} octets "
+                f"de coordonnées (-{reduction['reduction_octets_pct']} %)"
+            )
+            metrics.set_value("reduction_geometrie", reduction)
 
+        if len(routing_services) == 1:
+            for key, value in stats.items():
+                metrics.set_value(key, value)
+        else:
+            metrics.set_value("itineraires_generes", generated_count)
+            metrics.set_value("profils", stats_by_profile)
+        metrics.set_value("concurrence", self.concurrency)
+        if self.route_cache is not None:
+            metrics.set_value("cache", self.route_cache.stats())
+        report_path = metrics.write_report(output_folder / RUN_REPORT_FILENAME)
+        logger.info(f"Rapport d'exécution : {report_path}")
+        if self.prometheus_path:
+            metrics.write_prometheus(self.prometheus_path)
         logger.info(
             f"=== Génération terminée : {generated_count} itinéraires sauvegardés dans {output_folder} ==="
         )
         return generated_count
+
+    def _generate_for_profile(
+        self,
+        routing_service: RoutingService,
+        output_folder: Path,
+        pairs: Dict[str, np.ndarray],
+        df_arrets: pd.DataFrame,
+        df_poi: pd.DataFrame,
+        df_origins: pd.DataFrame,
+        zone_of: Optional[np.ndarray],
+        limit: Optional[int],
+        resume: bool,
+        output_format: str,
+        incremental: bool,
+        source_stop_ids: Optional[Set[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Route et exporte les paires avec un profil de routing.
+
+        Les paires (recherche spatiale faite une seule fois) sont partagées
+        entre les profils ; chaque profil a son dossier de sortie, son journal
+        et ses empreintes d'entrées.
+
+        Args:
+            routing_service: service de routing du profil
+            output_folder: dossier de sortie du profil
+            pairs: tableaux alignés des paires ("arret_idx", "poi_idx",
+                "distances", "origin_idx" et éventuellement "rayon")
+            df_arrets: DataFrame des arrêts
+            df_poi: DataFrame des POI
+            df_origins: DataFrame des origines (arrêts ou zones d'arrêt)
+            zone_of: zone d'arrêt de chaque arrêt (regroupement), ou None
+            limit: limite du nombre d'itinéraires à générer (pour tests)
+            resume: reprend la génération du dossier de sortie
+            output_format: format de sortie
+            incremental: ne recalcule que les paires touchées par un
+                changement des entrées
+            source_stop_ids: identifiants des arrêts de la source complète si
+                le périmètre est partiel (None = périmètre complet)
+
+        Returns:
+            Statistiques du profil (paires, requêtes, itinéraires générés)
+        """
+        metrics = get_run_metrics()
+        stats = {}
+        previous = InputSnapshot.load(output_folder) if incremental else None
+        if incremental and previous is None:
+            logger.info(
+                "Aucune empreinte de génération précédente : génération complète"
+            )
+        resume = resume or previous is not None
+
+        manifest = RunManifest(output_folder, resume=resume)
+
+        if resume:
+            done = manifest.done_pairs()
+            keys = pd.MultiIndex.from_arrays(
+                [
+                    df_arrets["ArRId"].astype(str).to_numpy()[pairs["arret_idx"]],
+                    df_poi["id"].astype(str).to_numpy()[pairs["poi_idx"]],
+                ]
+            )
+            todo = ~keys.isin(list(done)) if done else np.ones(len(keys), bool)
+            if previous is not None:
+                todo |= self._apply_input_changes(
+                    previous,
+                    keys,
+                    pairs["arret_idx"],
+                    pairs["poi_idx"],
+                    df_arrets,
+                    df_poi,
+                    zone_of,
+                    manifest,
+                    output_format,
+                    output_folder,
+                    source_stop_ids,
+                )
+            pairs = {key: values[todo] for key, values in pairs.items()}
+            logger.info(f"Reprise : {len(pairs['distances'])} paires restant à traiter")
+
+        if self.isochrone_minutes:
+            keep = self._filter_by_isochrone(
+                routing_service,
+                pairs["origin_idx"],
+                pairs["poi_idx"],
+                df_origins,
+                df_poi,
+            )
+            pairs = {key: values[keep] for key, values in pairs.items()}
+            stats["paires_hors_isochrone"] = int((~keep).sum())
+
+        if limit:
+            # Échantillon trié : les paires restent groupées par arrêt
+            n_pairs = len(pairs["distances"])
+            sample = np.sort(
+                np.random.choice(n_pairs, min(limit, n_pairs), replace=False)
+            )
+            pairs = {key: values[sample] for key, values in pairs.items()}
+
+        origin_idx, poi_idx = pairs["origin_idx"], pairs["poi_idx"]
+        df_pairs = self.build_pair_table(
+            pairs["arret_idx"], poi_idx, pairs["distances"], df_arrets, df_poi
+        )
+        if "rayon" in pairs:
+            df_pairs["rayon"] = pairs["rayon"]
+
+        records = df_pairs.to_dict("records")
+
+        # Un itinéraire par (origine, POI) : les paires consécutives de même
+        # origine et même POI (arrêts d'une même zone) le partagent
+        new_route = np.ones(len(records), dtype=bool)
+        new_route[1:] = (origin_idx[1:] != origin_idx[:-1]) | (
+            poi_idx[1:] != poi_idx[:-1]
+        )
+        route_starts = np.flatnonzero(new_route)
+        route_ends = np.append(route_starts[1:], len(records))
+        route_origin = origin_idx[route_starts]
+        route_poi = poi_idx[route_starts]
+
+        # Coordonnées pour Valhalla (lon, lat)
+        od_pairs = zip(
+            zip(
+                df_origins["ArRLongitude"].to_numpy()[route_origin].tolist(),
+                df_origins["ArRLatitude"].to_numpy()[route_origin].tolist(),
+            ),
+            zip(
+                df_poi["poi_lon"].to_numpy()[route_poi].tolist(),
+                df_poi["poi_lat"].to_numpy()[route_poi].tolist(),
+            ),
+        )
+        if self.batch_matrix:
+            routes = routing_service.calculate_routes_batched(
+                od_pairs,
+                concurrency=self.concurrency,
+                rate_limit=self.rate_limit,
+                geometry_max_duration=self.geometry_max_minutes * 60,
+            )
+        else:
+            routes = routing_service.calculate_routes(
+                od_pairs, concurrency=self.concurrency, rate_limit=self.rate_limit
+            )
+
+        writer = self.export_service.create_writer(
+            output_format,
+            output_folder,
+            append=resume,
+            on_commit=manifest.mark_done,
+            compact_json=self.compact_json,
+        )
+
+        start = time.perf_counter()
+        with measure_stage("routing_export"):
+            for route_start, route_end, route in tqdm(
+                zip(route_starts, route_ends, routes),
+                total=len(route_starts),
+                desc=f"Calcul des itinéraires ({routing_service.profile_name})",
+            ):
+                for pair in records[route_start:route_end]:
+                    arret_id, poi_id = pair["ArRId"], pair["id"]
+                    if route is None:
+                        manifest.mark_failed(arret_id, poi_id, "routing")
+                        continue
+                    try:
+                        # Création de la feature GeoJSON
+                        feature = self.export_service.create_geojson_feature(
+                            route, pair, reducer=self.geometry_reducer
+                        )
+
+                        # Génération du nom de fichier et écriture
+                        filename = self.export_service.generate_filename(pair)
+                        writer.write(feature, filename)
+
+                    except Exception as e:
+                        logger.error(
+                            f"Erreur lors du traitement de la paire {arret_id}-{poi_id}: {e}"
+                        )
+                        manifest.mark_failed(arret_id, poi_id, str(e))
+                        metrics.count_error(f"export.{type(e).__name__}")
+                        continue
+
+            writer.close()
+        manifest.close()
+        InputSnapshot.save(
+            output_folder, df_arrets, df_poi, merge=source_stop_ids is not None
+        )
+
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"Profil {routing_service.profile_name} : {len(records)} itinéraires "
+            f"demandés en {elapsed:.1f}s "
+            f"({len(records) / elapsed if elapsed else 0:.1f} itinéraires/s, "
+            f"concurrence={self.concurrency})"
+        )
+        if self.cluster_stops:
+            logger.info(
+                f"Zones d'arrêt : {len(route_starts)} itinéraires calculés pour "
+                f"{len(records)} paires ({len(records) - len(route_starts)} appels "
+                f"de routing évités)"
+            )
+        requests = routing_service.requests
+        logger.info(
+            f"Requêtes de routing : {sum(requests.values())} pour {len(records)} paires "
+            f"({requests['isochrone']} isochrones, {requests['matrix']} matrices, "
+            f"{requests['directions']} tracés)"
+        )
+
+        stats.update(
+            {
+                "paires": len(records),
+                "itineraires_calcules": len(route_starts),
+                "itineraires_generes": writer.count,
+                "itineraires_par_seconde": (
+                    round(len(records) / elapsed, 2) if elapsed else 0
+                ),
+                "requetes_isochrone": requests["isochrone"],
+                "requetes_matrix": requests["matrix"],
+                "requetes_directions": requests["directions"],
+            }
+        )
+        return stats
@@ -0,0 +1,226 @@
+"""
+Index préparé des POI et des arrêts (Data Layer).
+
+Le chargement du CSV des POI, leur nettoyage et la construction du KDTree sont
+coûteux et identiques d'une exécution à l'autre. L'index préparé conserve leur
+résultat sur disque :
+- poi.arrow / arrets.arrow : tables nettoyées au format Arrow IPC (non compressé)
+- poi_xy.npy : coordonnées projetées en mètres des POI
+- meta.json : empreinte des sources
+
+Un démarrage à chaud évite le parsing du CSV et le nettoyage. Les tables
+Arrow sont lues en mémoire mappée, puis converties en DataFrames : chaque
+processus en a sa propre copie (colonnes texte et catégorielles en objets
+Python). Seules les coordonnées projetées (poi_xy.npy) restent mappées et
+partagées entre processus ; le KDTree des POI est reconstruit à l'ouverture
+sur ces coordonnées, sans les copier, et seuls ses nœuds (index des points)
+sont propres à chaque processus.
+L'index est reconstruit dès que l'empreinte des sources change.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from .config import (
+    DEFAULT_POI_PATH,
+    DEFAULT_ARRETS_PATH,
+    INDEX_DIR,
+    POI_TYPES_FILE,
+    PROJECTION_REF_LAT,
+    TYPES_ARRETS,
+)
+from .data_loader import DataLoader
+from .spatial_service import SpatialService
+from .run_metrics import measure_stage
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter quand le contenu ou le format de l'index change
+INDEX_FORMAT_VERSION = 2
+
+
+def _write_arrow(df: pd.DataFrame, path: Path):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_arrow(path: Path) -> pd.DataFrame:
+    import pyarrow as pa
+
+    return pa.ipc.open_file(pa.memory_map(str(path))).read_all().to_pandas()
+
+
+class PreparedIndex:
+    """POI et arrêts nettoyés, avec le KDTree des POI, prêts à l'emploi."""
+
+    def __init__(
+        self,
+        df_poi: pd.DataFrame,
+        df_arrets: pd.DataFrame,
+        poi_tree: cKDTree,
+        path: Optional[Path] = None,
+    ):
+        self.df_poi = df_poi
+        self.df_arrets = df_arrets
+        self.poi_tree = poi_tree
+        self.path = path
+
+    @staticmethod
+    def fingerprint(poi_path: str, arrets_path: str) -> str:
+        """
+        Calcule l'empreinte des sources de l'index.
+
+        Les fichiers de données volumineux sont identifiés par chemin, taille et
+        date de modification (les relire entièrement coûterait autant qu'un
+        chargement) ; le fichier des types de POI est haché en entier.
+
+        Args:
+            poi_path: chemin du CSV des POI
+            arrets_path: chemin du parquet des arrêts
+
+        Returns:
+            Empreinte hexadécimale
+        """
+        h = hashlib.sha256()
+        h.update(f"v{INDEX_FORMAT_VERSION}|{PROJECTION_REF_LAT}|".encode())
+        h.update(",".join(TYPES_ARRETS).encode())
+        for path in (poi_path, arrets_path):
+            stat = os.stat(path)
+            h.update(
+                f"|{Path(path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}".encode()
+            )
+        h.update(Path(POI_TYPES_FILE).read_bytes())
+        return h.hexdigest()
+
+    @classmethod
+    @measure_stage("index_prepare")
+    def load_or_build(
+        cls,
+        poi_path: Optional[str] = None,
+        arrets_path: Optional[str] = None,
+        index_dir: Path = INDEX_DIR,
+    ) -> "PreparedIndex":
+        """
+        Charge l'index correspondant aux sources, ou le construit s'il est absent
+        ou périmé.
+
+        Args:
+            poi_path: chemin vers le fichier CSV des POI (optionnel)
+            arrets_path: chemin vers le fichier parquet des arrêts (optionnel)
+            index_dir: dossier des index préparés
+
+        Returns:
+            Index préparé
+        """
+        poi_path = poi_path or str(DEFAULT_POI_PATH)
+        arrets_path = arrets_path or str(DEFAULT_ARRETS_PATH)
+        index_dir = Path(index_dir)
+
+        key = cls.fingerprint(poi_path, arrets_path)
+        path = index_dir / key[:16]
+        if (path / "meta.json").exists():
+            start = time.perf_counter()
+            index = cls.load(path)
+            logger.info(
+                f"Index préparé chargé depuis {path} "
+                f"en {(time.perf_counter() - start) * 1000:.0f} ms"
+            )
+            return index
+
+        logger.info("Index préparé absent ou périmé : construction")
+        index = cls.build(poi_path, arrets_path, path, key)
+
+        # Suppression des index construits pour d'anciennes sources
+        for other in index_dir.iterdir():
+            if other.is_dir() and other != path and not other.name.startswith("."):
+                shutil.rmtree(other, ignore_errors=True)
+        return index
+
+    @classmethod
+    def build(
+        cls, poi_path: str, arrets_path: str, path: Path, key: str = ""
+    ) -> "PreparedIndex":
+        """
+        Charge et nettoie les sources, puis écrit l'index dans `path`.
+
+        L'écriture se fait dans un dossier temporaire renommé à la fin, pour
+        qu'un processus concurrent ne lise jamais un index incomplet.
+        """
+        df_poi, df_arrets = DataLoader.load_data(poi_path, arrets_path)
+        df_poi = df_poi.reset_index(drop=True)
+        df_arrets = df_arrets.reset_index(drop=True)
+
+        poi_xy = SpatialService.project_to_metric(
+            df_poi["poi_lat"].to_numpy(dtype=np.float64),
+            df_poi["poi_lon"].to_numpy(dtype=np.float64),
+        )
+        with measure_stage("construction_kdtree"):
+            poi_tree = cKDTree(poi_xy)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=".build-", dir=path.parent))
+        try:
+            _write_arrow(df_poi, tmp / "poi.arrow")
+            _write_arrow(df_arrets, tmp / "arrets.arrow")
+            np.save(tmp / "poi_xy.npy", poi_xy)
+            meta = {
+                "fingerprint": key,
+                "format_version": INDEX_FORMAT_VERSION,
+                "poi_source": str(poi_path),
+                "arrets_source": str(arrets_path),
+                "n_poi": len(df_poi),
+                "n_arrets": len(df_arrets),
+            }
+            (tmp / "meta.json").write_text(json.dumps(meta, indent=2))
+            try:
+                os.replace(tmp, path)
+            except OSError:
+                # Index construit entre-temps par un autre processus
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        logger.info(
+            f"Index préparé écrit dans {path} "
+            f"({len(df_poi)} POI, {len(df_arrets)} arrêts)"
+        )
+        return cls(df_poi, df_arrets, poi_tree, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "PreparedIndex":
+        """
+        Ouvre un index préparé.
+
+        Les tables Arrow sont converties en DataFrames (copie propre au
+        processus) ; le KDTree est construit sur les coordonnées mappées de
+        poi_xy.npy, qu'il référence sans les copier.
+
+        Args:
+            path: dossier de l'index
+
+        Returns:
+            Index préparé
+        """
+        path = Path(path)
+        df_poi = _read_arrow(path / "poi.arrow")
+        df_arrets = _read_arrow(path / "arrets.arrow")
+        poi_xy = np.load(path / "poi_xy.npy", mmap_mode="r")
+        with measure_stage("construction_kdtree"):
+            poi_tree = cKDTree(poi_xy)
+        return cls(df_poi, df_arrets, poi_tree, path)
@@ -0,0 +1,402 @@
+"""
+Service HTTP de requêtes sur les itinéraires générés (Presentation Layer).
+
+Serveur asyncio sans dépendance externe (HTTP/1.1, connexions persistantes).
+Les itinéraires d'un dossier de sortie sont chargés en mémoire
+(`RouteStore`) et les réponses GeoJSON sont transmises en flux (chunked).
+
+Usage :
+    python -m itineraires_pietons.query_service itineraires_pietons/data/output --port 8080
+
+Routes (GET) :
+    /itineraires?arret_id=...&code_insee=...&poi_type=a,b&max_minutes=10&limit=100
+    /itineraires/bbox?bbox=min_lon,min_lat,max_lon,max_lat&poi_type=...&max_minutes=...
+    /itineraires/proches?lon=...&lat=...&k=10&poi_type=...&max_minutes=...
+    /arrets   identifiants des arrêts disponibles
+    /stats    volumes du stockage
+    /tuiles/{z}/{x}/{y}.pbf   tuile vectorielle (avec --tiles, cf. vector_tiles)
+    /tuiles.json              description TileJSON de la pyramide
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from .config import QUERY_SERVICE_HOST, QUERY_SERVICE_PORT, QUERY_STREAM_BATCH_SIZE
+from .route_store import RouteStore
+
+logger = logging.getLogger(__name__)
+
+TILE_PATH = re.compile(r"^/tuiles/(\d+)/(\d+)/(\d+)\.pbf$")
+
+REASONS = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+class QueryService:
+    """Serveur HTTP asyncio répondant aux requêtes sur un `RouteStore`."""
+
+    def __init__(
+        self,
+        store: RouteStore,
+        host: str = QUERY_SERVICE_HOST,
+        port: int = QUERY_SERVICE_PORT,
+        batch_size: int = QUERY_STREAM_BATCH_SIZE,
+        tiles_path: Optional[Path] = None,
+    ):
+        """
+        Args:
+            store: itinéraires indexés
+            host: adresse d'écoute
+            port: port d'écoute
+            batch_size: nombre de Features par fragment transmis
+            tiles_path: fichier MBTiles de tuiles vectorielles à servir (None =
+                pas de tuiles)
+        """
+        self.store = store
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.routes = {
+            "/itineraires": self._routes_by_attributes,
+            "/itineraires/bbox": self._routes_in_bbox,
+            "/itineraires/proches": self._routes_nearest,
+        }
+        self.tiles = None
+        self.tiles_metadata: Dict[str, str] = {}
+        if tiles_path is not None:
+            # Lecture seule : les requêtes sont servies dans la boucle asyncio
+            self.tiles = sqlite3.connect(
+                f"file:{tiles_path}?mode=ro", uri=True, check_same_thread=False
+            )
+            self.tiles_metadata = dict(
+                self.tiles.execute("SELECT name, value FROM metadata")
+            )
+
+    @staticmethod
+    def _poi_types(params: Dict[str, str]) -> Optional[list]:
+        value = params.get("poi_type")
+        return [t for t in value.split(",") if t] if value else None
+
+    @staticmethod
+    def _float(params: Dict[str, str], name: str) -> Optional[float]:
+        value = params.get(name)
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"Paramètre {name} invalide : {value}")
+
+    def _routes_by_attributes(self, params: Dict[str, str]) -> np.ndarray:
+        if not params.get("arret_id") and not params.get("code_insee"):
+            raise ValueError("Paramètre arret_id ou code_insee requis")
+        return self.store.query(
+            arret_id=params.get("arret_id"),
+            code_insee=params.get("code_insee"),
+            poi_types=self._poi_types(params),
+            max_minutes=self._float(params, "max_minutes"),
+        )
+
+    def _routes_in_bbox(self, params: Dict[str, str]) -> np.ndarray:
+        bbox = params.get("bbox", "").split(",")
+        if len(bbox) != 4:
+            raise ValueError("Paramètre bbox attendu : min_lon,min_lat,max_lon,max_lat")
+        try:
+            bbox = [float(v) for v in bbox]
+        except ValueError:
+            raise ValueError(f"Paramètre bbox invalide : {params['bbox']}")
+        return self.store.query_bbox(
+            bbox,
+            poi_types=self._poi_types(params),
+            max_minutes=self._float(params, "max_minutes"),
+        )
+
+    def _routes_nearest(self, params: Dict[str, str]) -> np.ndarray:
+        lon, lat = self._float(params, "lon"), self._float(params, "lat")
+        if lon is None or lat is None:
+            raise ValueError("Paramètres lon et lat requis")
+        return self.store.query_nearest(
+            lon,
+            lat,
+            k=int(self._float(params, "k") or 10),
+            poi_types=self._poi_types(params),
+            max_minutes=self._float(params, "max_minutes"),
+        )
+
+    @staticmethod
+    async def _read_request(
+        reader: asyncio.StreamReader,
+    ) -> Optional[Tuple[str, str, bool]]:
+        """Lit une requête ; renvoie (méthode, cible, keep-alive) ou None si fermée."""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise ValueError("Ligne de requête invalide")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        connection = headers.get("connection", "")
+        keep_alive = (
+            connection != "close"
+            if version == "HTTP/1.1"
+            else connection == "keep-alive"
+        )
+        return method, target, keep_alive
+
+    @staticmethod
+    def _head(status: int, headers: Dict[str, str], keep_alive: bool) -> bytes:
+        headers = {**headers, "Connection": "keep-alive" if keep_alive else "close"}
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_json(
+        self, writer: asyncio.StreamWriter, status: int, body, keep_alive: bool
+    ):
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        writer.write(
+            self._head(
+                status,
+                {
+                    "Content-Type": "application/json; charset=utf-8",
+                    "Content-Length": str(len(payload)),
+                },
+                keep_alive,
+            )
+            + payload
+        )
+        await writer.drain()
+
+    def _tile_json(self) -> dict:
+        """Description TileJSON de la pyramide servie."""
+        metadata = self.tiles_metadata
+        return {
+            "tilejson": "3.0.0",
+            "name": metadata.get("name"),
+            "scheme": "xyz",
+            "tiles": [f"http://{self.host}:{self.port}/tuiles/{{z}}/{{x}}/{{y}}.pbf"],
+            "minzoom": int(metadata.get("minzoom", 0)),
+            "maxzoom": int(metadata.get("maxzoom", 22)),
+            "bounds": [float(v) for v in metadata.get("bounds", "").split(",") if v],
+            **json.loads(metadata.get("json", "{}")),
+        }
+
+    async def _send_tile(
+        self,
+        writer: asyncio.StreamWriter,
+        zoom: int,
+        x: int,
+        y: int,
+        keep_alive: bool,
+    ):
+        """Transmet une tuile vectorielle telle que stockée (gzip) ou 204 si vide."""
+        row = self.tiles.execute(
+            "SELECT tile_data FROM tiles "
+            "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, (1 << zoom) - 1 - y),
+        ).fetchone()
+        headers = {"Access-Control-Allow-Origin": "*"}
+        if row is None:
+            writer.write(
+                self._head(204, {**headers, "Content-Length": "0"}, keep_alive)
+            )
+        else:
+            writer.write(
+                self._head(
+                    200,
+                    {
+                        **headers,
+                        "Content-Type": "application/vnd.mapbox-vector-tile",
+                        "Content-Encoding": "gzip",
+                        "Content-Length": str(len(row[0])),
+                    },
+                    keep_alive,
+                )
+                + row[0]
+            )
+        await writer.drain()
+
+    async def _send_features(
+        self, writer: asyncio.StreamWriter, rows: np.ndarray, keep_alive: bool
+    ):
+        """Transmet une FeatureCollection en flux (Transfer-Encoding: chunked)."""
+        writer.write(
+            self._head(
+                200,
+                {
+                    "Content-Type": "application/geo+json; charset=utf-8",
+                    "Transfer-Encoding": "chunked",
+                },
+                keep_alive,
+            )
+        )
+
+        def chunk(data: bytes) -> bytes:
+            return b"%x\r\n%s\r\n" % (len(data), data)
+
+        writer.write(
+            chunk(
+                b'{"type":"FeatureCollection","numberMatched":%d,"features":['
+                % len(rows)
+            )
+        )
+        for fragment in self.store.iter_payloads(rows, self.batch_size):
+            writer.write(chunk(fragment))
+            await writer.drain()
+        writer.write(chunk(b"]}") + b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _dispatch(
+        self, writer: asyncio.StreamWriter, method: str, target: str, keep_alive: bool
+    ):
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        path = url.path.rstrip("/") or "/"
+
+        if method != "GET":
+            await self._send_json(
+                writer, 405, {"erreur": "Seule la méthode GET est acceptée"}, keep_alive
+            )
+        elif path == "/stats":
+            await self._send_json(writer, 200, self.store.stats(), keep_alive)
+        elif path == "/arrets":
+            await self._send_json(writer, 200, sorted(self.store.by_arret), keep_alive)
+        elif path.startswith("/tuiles") and self.tiles is None:
+            await self._send_json(
+                writer,
+                404,
+                {"erreur": "Aucune tuile servie (option --tiles)"},
+                keep_alive,
+            )
+        elif path == "/tuiles.json":
+            await self._send_json(writer, 200, self._tile_json(), keep_alive)
+        elif TILE_PATH.match(path):
+            zoom, x, y = map(int, TILE_PATH.match(path).groups())
+            await self._send_tile(writer, zoom, x, y, keep_alive)
+        elif path in self.routes:
+            try:
+                rows = self.routes[path](params)
+                limit = self._float(params, "limit")
+            except ValueError as e:
+                await self._send_json(writer, 400, {"erreur": str(e)}, keep_alive)
+                return
+            if limit is not None:
+                rows = rows[: int(limit)]
+            await self._send_features(writer, rows, keep_alive)
+        else:
+            await self._send_json(
+                writer, 404, {"erreur": f"Route inconnue : {path}"}, keep_alive
+            )
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """Traite les requêtes successives d'une connexion."""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ValueError as e:
+                    await self._send_json(writer, 400, {"erreur": str(e)}, False)
+                    break
+                if request is None:
+                    break
+                method, target, keep_alive = request
+                try:
+                    await self._dispatch(writer, method, target, keep_alive)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    logger.error(f"Erreur lors du traitement de {target}: {e}")
+                    await self._send_json(writer, 500, {"erreur": str(e)}, False)
+                    break
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """Démarre le serveur et traite les connexions jusqu'à interruption."""
+        server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port
+        )
+        addresses = ", ".join(str(s.getsockname()) for s in server.sockets)
+        logger.info(f"Service de requêtes à l'écoute sur {addresses}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    """Point d'entrée du service de requêtes."""
+    parser = argparse.ArgumentParser(
+        description="Service HTTP de requêtes sur les itinéraires générés"
+    )
+    parser.add_argument(
+        "output", help="Dossier de sortie d'une génération (geojson, ndjson ou parquet)"
+    )
+    parser.add_argument(
+        "--host",
+        default=QUERY_SERVICE_HOST,
+        help=f"Adresse d'écoute (défaut: {QUERY_SERVICE_HOST})",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=QUERY_SERVICE_PORT,
+        help=f"Port d'écoute (défaut: {QUERY_SERVICE_PORT})",
+    )
+    parser.add_argument(
+        "--tiles",
+        default=None,
+        help="Fichier MBTiles de tuiles vectorielles à servir sous /tuiles "
+        "(cf. vector_tiles)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    store = RouteStore.from_output(Path(args.output))
+    service = QueryService(
+        store,
+        args.host,
+        args.port,
+        tiles_path=Path(args.tiles) if args.tiles else None,
+    )
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
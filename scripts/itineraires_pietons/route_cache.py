@@ -0,0 +1,205 @@
+"""
+Cache persistant des itinéraires calculés (Data Layer).
+
+Les itinéraires sont stockés dans une base SQLite, indexés par les coordonnées
+d'origine et de destination quantifiées et par le profil de routing.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from routingpy.direction import Direction
+
+from .config import (
+    ROUTE_CACHE_PATH,
+    ROUTE_CACHE_PRECISION,
+    ROUTE_CACHE_MAX_AGE_DAYS,
+    ROUTE_CACHE_MAX_ENTRIES,
+    ROUTE_CACHE_BUSY_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Nombre d'écritures entre deux commits SQLite
+COMMIT_EVERY = 200
+
+
+class RouteCache:
+    """Cache SQLite des itinéraires (origine, destination, profil) -> route."""
+
+    def __init__(
+        self,
+        path: Path = ROUTE_CACHE_PATH,
+        precision: int = ROUTE_CACHE_PRECISION,
+        max_age_days: Optional[float] = ROUTE_CACHE_MAX_AGE_DAYS,
+        max_entries: Optional[int] = ROUTE_CACHE_MAX_ENTRIES,
+    ):
+        """
+        Ouvre (ou crée) le cache et applique la politique d'éviction.
+
+        Args:
+            path: chemin du fichier SQLite
+            precision: nombre de décimales des coordonnées dans la clé
+            max_age_days: âge maximal des entrées en jours (None = illimité)
+            max_entries: nombre maximal d'entrées (None = illimité)
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.precision = precision
+        self.max_age_days = max_age_days
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        # Les processus d'une génération répartie partagent le même cache
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=ROUTE_CACHE_BUSY_TIMEOUT, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS routes (
+                key TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                geometry TEXT,
+                distance NUMERIC,
+                duration NUMERIC
+            )
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_routes_created_at ON routes(created_at)"
+        )
+        self._conn.commit()
+
+        evicted = self.evict()
+        logger.info(
+            f"Cache d'itinéraires ouvert : {self.path} "
+            f"({len(self)} entrées, {evicted} évincées)"
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+
+    def make_key(self, origin: tuple, destination: tuple, profile: str) -> str:
+        """
+        Construit la clé de cache à partir des coordonnées quantifiées.
+
+        Args:
+            origin: tuple (lon, lat) du point d'origine
+            destination: tuple (lon, lat) du point de destination
+            profile: profil de routing (ex: "pedestrian")
+
+        Returns:
+            Clé textuelle
+        """
+        scale = 10**self.precision
+        coords = (origin[0], origin[1], destination[0], destination[1])
+        quantised = ",".join(str(round(float(c) * scale)) for c in coords)
+        return f"{profile}:{quantised}"
+
+    def get(self, origin: tuple, destination: tuple, profile: str):
+        """
+        Recherche un itinéraire dans le cache.
+
+        Returns:
+            Objet Direction de routingpy, ou None si absent
+        """
+        key = self.make_key(origin, destination, profile)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT geometry, distance, duration FROM routes WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        geometry, distance, duration = row
+        return Direction(
+            geometry=json.loads(geometry) if geometry else None,
+            duration=duration,
+            distance=distance,
+        )
+
+    def put(self, origin: tuple, destination: tuple, profile: str, route) -> None:
+        """
+        Enregistre un itinéraire dans le cache.
+
+        Args:
+            origin: tuple (lon, lat) du point d'origine
+            destination: tuple (lon, lat) du point de destination
+            profile: profil de routing
+            route: objet route (attributs geometry, distance, duration)
+        """
+        key = self.make_key(origin, destination, profile)
+        geometry = getattr(route, "geometry", None)
+        row = (
+            key,
+            time.time(),
+            json.dumps(geometry, separators=(",", ":")) if geometry else None,
+            getattr(route, "distance", None),
+            getattr(route, "duration", None),
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?, ?)", row
+            )
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY:
+                self._conn.commit()
+                self._pending = 0
+
+    def evict(self) -> int:
+        """
+        Supprime les entrées trop anciennes puis les plus anciennes au-delà
+        de la taille maximale.
+
+        Returns:
+            Nombre d'entrées supprimées
+        """
+        deleted = 0
+        with self._lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                deleted += self._conn.execute(
+                    "DELETE FROM routes WHERE created_at < ?", (cutoff,)
+                ).rowcount
+            if self.max_entries is not None:
+                deleted += self._conn.execute(
+                    """
+                    DELETE FROM routes WHERE key IN (
+                        SELECT key FROM routes ORDER BY created_at DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entries,),
+                ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def stats(self) -> str:
+        """Résumé des compteurs de succès/échecs du cache."""
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0.0
+        return f"{self.hits} succès / {self.misses} échecs ({ratio:.1f}% de succès)"
+
+    def flush(self) -> None:
+        """Valide les écritures en attente."""
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self) -> None:
+        """Valide les écritures en attente et ferme la base."""
+        self.flush()
+        self._conn.close()
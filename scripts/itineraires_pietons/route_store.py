@@ -0,0 +1,331 @@
+"""
+Stockage en mémoire des itinéraires générés, pour le service de requêtes (Data Layer).
+
+Les itinéraires d'un dossier de sortie (geojson, ndjson ou parquet) sont
+chargés une fois : chaque Feature est conservée déjà sérialisée en JSON (les
+réponses ne font que concaténer des octets) et ses attributs de filtrage sont
+rangés en tableaux numpy. Index :
+- dictionnaires arret_id / code_insee / poi_type -> positions ;
+- KDTree des centres des emprises des géométries (requêtes par bbox) ;
+- KDTree des points d'arrivée (POI) pour les requêtes de plus proches voisins.
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from .config import NDJSON_FILENAME, PARQUET_DATASET_DIR, GEOSTORE_DIR
+from .export_writers import wkb_to_linestring
+from .geometry_reduction import GeometryReducer
+from .geometry_store import GeometryStore
+from .spatial_service import SpatialService
+
+logger = logging.getLogger(__name__)
+
+
+class RouteStore:
+    """Itinéraires en mémoire, indexés par attribut et dans l'espace."""
+
+    def __init__(self, features: List[dict]):
+        """
+        Construit les index à partir d'une liste de Features GeoJSON.
+
+        Args:
+            features: Features des itinéraires (cf. `ExportService.create_geojson_feature`)
+        """
+        start = time.perf_counter()
+        n = len(features)
+        self.payloads: List[bytes] = [
+            json.dumps(f, ensure_ascii=False, separators=(",", ":")).encode()
+            for f in features
+        ]
+
+        properties = pd.DataFrame([f["properties"] for f in features])
+        for column in ("arret_id", "code_insee", "poi_type"):
+            if column not in properties:
+                properties[column] = ""
+        self.duree = (
+            pd.to_numeric(properties["duree_marche"], errors="coerce").to_numpy(
+                dtype=np.float64
+            )
+            if "duree_marche" in properties
+            else np.full(n, np.nan)
+        )
+        self.by_arret = self._group(properties["arret_id"])
+        self.by_commune = self._group(properties["code_insee"])
+        self.by_type = self._group(properties["poi_type"])
+
+        # Emprises et points d'arrivée des géométries (NaN si pas de tracé)
+        bounds = np.full((n, 4), np.nan)
+        ends = np.full((n, 2), np.nan)
+        for i, feature in enumerate(features):
+            coords = (feature.get("geometry") or {}).get("coordinates")
+            if not coords and feature["properties"].get("polyline"):
+                coords = GeometryReducer.decode_polyline(
+                    feature["properties"]["polyline"]
+                )
+            if coords:
+                xy = np.asarray(coords, dtype=np.float64)
+                bounds[i, :2] = xy.min(axis=0)
+                bounds[i, 2:] = xy.max(axis=0)
+                ends[i] = xy[-1]
+        self.bounds = bounds
+        self.spatial_rows = np.flatnonzero(~np.isnan(bounds[:, 0]))
+
+        centers = (bounds[self.spatial_rows, :2] + bounds[self.spatial_rows, 2:]) / 2
+        self._box_xy = SpatialService.project_to_metric(centers[:, 1], centers[:, 0])
+        corners = SpatialService.project_to_metric(
+            bounds[self.spatial_rows, 3], bounds[self.spatial_rows, 2]
+        )
+        # Demi-diagonale maximale : rayon à ajouter pour ne manquer aucune emprise
+        self._max_half_diagonal = (
+            float(np.max(np.linalg.norm(corners - self._box_xy, axis=1)))
+            if len(self.spatial_rows)
+            else 0.0
+        )
+        self._box_tree = cKDTree(self._box_xy)
+        self._end_tree = cKDTree(
+            SpatialService.project_to_metric(
+                ends[self.spatial_rows, 1], ends[self.spatial_rows, 0]
+            )
+        )
+        logger.info(
+            f"{n} itinéraires chargés et indexés en {time.perf_counter() - start:.1f}s"
+        )
+
+    @staticmethod
+    def _group(column: pd.Series) -> Dict[str, np.ndarray]:
+        """Positions des lignes par valeur (texte) de la colonne."""
+        keys = column.astype(str)
+        groups = keys.groupby(keys).indices
+        return {str(key): rows.astype(np.int64) for key, rows in groups.items()}
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+    @classmethod
+    def from_output(cls, output_folder: Path) -> "RouteStore":
+        """
+        Charge les itinéraires d'un dossier de sortie, quel que soit son format
+        (geostore, ndjson, parquet ou fichiers geojson).
+
+        Args:
+            output_folder: dossier de sortie d'une génération
+
+        Returns:
+            Stockage indexé
+        """
+        return cls(cls.read_features(output_folder))
+
+    @classmethod
+    def read_features(cls, source: Path) -> List[dict]:
+        """
+        Lit les Features d'un dossier de sortie (geostore, ndjson, parquet ou
+        fichiers geojson) ou d'un fichier agrégé (.ndjson ou FeatureCollection).
+
+        Args:
+            source: dossier de sortie ou fichier
+
+        Returns:
+            Liste des Features
+        """
+        source = Path(source)
+        if source.is_file():
+            with open(source, encoding="utf-8") as f:
+                if source.suffix == ".ndjson":
+                    return [json.loads(line) for line in f if line.strip()]
+                return json.load(f)["features"]
+
+        ndjson = source / NDJSON_FILENAME
+        dataset = source / PARQUET_DATASET_DIR
+        geostore = source / GEOSTORE_DIR
+        if GeometryStore.is_store(geostore):
+            return list(GeometryStore(geostore).iter_features())
+        if ndjson.exists():
+            with open(ndjson, encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        if dataset.is_dir():
+            return list(cls._read_parquet(dataset))
+        features = []
+        for path in sorted(source.glob("*.geojson")):
+            with open(path, encoding="utf-8") as f:
+                features.extend(json.load(f)["features"])
+        return features
+
+    @staticmethod
+    def _read_parquet(dataset: Path) -> Iterator[dict]:
+        """Reconstitue les Features d'un jeu GeoParquet (cf. `ParquetWriter`)."""
+        import pyarrow.parquet as pq
+
+        for part in sorted(dataset.glob("part-*.parquet")):
+            for row in pq.read_table(part).to_pylist():
+                coords = wkb_to_linestring(row.pop("geometry"))
+                geometry = {"type": "LineString", "coordinates": coords}
+                yield {
+                    "type": "Feature",
+                    "geometry": geometry if coords is not None else None,
+                    "properties": row,
+                }
+
+    def _filter(
+        self,
+        rows: Optional[np.ndarray],
+        code_insee: Optional[str] = None,
+        poi_types: Optional[Sequence[str]] = None,
+        max_minutes: Optional[float] = None,
+    ) -> np.ndarray:
+        """Restreint des positions (None = toutes) par commune, type et durée."""
+        if code_insee is not None:
+            subset = self.by_commune.get(str(code_insee), np.empty(0, np.int64))
+            rows = subset if rows is None else np.intersect1d(rows, subset)
+        if poi_types:
+            subset = np.concatenate(
+                [self.by_type.get(t, np.empty(0, np.int64)) for t in poi_types]
+            )
+            rows = subset if rows is None else np.intersect1d(rows, subset)
+        if rows is None:
+            rows = np.arange(len(self), dtype=np.int64)
+        if max_minutes is not None:
+            rows = rows[self.duree[rows] <= max_minutes]
+        return np.sort(rows)
+
+    def query(
+        self,
+        arret_id: Optional[str] = None,
+        code_insee: Optional[str] = None,
+        poi_types: Optional[Sequence[str]] = None,
+        max_minutes: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Itinéraires par attributs (tous les critères sont combinés).
+
+        Args:
+            arret_id: identifiant d'arrêt
+            code_insee: code INSEE de la commune de l'arrêt
+            poi_types: types de POI acceptés
+            max_minutes: durée de marche maximale (min)
+
+        Returns:
+            Positions des itinéraires correspondants, triées
+        """
+        rows = None
+        if arret_id is not None:
+            rows = self.by_arret.get(str(arret_id), np.empty(0, np.int64))
+        return self._filter(rows, code_insee, poi_types, max_minutes)
+
+    def query_bbox(
+        self,
+        bbox: Sequence[float],
+        poi_types: Optional[Sequence[str]] = None,
+        max_minutes: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Itinéraires dont l'emprise intersecte une bbox (min_lon, min_lat, max_lon, max_lat).
+
+        Args:
+            bbox: emprise de recherche (degrés)
+            poi_types: types de POI acceptés
+            max_minutes: durée de marche maximale (min)
+
+        Returns:
+            Positions des itinéraires correspondants, triées
+        """
+        min_lon, min_lat, max_lon, max_lat = map(float, bbox)
+        if not len(self.spatial_rows):
+            return np.empty(0, np.int64)
+        center = SpatialService.project_to_metric(
+            np.array([(min_lat + max_lat) / 2]), np.array([(min_lon + max_lon) / 2])
+        )[0]
+        corner = SpatialService.project_to_metric(
+            np.array([max_lat]), np.array([max_lon])
+        )[0]
+        radius = np.linalg.norm(corner - center) + self._max_half_diagonal
+        candidates = self.spatial_rows[
+            self._box_tree.query_ball_point(center, r=radius * 1.01)
+        ]
+        b = self.bounds[candidates]
+        hit = (
+            (b[:, 0] <= max_lon)
+            & (b[:, 2] >= min_lon)
+            & (b[:, 1] <= max_lat)
+            & (b[:, 3] >= min_lat)
+        )
+        return self._filter(candidates[hit], None, poi_types, max_minutes)
+
+    def query_nearest(
+        self,
+        lon: float,
+        lat: float,
+        k: int = 10,
+        poi_types: Optional[Sequence[str]] = None,
+        max_minutes: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Itinéraires dont le POI d'arrivée est le plus proche d'un point.
+
+        Args:
+            lon, lat: point de recherche (degrés)
+            k: nombre d'itinéraires
+            poi_types: types de POI acceptés
+            max_minutes: durée de marche maximale (min)
+
+        Returns:
+            Positions des k itinéraires les plus proches, du plus proche au plus
+            lointain
+        """
+        total = len(self.spatial_rows)
+        if not total or k <= 0:
+            return np.empty(0, np.int64)
+        point = SpatialService.project_to_metric(np.array([lat]), np.array([lon]))[0]
+        filtered = bool(poi_types) or max_minutes is not None
+        allowed = self._filter(None, None, poi_types, max_minutes) if filtered else None
+
+        # Élargit la recherche jusqu'à obtenir k itinéraires satisfaisant les filtres
+        n = min(total, 4 * k)
+        while True:
+            _, idx = self._end_tree.query(point, k=n)
+            rows = self.spatial_rows[np.atleast_1d(idx)]
+            if allowed is not None:
+                rows = rows[np.isin(rows, allowed, assume_unique=True)]
+            if len(rows) >= k or n == total:
+                return rows[:k]
+            n = min(total, 4 * n)
+
+    def iter_payloads(self, rows: np.ndarray, batch_size: int) -> Iterator[bytes]:
+        """
+        Restitue les Features sérialisées par lots, séparées par des virgules.
+
+        Args:
+            rows: positions des itinéraires
+            batch_size: nombre de Features par lot
+
+        Returns:
+            Itérateur de fragments JSON
+        """
+        for start in range(0, len(rows), batch_size):
+            chunk = b",".join(
+                self.payloads[i] for i in rows[start : start + batch_size]
+            )
+            yield (b"," if start else b"") + chunk
+
+    def stats(self) -> dict:
+        """Statistiques du stockage (volumes par index)."""
+        return {
+            "itineraires": len(self),
+            "avec_geometrie": int(len(self.spatial_rows)),
+            "arrets": len(self.by_arret),
+            "communes": len(self.by_commune),
+            "types_poi": sorted(self.by_type),
+            "emprise": (
+                np.nanmin(self.bounds[:, :2], axis=0).tolist()
+                + np.nanmax(self.bounds[:, 2:], axis=0).tolist()
+                if len(self.spatial_rows)
+                else None
+            ),
+        }
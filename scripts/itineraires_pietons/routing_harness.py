@@ -0,0 +1,268 @@
+"""
+Banc de charge du routing de bout en bout (Application Layer).
+
+Démarre un serveur Valhalla factice (cf. stub_valhalla) et exécute
+l'orchestrateur complet (chargement, recherche des paires, requêtes HTTP via
+routingpy, export) contre lui pour chaque niveau de concurrence. Le banc
+rapporte le débit d'itinéraires, les latences p50/p95 vues par le client,
+les erreurs et les réponses 429/500 du serveur. Contrairement au banc
+d'essai (cf. benchmark), les requêtes passent réellement par HTTP : nouvelles
+tentatives, limites de concurrence et de débit sont exercées hors ligne.
+
+Usage :
+    python -m itineraires_pietons.routing_harness --scale epci --concurrency 1 4 16
+    python -m itineraires_pietons.routing_harness --latency lognormale --overload-rate 0.05 --rate-limit 50
+    python -m itineraires_pietons.routing_harness --valhalla-url http://127.0.0.1:8002
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .benchmark import synthetic_dataset
+from .config import (
+    ROUTING_HARNESS_CONCURRENCY,
+    ROUTING_HARNESS_ROUTES,
+    RUN_REPORT_FILENAME,
+    SYNTHETIC_SCALES,
+)
+from .orchestrator import ItineraryOrchestrator
+from .stub_valhalla import (
+    StubValhallaServer,
+    add_server_arguments,
+    server_from_arguments,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingHarness:
+    """Mesure le débit de l'orchestrateur contre un serveur Valhalla."""
+
+    def __init__(
+        self,
+        poi_path: Path,
+        arrets_path: Path,
+        routes: int = ROUTING_HARNESS_ROUTES,
+        rate_limit: Optional[float] = None,
+        batch_matrix: bool = False,
+        isochrone_minutes: Optional[float] = None,
+    ):
+        """
+        Args:
+            poi_path: fichier des POI
+            arrets_path: fichier des arrêts
+            routes: paires routées par mesure
+            rate_limit: débit maximal du client (requêtes/s, None = illimité)
+            batch_matrix: mode groupé par arrêt (matrice puis tracés)
+            isochrone_minutes: préfiltrage isochrone (minutes, optionnel)
+        """
+        self.poi_path = poi_path
+        self.arrets_path = arrets_path
+        self.routes = routes
+        self.rate_limit = rate_limit
+        self.batch_matrix = batch_matrix
+        self.isochrone_minutes = isochrone_minutes
+
+    def run(
+        self,
+        valhalla_url: str,
+        concurrency: int,
+        server: Optional[StubValhallaServer] = None,
+    ) -> Dict[str, Any]:
+        """
+        Exécute l'orchestrateur complet pour un niveau de concurrence.
+
+        Args:
+            valhalla_url: URL du serveur Valhalla
+            concurrency: requêtes simultanées du client
+            server: serveur factice dont les compteurs sont relevés (optionnel)
+
+        Returns:
+            Dictionnaire des mesures
+        """
+        before = dict(server.responses) if server else {}
+        orchestrator = ItineraryOrchestrator(
+            valhalla_url=valhalla_url,
+            concurrency=concurrency,
+            rate_limit=self.rate_limit,
+            batch_matrix=self.batch_matrix,
+            isochrone_minutes=self.isochrone_minutes,
+        )
+        with tempfile.TemporaryDirectory(prefix="routing_harness_") as tmp:
+            np.random.seed(0)  # mêmes paires à chaque niveau de concurrence
+            start = time.perf_counter()
+            generated = orchestrator.generate_itineraries(
+                str(self.poi_path),
+                str(self.arrets_path),
+                output_folder=Path(tmp),
+                limit=self.routes,
+                output_format="ndjson",
+            )
+            elapsed = time.perf_counter() - start
+            with open(Path(tmp) / RUN_REPORT_FILENAME, encoding="utf-8") as f:
+                report = json.load(f)
+
+        result = {
+            "concurrence": concurrency,
+            "itineraires": generated,
+            "duree_s": round(elapsed, 2),
+            "itineraires_par_seconde": round(generated / elapsed, 1) if elapsed else 0,
+            "erreurs": sum(report["erreurs"].values()),
+        }
+        latencies = report["latences"].get("directions")
+        if latencies:
+            result["p50_ms"] = round(latencies["p50_s"] * 1000, 1)
+            result["p95_ms"] = round(latencies["p95_s"] * 1000, 1)
+        if server:
+            counts = {
+                key: server.responses[key] - before.get(key, 0)
+                for key in server.responses
+            }
+            result["requetes_serveur"] = sum(
+                count for key, count in counts.items() if isinstance(key, int)
+            )
+            result["reponses_429"] = counts.get(429, 0)
+            result["reponses_500"] = counts.get(500, 0)
+        return result
+
+    @staticmethod
+    def print_results(results: List[Dict[str, Any]]):
+        """Affiche le tableau des mesures."""
+        columns = [
+            ("concurrence", "concurrence"),
+            ("itineraires", "itinéraires"),
+            ("duree_s", "durée (s)"),
+            ("itineraires_par_seconde", "itin./s"),
+            ("p50_ms", "p50 (ms)"),
+            ("p95_ms", "p95 (ms)"),
+            ("erreurs", "erreurs"),
+            ("requetes_serveur", "requêtes"),
+            ("reponses_429", "429"),
+            ("reponses_500", "500"),
+        ]
+        columns = [(k, title) for k, title in columns if k in results[0]]
+        print("\n" + "  ".join(f"{title:>12}" for _, title in columns))
+        for result in results:
+            print("  ".join(f"{str(result.get(k, '-')):>12}" for k, _ in columns))
+
+
+def main():
+    """Point d'entrée du banc de charge du routing."""
+    parser = argparse.ArgumentParser(
+        description="Débit de l'orchestrateur contre un serveur Valhalla factice"
+    )
+    parser.add_argument(
+        "--scale",
+        choices=list(SYNTHETIC_SCALES),
+        default="departement",
+        help="Échelle du jeu synthétique (défaut: departement)",
+    )
+    parser.add_argument(
+        "--poi", default=None, help="Mesure sur ce fichier de POI (avec --arrets)"
+    )
+    parser.add_argument(
+        "--arrets", default=None, help="Mesure sur ce fichier d'arrêts (avec --poi)"
+    )
+    parser.add_argument(
+        "--routes",
+        type=int,
+        default=ROUTING_HARNESS_ROUTES,
+        help=f"Paires routées par mesure (défaut: {ROUTING_HARNESS_ROUTES})",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=ROUTING_HARNESS_CONCURRENCY,
+        help="Niveaux de concurrence du client (défaut: "
+        f"{' '.join(map(str, ROUTING_HARNESS_CONCURRENCY))})",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=None,
+        help="Débit maximal du client en requêtes/s (défaut: illimité)",
+    )
+    parser.add_argument(
+        "--batch-matrix",
+        action="store_true",
+        help="Mode groupé par arrêt (matrice puis tracés)",
+    )
+    parser.add_argument(
+        "--isochrone-minutes",
+        type=float,
+        default=None,
+        help="Préfiltrage isochrone des POI (minutes)",
+    )
+    parser.add_argument(
+        "--valhalla-url",
+        default=None,
+        help="Serveur Valhalla existant (défaut: serveur factice démarré par le banc)",
+    )
+    parser.add_argument(
+        "--output", default=None, help="Écrit aussi les mesures dans ce fichier JSON"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Affiche les logs du pipeline"
+    )
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    if bool(args.poi) != bool(args.arrets):
+        parser.error("--poi et --arrets s'utilisent ensemble")
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    logger.setLevel(logging.INFO)
+    # Les 429 sont comptés par le serveur : pas d'avertissement par tentative
+    warnings.filterwarnings("ignore", message="Rate limit exceeded")
+
+    if args.poi:
+        poi_path, arrets_path = Path(args.poi), Path(args.arrets)
+    else:
+        poi_path, arrets_path = synthetic_dataset(SYNTHETIC_SCALES[args.scale], 0)
+
+    server = None
+    valhalla_url = args.valhalla_url
+    if valhalla_url is None:
+        server = server_from_arguments(args)
+        valhalla_url = server.start_background()
+        logger.info(f"Valhalla factice démarré sur {valhalla_url}")
+
+    harness = RoutingHarness(
+        poi_path,
+        arrets_path,
+        args.routes,
+        rate_limit=args.rate_limit,
+        batch_matrix=args.batch_matrix,
+        isochrone_minutes=args.isochrone_minutes,
+    )
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            logger.info(f"Mesure avec concurrence={concurrency}...")
+            results.append(harness.run(valhalla_url, concurrency, server))
+    finally:
+        if server:
+            server.stop()
+
+    RoutingHarness.print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n✓ Mesures écrites dans {args.output}")
+    return 0 if all(result["erreurs"] == 0 for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,37 +2,146 @@
 Service de calcul d'itinéraires via Valhalla (Business Logic Layer).
 """
 
+import copy
 import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+import numpy as np
 from routingpy import Valhalla
-from typing import Optional
+from routingpy.direction import Direction
+from typing import Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
 
 from .config import (
     VALHALLA_PROFILE,
+    ROUTING_PROFILES,
+    DEFAULT_ROUTING_PROFILE,
     VALHALLA_FORMAT,
     VALHALLA_RETRY_OVER_LIMIT,
+    VALHALLA_CONCURRENCY,
+    VALHALLA_RATE_LIMIT,
+    VALHALLA_MATRIX_MAX_TARGETS,
+    VALHALLA_ISOCHRONE_DENOISE,
+    BATCH_GEOMETRY_MAX_MINUTES,
 )
 
+from .run_metrics import get_run_metrics
+from .spatial_service import SpatialService
+
+if TYPE_CHECKING:
+    from .route_cache import RouteCache
+
 logger = logging.getLogger(__name__)
 
 
+class RateLimiter:
+    """Limiteur de débit (requêtes par seconde) partagé entre threads."""
+
+    def __init__(self, rate: Optional[float] = None):
+        """
+        Args:
+            rate: nombre maximal de requêtes par seconde (None ou 0 = illimité)
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Bloque jusqu'au prochain créneau disponible."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
 class RoutingService:
     """Service de calcul d'itinéraires piétons via Valhalla."""
 
-    def __init__(self, valhalla_url: Optional[str] = None):
+    def __init__(
+        self,
+        valhalla_url: Optional[str] = None,
+        cache: Optional["RouteCache"] = None,
+    ):
         """
         Initialise le service de routing.
 
         Args:
             valhalla_url: URL du serveur Valhalla (optionnel, utilise le défaut si None)
+            cache: cache persistant des itinéraires (optionnel)
         """
+        self.set_profile(DEFAULT_ROUTING_PROFILE)
+        self.cache = cache
+        self.rate_limiter = RateLimiter()
+        self.requests = Counter()
+        self._requests_lock = threading.Lock()
+        self._client_kwargs = {"retry_over_query_limit": VALHALLA_RETRY_OVER_LIMIT}
         if valhalla_url:
-            self.client = Valhalla(
-                base_url=valhalla_url, retry_over_query_limit=VALHALLA_RETRY_OVER_LIMIT
-            )
-        else:
-            self.client = Valhalla(retry_over_query_limit=VALHALLA_RETRY_OVER_LIMIT)
+            self._client_kwargs["base_url"] = valhalla_url
+        # Un client (et donc une session HTTP) par thread
+        self._local = threading.local()
         logger.info("Service de routing Valhalla initialisé")
 
+    def set_profile(self, name: str):
+        """
+        Sélectionne le profil de routing (cf. ROUTING_PROFILES).
+
+        `profile` est la clé du profil dans le cache : celle du profil par
+        défaut reste "pedestrian", pour réutiliser les itinéraires existants.
+        """
+        if name not in ROUTING_PROFILES:
+            raise ValueError(
+                f"Profil de routing inconnu : {name} "
+                f"(profils disponibles : {', '.join(ROUTING_PROFILES)})"
+            )
+        self.profile_name = name
+        self.costing_options = ROUTING_PROFILES[name]
+        self.profile = (
+            VALHALLA_PROFILE
+            if name == DEFAULT_ROUTING_PROFILE
+            else f"{VALHALLA_PROFILE}_{name}"
+        )
+
+    def with_profile(self, name: str) -> "RoutingService":
+        """
+        Copie du service pour un autre profil de routing.
+
+        Les clients HTTP, le cache (et le graphe du routeur local) sont
+        partagés ; les compteurs de requêtes sont propres à la copie.
+
+        Args:
+            name: nom du profil (cf. ROUTING_PROFILES)
+
+        Returns:
+            Service de routing du profil
+        """
+        service = copy.copy(self)
+        service.set_profile(name)
+        service.rate_limiter = RateLimiter()
+        service.requests = Counter()
+        service._requests_lock = threading.Lock()
+        return service
+
+    @property
+    def client(self) -> Valhalla:
+        """Client Valhalla propre au thread courant."""
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = Valhalla(**self._client_kwargs)
+            self._local.client = client
+        return client
+
+    def _count_request(self, kind: str):
+        """Comptabilise une requête envoyée au moteur de routing."""
+        with self._requests_lock:
+            self.requests[kind] += 1
+
     def calculate_route(self, origin: tuple, destination: tuple):
         """
         Calcule un itinéraire piéton entre deux points.
@@ -44,15 +153,323 @@ class RoutingService:
         Returns:
             Objet route de routingpy, ou None si erreur
         """
+        if self.cache is not None:
+            route = self.cache.get(origin, destination, self.profile)
+            if route is not None:
+                return route
+
+        metrics = get_run_metrics()
         try:
-            route = self.client.directions(
-                locations=[origin, destination],
-                profile=VALHALLA_PROFILE,
-                format=VALHALLA_FORMAT,
-            )
-            return route
+            self.rate_limiter.wait()
+            self._count_request("directions")
+            start = time.perf_counter()
+            route = self._fetch_route(origin, destination)
+            metrics.observe_latency("directions", time.perf_counter() - start)
         except Exception as e:
             logger.error(
                 f"Erreur lors du calcul d'itinéraire {origin} -> {destination}: {e}"
             )
+            metrics.count_error(f"routing.{type(e).__name__}")
+            return None
+        if route is None:
+            metrics.count_error("routing.itineraire_introuvable")
+
+        if self.cache is not None and route is not None:
+            self.cache.put(origin, destination, self.profile, route)
+        return route
+
+    def _fetch_route(self, origin: tuple, destination: tuple):
+        """Appelle Valhalla pour un itinéraire (sans cache ni gestion d'erreur)."""
+        return self.client.directions(
+            locations=[origin, destination],
+            profile=VALHALLA_PROFILE,
+            options=self.costing_options or None,
+            format=VALHALLA_FORMAT,
+        )
+
+    def calculate_matrix(
+        self, origin: tuple, destinations: List[tuple]
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Calcule distances et durées de marche d'une origine vers plusieurs
+        destinations (matrice "sources_to_targets" de Valhalla).
+
+        Les destinations sont envoyées par lots de VALHALLA_MATRIX_MAX_TARGETS.
+
+        Args:
+            origin: tuple (lon, lat) du point d'origine
+            destinations: liste de tuples (lon, lat)
+
+        Returns:
+            Tuple (distances en m, durées en s) en float64, NaN pour les
+            destinations injoignables ; None si erreur
+        """
+        distances = np.full(len(destinations), np.nan)
+        durations = np.full(len(destinations), np.nan)
+        metrics = get_run_metrics()
+        try:
+            for start in range(0, len(destinations), VALHALLA_MATRIX_MAX_TARGETS):
+                batch = destinations[start : start + VALHALLA_MATRIX_MAX_TARGETS]
+                self.rate_limiter.wait()
+                self._count_request("matrix")
+                started = time.perf_counter()
+                batch_distances, batch_durations = self._fetch_matrix(origin, batch)
+                metrics.observe_latency("matrix", time.perf_counter() - started)
+                distances[start : start + len(batch)] = batch_distances
+                durations[start : start + len(batch)] = batch_durations
+        except Exception as e:
+            logger.error(f"Erreur lors du calcul de matrice depuis {origin}: {e}")
+            metrics.count_error(f"matrix.{type(e).__name__}")
+            return None
+        return distances, durations
+
+    def _fetch_matrix(
+        self, origin: tuple, destinations: List[tuple]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Appelle la matrice Valhalla (une origine, sans gestion d'erreur)."""
+        matrix = self.client.matrix(
+            locations=[origin] + list(destinations),
+            profile=VALHALLA_PROFILE,
+            options=self.costing_options or None,
+            sources=[0],
+            destinations=list(range(1, len(destinations) + 1)),
+        )
+        distances = np.array(matrix.distances[0], dtype=np.float64)
+        durations = np.array(matrix.durations[0], dtype=np.float64)
+        return distances, durations
+
+    def calculate_isochrone(
+        self, origin: tuple, max_duration: float
+    ) -> Optional[List[np.ndarray]]:
+        """
+        Calcule l'isochrone de marche d'un point pour une durée donnée.
+
+        Args:
+            origin: tuple (lon, lat) du point d'origine
+            max_duration: durée de marche (s)
+
+        Returns:
+            Anneaux des polygones de l'isochrone (tableaux (M, 2) de lon, lat),
+            ou None si erreur
+        """
+        metrics = get_run_metrics()
+        try:
+            self.rate_limiter.wait()
+            self._count_request("isochrone")
+            start = time.perf_counter()
+            rings = self._fetch_isochrone(origin, max_duration)
+            metrics.observe_latency("isochrone", time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"Erreur lors du calcul d'isochrone depuis {origin}: {e}")
+            metrics.count_error(f"isochrone.{type(e).__name__}")
             return None
+        return rings
+
+    def _fetch_isochrone(self, origin: tuple, max_duration: float) -> List[np.ndarray]:
+        """Appelle l'isochrone Valhalla (polygones, sans gestion d'erreur)."""
+        params = Valhalla.get_isochrone_params(
+            locations=list(origin),
+            profile=VALHALLA_PROFILE,
+            intervals=[int(round(max_duration))],
+            interval_type="time",
+            polygons=True,
+            options=self.costing_options or None,
+        )
+        # routingpy n'envoie pas denoise=0 (valeur fausse) : Valhalla appliquerait
+        # alors son défaut (1.0) et ne garderait que le plus grand contour
+        params["denoise"] = VALHALLA_ISOCHRONE_DENOISE
+        # La réponse brute conserve les MultiPolygon, ignorés par routingpy
+        response = self.client.client._request("/isochrone", post_params=params)
+        rings = []
+        for feature in response.get("features", []):
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+            for polygon in polygons:
+                rings.extend(
+                    np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon
+                )
+        return rings
+
+    def reachable_mask(
+        self, origin: tuple, destinations: List[tuple], max_duration: float
+    ) -> Optional[np.ndarray]:
+        """
+        Indique les destinations atteignables à pied en `max_duration` secondes :
+        une isochrone depuis l'origine, puis un test point-dans-polygone
+        vectorisé de toutes les destinations.
+
+        Args:
+            origin: tuple (lon, lat) du point d'origine
+            destinations: liste de tuples (lon, lat)
+            max_duration: durée de marche (s)
+
+        Returns:
+            Masque booléen aligné sur destinations, ou None si erreur
+        """
+        rings = self.calculate_isochrone(origin, max_duration)
+        if rings is None:
+            return None
+        destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+        return SpatialService.points_in_polygons(
+            destinations[:, 0], destinations[:, 1], rings
+        )
+
+    def calculate_reachable(
+        self,
+        requests: Iterable[Tuple[tuple, List[tuple]]],
+        max_duration: float,
+        concurrency: int = VALHALLA_CONCURRENCY,
+        rate_limit: Optional[float] = VALHALLA_RATE_LIMIT,
+    ) -> Iterator:
+        """
+        Applique `reachable_mask` à une suite d'origines, éventuellement en
+        parallèle (cf. `calculate_routes`).
+
+        Args:
+            requests: itérable de tuples (origin, liste de destinations)
+            max_duration: durée de marche (s)
+            concurrency: nombre maximal de requêtes simultanées
+            rate_limit: nombre maximal de requêtes par seconde (None = illimité)
+
+        Returns:
+            Itérateur des masques (ou None si erreur), dans l'ordre d'entrée
+        """
+        self.rate_limiter = RateLimiter(rate_limit)
+        return self._map_ordered(
+            lambda origin, destinations: self.reachable_mask(
+                origin, destinations, max_duration
+            ),
+            requests,
+            concurrency,
+        )
+
+    def calculate_routes(
+        self,
+        od_pairs: Iterable[Tuple[tuple, tuple]],
+        concurrency: int = VALHALLA_CONCURRENCY,
+        rate_limit: Optional[float] = VALHALLA_RATE_LIMIT,
+    ) -> Iterator:
+        """
+        Calcule une suite d'itinéraires, éventuellement en parallèle.
+
+        Les résultats sont restitués dans l'ordre des paires d'entrée. Au plus
+        `concurrency` requêtes sont en vol simultanément et le débit est borné
+        à `rate_limit` requêtes par seconde.
+
+        Args:
+            od_pairs: itérable de tuples (origin, destination) en (lon, lat)
+            concurrency: nombre maximal de requêtes simultanées
+            rate_limit: nombre maximal de requêtes par seconde (None = illimité)
+
+        Returns:
+            Itérateur d'objets route (ou None si erreur), dans l'ordre d'entrée
+        """
+        self.rate_limiter = RateLimiter(rate_limit)
+        return self._map_ordered(self.calculate_route, od_pairs, concurrency)
+
+    def calculate_matrices(
+        self,
+        requests: Iterable[Tuple[tuple, List[tuple]]],
+        concurrency: int = VALHALLA_CONCURRENCY,
+        rate_limit: Optional[float] = VALHALLA_RATE_LIMIT,
+    ) -> Iterator:
+        """
+        Calcule une suite de matrices une-origine/plusieurs-destinations,
+        éventuellement en parallèle (cf. `calculate_routes`).
+
+        Args:
+            requests: itérable de tuples (origin, liste de destinations)
+            concurrency: nombre maximal de requêtes simultanées
+            rate_limit: nombre maximal de requêtes par seconde (None = illimité)
+
+        Returns:
+            Itérateur des résultats de `calculate_matrix`, dans l'ordre d'entrée
+        """
+        self.rate_limiter = RateLimiter(rate_limit)
+        return self._map_ordered(self.calculate_matrix, requests, concurrency)
+
+    def calculate_routes_batched(
+        self,
+        od_pairs: Iterable[Tuple[tuple, tuple]],
+        concurrency: int = VALHALLA_CONCURRENCY,
+        rate_limit: Optional[float] = VALHALLA_RATE_LIMIT,
+        geometry_max_duration: float = BATCH_GEOMETRY_MAX_MINUTES * 60,
+    ) -> Iterator:
+        """
+        Calcule une suite d'itinéraires en regroupant les paires par origine.
+
+        Les paires consécutives de même origine (un arrêt) sont résolues par une
+        seule matrice une-origine/plusieurs-destinations, qui donne distance et
+        durée de marche vers tous les POI. Le tracé complet n'est demandé
+        (`calculate_route`) que pour les paires dont la durée est inférieure à
+        `geometry_max_duration`, ou que la matrice n'a pas pu résoudre ; les
+        autres itinéraires sont restitués sans géométrie.
+
+        Args:
+            od_pairs: itérable de tuples (origin, destination) en (lon, lat),
+                groupés par origine
+            concurrency: nombre maximal de requêtes simultanées
+            rate_limit: nombre maximal de requêtes par seconde (None = illimité)
+            geometry_max_duration: durée de marche (s) au-delà de laquelle le
+                tracé n'est pas calculé
+
+        Returns:
+            Itérateur d'objets route (géométrie None au-delà du seuil, None si
+            erreur), dans l'ordre d'entrée
+        """
+        self.rate_limiter = RateLimiter(rate_limit)
+        groups = (
+            (origin, [destination for _, destination in pairs])
+            for origin, pairs in groupby(od_pairs, key=itemgetter(0))
+        )
+
+        def solve_group(origin, destinations):
+            return origin, destinations, self.calculate_matrix(origin, destinations)
+
+        def pairs_with_matrix():
+            for origin, destinations, matrix in self._map_ordered(
+                solve_group, groups, concurrency
+            ):
+                if matrix is None:
+                    matrix = np.full((2, len(destinations)), np.nan)
+                for destination, distance, duration in zip(destinations, *matrix):
+                    yield origin, destination, distance, duration
+
+        def resolve(origin, destination, distance, duration):
+            if np.isnan(duration) or duration <= geometry_max_duration:
+                return self.calculate_route(origin, destination)
+            return Direction(
+                geometry=None, duration=int(duration), distance=int(distance)
+            )
+
+        return self._map_ordered(resolve, pairs_with_matrix(), concurrency)
+
+    @staticmethod
+    def _map_ordered(func, items: Iterable[tuple], concurrency: int) -> Iterator:
+        """
+        Applique `func(*item)` à chaque élément, avec au plus `concurrency`
+        appels simultanés, et restitue les résultats dans l'ordre d'entrée.
+        """
+        if concurrency <= 1:
+            for item in items:
+                yield func(*item)
+            return
+
+        # Fenêtre de soumission bornée : les workers restent occupés pendant que
+        # l'appelant consomme les résultats, sans tout charger en mémoire.
+        window = 2 * concurrency
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="routing"
+        ) as executor:
+            in_flight = deque()
+            for item in items:
+                if len(in_flight) >= window:
+                    yield in_flight.popleft().result()
+                in_flight.append(executor.submit(func, *item))
+            while in_flight:
+                yield in_flight.popleft().result()
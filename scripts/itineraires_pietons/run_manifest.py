@@ -0,0 +1,136 @@
+"""
+Journal d'exécution des générations d'itinéraires (Data Layer).
+
+Chaque paire (arrêt, POI) traitée est ajoutée au journal JSON Lines du dossier
+de sortie avec son statut ("done" ou "failed") et l'emplacement de sa sortie.
+Le journal permet de reprendre une génération interrompue sans parcourir les
+fichiers déjà écrits.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from .config import MANIFEST_FILENAME
+
+logger = logging.getLogger(__name__)
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class RunManifest:
+    """Journal append-only des paires traitées."""
+
+    def __init__(self, output_folder: Path, resume: bool = False):
+        """
+        Ouvre le journal du dossier de sortie.
+
+        Args:
+            output_folder: dossier de sortie de la génération
+            resume: si True, relit le journal existant et y ajoute les nouvelles
+                entrées ; sinon le journal est réinitialisé
+        """
+        self.path = Path(output_folder) / MANIFEST_FILENAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # (arret_id, poi_id) -> dernière entrée connue
+        self.entries: Dict[Tuple[str, str], dict] = {}
+        if resume and self.path.exists():
+            self._load()
+
+        self._file = open(
+            self.path, "a" if resume else "w", encoding="utf-8", buffering=1
+        )
+
+    def _load(self):
+        """Relit le journal ; la dernière entrée d'une paire fait foi."""
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            # Dernière ligne tronquée par une interruption brutale : coupée pour
+            # que la reprise n'ajoute pas sa première entrée à sa suite
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                logger.warning(
+                    f"Journal {self.path} : dernière ligne incomplète supprimée"
+                )
+                f.truncate(end)
+
+        for line in data[:end].decode("utf-8").splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self.entries[(entry["arret_id"], entry["poi_id"])] = entry
+
+        failed = sum(1 for e in self.entries.values() if e["status"] == STATUS_FAILED)
+        logger.info(
+            f"Journal {self.path} : {len(self.entries) - failed} paires terminées, "
+            f"{failed} en échec"
+        )
+
+    def done_pairs(self) -> Set[Tuple[str, str]]:
+        """Ensemble des paires (arret_id, poi_id) déjà générées avec succès."""
+        return {
+            key for key, entry in self.entries.items() if entry["status"] == STATUS_DONE
+        }
+
+    def _append(self, entry: dict):
+        self.entries[(entry["arret_id"], entry["poi_id"])] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def mark_done(self, arret_id, poi_id, output: str):
+        """Enregistre une paire générée et l'emplacement de sa sortie."""
+        self._append(
+            {
+                "arret_id": str(arret_id),
+                "poi_id": str(poi_id),
+                "status": STATUS_DONE,
+                "output": output,
+            }
+        )
+
+    def mark_failed(self, arret_id, poi_id, error: Optional[str] = None):
+        """Enregistre une paire en échec (elle sera retentée à la reprise)."""
+        self._append(
+            {
+                "arret_id": str(arret_id),
+                "poi_id": str(poi_id),
+                "status": STATUS_FAILED,
+                "error": error,
+            }
+        )
+
+    def compact(
+        self,
+        removed: Iterable[Tuple[str, str]] = (),
+        relocated: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Réécrit le journal avec la dernière entrée de chaque paire.
+
+        Args:
+            removed: paires dont la sortie a été supprimée (retirées du journal)
+            relocated: nouveaux emplacements des sorties déplacées
+                (ancien emplacement -> nouveau)
+        """
+        relocated = relocated or {}
+        for key in removed:
+            self.entries.pop(key, None)
+        for entry in self.entries.values():
+            if entry.get("output") in relocated:
+                entry["output"] = relocated[entry["output"]]
+
+        self._file.close()
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+
+    def close(self):
+        """Ferme le journal."""
+        self._file.close()
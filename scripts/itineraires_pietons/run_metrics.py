@@ -0,0 +1,377 @@
+"""
+Instrumentation d'une génération d'itinéraires (Application Layer).
+
+Les services enregistrent leurs mesures dans les métriques de l'exécution en
+cours (`get_run_metrics`), sans qu'il soit nécessaire de les leur passer :
+- étapes (`measure_stage`) : durée, nombre d'appels et pic mémoire du
+  processus depuis son démarrage, relevé en fin d'étape (ru_maxrss ne
+  permet pas de pic propre à une étape) ; en mode profilage, cProfile et tracemalloc sur les étapes de
+  premier niveau ;
+- chronomètres cumulés (`timer`) pour les opérations très fréquentes
+  (sérialisation, écriture disque) ;
+- latences (`observe_latency`) des requêtes de routing, comptées dans un
+  histogramme à classes fixes (mémoire constante quel que soit le nombre de
+  requêtes) et restituées en percentiles p50/p95/p99 et en histogramme
+  Prometheus ;
+- erreurs par type (`count_error`) et valeurs libres (`set_value`).
+
+L'orchestrateur crée les métriques en début de génération
+(`new_run_metrics`) et écrit le rapport JSON (et éventuellement le fichier
+Prometheus) en fin de génération.
+"""
+
+import bisect
+import cProfile
+import json
+import logging
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import ContextDecorator, contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+
+from .config import (
+    LATENCY_BUCKETS,
+    LATENCY_HISTOGRAM_BINS_PER_DECADE,
+    LATENCY_HISTOGRAM_RANGE_S,
+    PROMETHEUS_PREFIX,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _max_rss_mb() -> float:
+    """Pic de mémoire résidente du processus depuis son démarrage (Mo)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sous macOS, en kilo-octets sous Linux
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+class LatencyHistogram:
+    """
+    Latences d'un type de requête, en mémoire constante : nombre, somme,
+    maximum, classes logarithmiques fines (percentiles) et classes
+    Prometheus (LATENCY_BUCKETS).
+    """
+
+    _lo, _hi = np.log10(LATENCY_HISTOGRAM_RANGE_S)
+    EDGES = np.logspace(
+        _lo, _hi, int(round((_hi - _lo) * LATENCY_HISTOGRAM_BINS_PER_DECADE)) + 1
+    ).tolist()
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # Classe i : [EDGES[i - 1], EDGES[i][ ; 0 et la dernière : hors bornes
+        self.bins = [0] * (len(self.EDGES) + 1)
+        # Classe i : ]LATENCY_BUCKETS[i - 1], LATENCY_BUCKETS[i]] ; dernière : +Inf
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds: float):
+        """Compte une latence (s)."""
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.bins[bisect.bisect_right(self.EDGES, seconds)] += 1
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def percentiles(self, qs) -> list:
+        """
+        Estime des percentiles, par interpolation géométrique dans la classe.
+
+        Args:
+            qs: percentiles demandés (0-100)
+
+        Returns:
+            Latences estimées (s), bornées par le maximum observé
+        """
+        cumulative = np.cumsum(self.bins)
+        edges = self.EDGES
+        values = []
+        for q in qs:
+            rank = q / 100.0 * self.count
+            i = min(int(np.searchsorted(cumulative, rank)), len(self.bins) - 1)
+            if i == 0:
+                value = edges[0]
+            elif i == len(edges):
+                value = self.max
+            else:
+                before = cumulative[i - 1]
+                fraction = (rank - before) / self.bins[i] if self.bins[i] else 0.0
+                lo, hi = edges[i - 1], edges[i]
+                value = lo * (hi / lo) ** fraction
+            values.append(min(value, self.max))
+        return values
+
+
+class RunMetrics:
+    """Mesures d'une exécution : étapes, chronomètres, latences, erreurs."""
+
+    def __init__(self, profile: bool = False):
+        """
+        Args:
+            profile: active cProfile et tracemalloc sur les étapes de premier niveau
+        """
+        self.profile = profile
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.timers: Dict[str, list] = defaultdict(lambda: [0.0, 0])
+        self.latencies: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+        self.errors: Counter = Counter()
+        self.values: Dict[str, Any] = {}
+        self._profilers: Dict[str, cProfile.Profile] = {}
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Mesure une étape (appelée depuis le thread principal).
+
+        Les durées des appels successifs d'une même étape sont cumulées.
+        """
+        top_level = self._depth == 0
+        profiler = None
+        if self.profile and top_level:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            profiler = self._profilers.setdefault(name, cProfile.Profile())
+            profiler.enable()
+
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._depth -= 1
+            entry = self.stages.setdefault(name, {"duree_s": 0.0, "appels": 0})
+            entry["duree_s"] += elapsed
+            entry["appels"] += 1
+            entry["pic_rss_processus_mo"] = round(_max_rss_mb(), 1)
+            if profiler is not None:
+                profiler.disable()
+                peak = tracemalloc.get_traced_memory()[1] / 1e6
+                entry["pic_tracemalloc_mo"] = round(
+                    max(entry.get("pic_tracemalloc_mo", 0.0), peak), 1
+                )
+
+    @contextmanager
+    def timer(self, name: str):
+        """Chronomètre cumulé (durée totale et nombre d'appels), tous threads."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                total = self.timers[name]
+                total[0] += elapsed
+                total[1] += 1
+
+    def observe_latency(self, kind: str, seconds: float):
+        """Enregistre la latence d'une requête (ex. "directions", "matrix")."""
+        with self._lock:
+            self.latencies[kind].observe(seconds)
+
+    def count_error(self, kind: str):
+        """Comptabilise une erreur par type."""
+        with self._lock:
+            self.errors[kind] += 1
+
+    def set_value(self, name: str, value: Any):
+        """Enregistre une valeur libre (compteur, débit...)."""
+        self.values[name] = value
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Construit le rapport de l'exécution.
+
+        Returns:
+            Dictionnaire sérialisable en JSON
+        """
+        latencies = {}
+        for kind, histogram in self.latencies.items():
+            p50, p95, p99 = histogram.percentiles([50, 95, 99])
+            latencies[kind] = {
+                "requetes": histogram.count,
+                "moyenne_s": round(histogram.total / histogram.count, 4),
+                "p50_s": round(float(p50), 4),
+                "p95_s": round(float(p95), 4),
+                "p99_s": round(float(p99), 4),
+                "max_s": round(histogram.max, 4),
+            }
+
+        return {
+            "debut": self.started_at.isoformat(timespec="seconds"),
+            "duree_totale_s": round(time.perf_counter() - self._start, 3),
+            "pic_rss_mo": round(_max_rss_mb(), 1),
+            "profil": self.profile,
+            "etapes": {
+                name: {**entry, "duree_s": round(entry["duree_s"], 3)}
+                for name, entry in self.stages.items()
+            },
+            "chronometres": {
+                name: {"duree_s": round(total, 3), "appels": count}
+                for name, (total, count) in self.timers.items()
+            },
+            "latences": latencies,
+            "erreurs": dict(self.errors),
+            "valeurs": self.values,
+        }
+
+    def write_report(self, path: Path) -> Path:
+        """
+        Écrit le rapport JSON (et les profils cProfile en mode profilage).
+
+        Args:
+            path: chemin du rapport JSON
+
+        Returns:
+            Path du rapport créé
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2, default=str)
+
+        for name, profiler in self._profilers.items():
+            profiler.dump_stats(path.parent / f"profil_{name}.prof")
+        if self._profilers:
+            logger.info(
+                f"Profils cProfile écrits dans {path.parent} (profil_<étape>.prof, "
+                "à lire avec `python -m pstats` ou snakeviz)"
+            )
+        return path
+
+    def write_prometheus(self, path: Path) -> Path:
+        """
+        Écrit les métriques au format texte Prometheus (textfile collector).
+
+        Args:
+            path: chemin du fichier .prom
+
+        Returns:
+            Path du fichier créé
+        """
+        prefix = PROMETHEUS_PREFIX
+        lines = [
+            f"# HELP {prefix}_stage_duration_seconds Durée cumulée par étape",
+            f"# TYPE {prefix}_stage_duration_seconds gauge",
+        ]
+        for name, entry in self.stages.items():
+            lines.append(
+                f'{prefix}_stage_duration_seconds{{stage="{name}"}} {entry["duree_s"]:.6f}'
+            )
+        lines += [
+            f"# HELP {prefix}_process_peak_rss_bytes Pic RSS du processus depuis "
+            "son démarrage, relevé en fin d'étape",
+            f"# TYPE {prefix}_process_peak_rss_bytes gauge",
+        ]
+        for name, entry in self.stages.items():
+            lines.append(
+                f'{prefix}_process_peak_rss_bytes{{stage="{name}"}} '
+                f'{int(entry["pic_rss_processus_mo"] * 1e6)}'
+            )
+        lines += [
+            f"# HELP {prefix}_timer_seconds Durée cumulée des opérations chronométrées",
+            f"# TYPE {prefix}_timer_seconds counter",
+        ]
+        for name, (total, _) in self.timers.items():
+            lines.append(f'{prefix}_timer_seconds{{operation="{name}"}} {total:.6f}')
+
+        lines += [
+            f"# HELP {prefix}_routing_latency_seconds Latence des requêtes de routing",
+            f"# TYPE {prefix}_routing_latency_seconds histogram",
+        ]
+        for kind, histogram in self.latencies.items():
+            cumulative = np.cumsum(histogram.buckets)
+            for bound, count in zip(LATENCY_BUCKETS, cumulative):
+                lines.append(
+                    f'{prefix}_routing_latency_seconds_bucket{{kind="{kind}",le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'{prefix}_routing_latency_seconds_bucket{{kind="{kind}",le="+Inf"}} {histogram.count}'
+            )
+            lines.append(
+                f'{prefix}_routing_latency_seconds_sum{{kind="{kind}"}} {histogram.total:.6f}'
+            )
+            lines.append(
+                f'{prefix}_routing_latency_seconds_count{{kind="{kind}"}} {histogram.count}'
+            )
+
+        lines += [
+            f"# HELP {prefix}_errors_total Erreurs par type",
+            f"# TYPE {prefix}_errors_total counter",
+        ]
+        for kind, count in self.errors.items():
+            lines.append(f'{prefix}_errors_total{{type="{kind}"}} {count}')
+
+        for name, value in self.values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Écriture atomique : le collecteur ne doit pas lire un fichier partiel
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        tmp.replace(path)
+        return path
+
+
+_current = RunMetrics()
+
+
+def get_run_metrics() -> RunMetrics:
+    """Métriques de l'exécution en cours."""
+    return _current
+
+
+def new_run_metrics(profile: bool = False) -> RunMetrics:
+    """
+    Démarre de nouvelles métriques d'exécution.
+
+    Args:
+        profile: active le profilage cProfile/tracemalloc des étapes
+
+    Returns:
+        Métriques de la nouvelle exécution
+    """
+    global _current
+    _current = RunMetrics(profile=profile)
+    return _current
+
+
+class measure_stage(ContextDecorator):
+    """
+    Mesure une étape dans les métriques de l'exécution en cours.
+
+    S'utilise comme contexte (`with measure_stage("export"):`) ou comme
+    décorateur (`@measure_stage("chargement_poi")`).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._cm = None
+
+    def _recreate_cm(self):
+        return measure_stage(self.name)
+
+    def __enter__(self):
+        self._cm = get_run_metrics().stage(self.name)
+        return self._cm.__enter__()
+
+    def __exit__(self, *exc):
+        return self._cm.__exit__(*exc)
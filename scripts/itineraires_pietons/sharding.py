@@ -0,0 +1,931 @@
+"""
+Génération répartie par shards d'arrêts (Application Layer).
+
+Les arrêts sont regroupés par commune (INSEE_COM) ou par EPCI (nom_epci), et
+les groupes répartis en shards de volumes équilibrés d'après le nombre estimé
+de paires arrêt-POI (un groupe plus gros qu'un shard est découpé en bandes de
+latitude). Chaque shard est une génération ordinaire, restreinte à ses
+arrêts, écrite dans son propre sous-dossier `shards/shard-NNNN`.
+
+Le plan (`plan_shards.json`) et les réservations des shards sont de simples
+fichiers du dossier de sortie, créés de façon atomique : des processus d'un
+même nœud (pool de processus) comme des nœuds différents partageant le dossier
+de sortie se répartissent les shards sans autre coordination. L'index préparé
+POI/arrêts, construit une fois, est relu par tous les processus : chacun
+convertit les tables en DataFrames et reconstruit le KDTree des POI sur les
+coordonnées projetées, seules partagées en mémoire mappée. Une réservation
+non rafraîchie depuis SHARD_CLAIM_STALE_SECONDS (nœud arrêté) est reprise par
+un autre processus, qui complète le shard à partir de son journal.
+
+Quand tous les shards sont terminés, la fusion regroupe leurs sorties, leurs
+journaux, leurs empreintes d'entrées et leurs rapports d'exécution dans le
+dossier de sortie, qui devient identique à celui d'une génération non répartie
+(et peut être repris avec --resume).
+
+Usage :
+    python -m itineraires_pietons --shards 32 --shard-by epci --workers 8 --format ndjson
+"""
+
+import heapq
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from .config import (
+    DEFAULT_SHARD_KEY,
+    GEOSTORE_DIR,
+    INPUT_SNAPSHOT_FILENAME,
+    MANIFEST_FILENAME,
+    MAX_DISTANCE,
+    NDJSON_FILENAME,
+    PARQUET_DATASET_DIR,
+    RUN_REPORT_FILENAME,
+    SHARD_CLAIM_STALE_SECONDS,
+    SHARD_HEARTBEAT_SECONDS,
+    SHARD_KEYS,
+    SHARD_PLAN_FILENAME,
+    SHARDS_DIR,
+    STOP_AREA_RADIUS,
+    STOP_AREAS_FILENAME,
+)
+from .geometry_store import (
+    COORDS_DTYPE,
+    COORDS_FILENAME,
+    OFFSETS_DTYPE,
+    OFFSETS_FILENAME,
+    GeometryStore,
+)
+from .orchestrator import ItineraryOrchestrator
+from .run_manifest import RunManifest
+from .spatial_service import SpatialService
+from .stop_areas import StopAreaService
+
+logger = logging.getLogger(__name__)
+
+MERGE_CLAIM_FILENAME = "fusion.claim"
+# Un groupe plus gros qu'un shard est découpé en morceaux de 1/N de shard
+SPLIT_PIECES_PER_SHARD = 4
+
+
+def _owner() -> Dict[str, Any]:
+    """Identité du processus qui réserve un shard (diagnostic)."""
+    return {
+        "hote": socket.gethostname(),
+        "pid": os.getpid(),
+        "debut": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def _write_json(path: Path, content: Any):
+    """Écrit un fichier JSON de façon atomique."""
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+class ShardPlanner:
+    """Découpage des arrêts en shards équilibrés."""
+
+    @staticmethod
+    def estimate_pairs(
+        df_arrets: pd.DataFrame,
+        df_poi: pd.DataFrame,
+        max_distance: float = MAX_DISTANCE,
+        poi_tree: Optional[cKDTree] = None,
+        max_per_type: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Estime le nombre de paires de chaque arrêt (POI dans le rayon).
+
+        Un seul comptage KDTree vectorisé, sans construire les paires ; avec
+        une sélection par type, les paires sélectionnées sont comptées.
+
+        Args:
+            df_arrets: DataFrame des arrêts
+            df_poi: DataFrame des POI
+            max_distance: rayon de recherche (m)
+            poi_tree: KDTree des POI sur `project_to_metric` (optionnel)
+            max_per_type: POI conservés par type et par arrêt (cf.
+                `SpatialService.find_nearby_pairs`)
+
+        Returns:
+            Nombre de POI candidats par arrêt (par position dans df_arrets)
+        """
+        lats = df_arrets["ArRLatitude"].to_numpy(dtype=np.float64)
+        lons = df_arrets["ArRLongitude"].to_numpy(dtype=np.float64)
+        poi_lat = df_poi["poi_lat"].to_numpy(dtype=np.float64)
+        if len(lats) == 0 or len(poi_lat) == 0:
+            return np.zeros(len(lats), dtype=np.int64)
+        if max_per_type is not None:
+            arret_idx, _, _ = SpatialService.find_nearby_pairs(
+                df_arrets, df_poi, max_distance, poi_tree, max_per_type
+            )
+            return np.bincount(arret_idx, minlength=len(lats))
+        if poi_tree is None:
+            poi_tree = cKDTree(
+                SpatialService.project_to_metric(
+                    poi_lat, df_poi["poi_lon"].to_numpy(dtype=np.float64)
+                )
+            )
+        radius = SpatialService.projection_radius(
+            max_distance, np.concatenate([lats, poi_lat])
+        )
+        return np.asarray(
+            poi_tree.query_ball_point(
+                SpatialService.project_to_metric(lats, lons),
+                radius,
+                return_length=True,
+            ),
+            dtype=np.int64,
+        )
+
+    @staticmethod
+    def plan(
+        df_arrets: pd.DataFrame,
+        estimates: np.ndarray,
+        n_shards: int,
+        shard_by: str = DEFAULT_SHARD_KEY,
+        units: Optional[np.ndarray] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Répartit les arrêts en shards de volumes estimés équilibrés.
+
+        Les groupes (communes ou EPCI) sont attribués du plus gros au plus
+        petit au shard le moins chargé. Un groupe plus gros que la charge
+        moyenne d'un shard est d'abord découpé en bandes de latitude d'un quart
+        de shard (SPLIT_PIECES_PER_SHARD). Les unités (arrêts, ou zones d'arrêt
+        avec le regroupement) ne sont jamais coupées entre deux shards.
+
+        Args:
+            df_arrets: DataFrame des arrêts
+            estimates: nombre estimé de paires de chaque arrêt
+            n_shards: nombre de shards souhaité
+            shard_by: "commune" ou "epci"
+            units: unité indivisible de chaque arrêt (ex. zone d'arrêt) ;
+                None = chaque arrêt
+
+        Returns:
+            Liste de shards {"id", "arrets", "groupes", "paires_estimees"} ;
+            les groupes sans aucune paire sont écartés
+        """
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(
+                f"Clé de répartition inconnue : {shard_by} "
+                f"(clés disponibles : {', '.join(SHARD_KEYS)})"
+            )
+        n = len(df_arrets)
+        units = np.arange(n) if units is None else np.asarray(units)
+        groups = df_arrets[SHARD_KEYS[shard_by]].astype(str).to_numpy()
+        lats = df_arrets["ArRLatitude"].to_numpy(dtype=np.float64)
+        stop_ids = df_arrets["ArRId"].astype(str).to_numpy()
+
+        # Coût, groupe et latitude de chaque unité (ceux de son premier arrêt)
+        _, first, unit_of = np.unique(units, return_index=True, return_inverse=True)
+        unit_cost = np.bincount(unit_of, weights=estimates, minlength=len(first))
+        group_names, group_of = np.unique(groups[first], return_inverse=True)
+        group_cost = np.bincount(
+            group_of, weights=unit_cost, minlength=len(group_names)
+        )
+        target = group_cost.sum() / max(n_shards, 1)
+
+        # Lots indivisibles : (coût, groupe, unités)
+        lots = []
+        by_group = np.argsort(group_of, kind="stable")
+        bounds = np.searchsorted(group_of[by_group], np.arange(len(group_names) + 1))
+        for g, name in enumerate(group_names):
+            if group_cost[g] == 0:
+                continue
+            members = by_group[bounds[g] : bounds[g + 1]]
+            if group_cost[g] <= target:
+                lots.append((group_cost[g], name, members))
+                continue
+            pieces = int(np.ceil(group_cost[g] / target * SPLIT_PIECES_PER_SHARD))
+            members = members[np.argsort(lats[first[members]], kind="stable")]
+            cumulative = np.cumsum(unit_cost[members]) - unit_cost[members]
+            piece_of = np.minimum(
+                (cumulative / (group_cost[g] / pieces)).astype(np.int64), pieces - 1
+            )
+            for piece in np.unique(piece_of):
+                piece_members = members[piece_of == piece]
+                lots.append((unit_cost[piece_members].sum(), name, piece_members))
+
+        # Plus gros lot d'abord, vers le shard le moins chargé
+        loads = [(0.0, i) for i in range(n_shards)]
+        assigned: Dict[int, list] = {i: [] for i in range(n_shards)}
+        for cost, name, members in sorted(lots, key=lambda lot: -lot[0]):
+            load, i = heapq.heappop(loads)
+            assigned[i].append((name, members))
+            heapq.heappush(loads, (load + cost, i))
+
+        shards = []
+        for i in range(n_shards):
+            if not assigned[i]:
+                continue
+            members = np.concatenate([m for _, m in assigned[i]])
+            stops = np.flatnonzero(np.isin(unit_of, members))
+            shards.append(
+                {
+                    "id": len(shards),
+                    "arrets": stop_ids[stops].tolist(),
+                    "groupes": sorted({name for name, _ in assigned[i]}),
+                    "paires_estimees": int(estimates[stops].sum()),
+                }
+            )
+        return shards
+
+
+class ShardQueue:
+    """
+    Plan et réservations des shards, partagés par fichiers dans le dossier de
+    sortie (`plan_shards.json`, `shards/shard-NNNN.{claim,done,failed}`).
+    """
+
+    def __init__(self, output_folder: Path):
+        """
+        Args:
+            output_folder: dossier de sortie de la génération répartie
+        """
+        self.output_folder = Path(output_folder)
+        self.plan_path = self.output_folder / SHARD_PLAN_FILENAME
+        self.shards_dir = self.output_folder / SHARDS_DIR
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Plan publié, ou None."""
+        if not self.plan_path.exists():
+            return None
+        with open(self.plan_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def shards(self) -> List[Dict[str, Any]]:
+        """Shards du plan publié (aucun si le plan a été supprimé par la fusion)."""
+        plan = self.load()
+        return plan["shards"] if plan else []
+
+    def publish(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Publie le plan s'il n'existe pas encore (le premier publié fait foi).
+
+        Args:
+            plan: plan calculé par ce processus
+
+        Returns:
+            Plan effectivement publié
+        """
+        self.shards_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.plan_path.with_name(f".{self.plan_path.name}.{uuid.uuid4().hex}")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(plan, f, ensure_ascii=False)
+        try:
+            # Échoue si un autre processus a publié son plan entre-temps
+            os.link(tmp, self.plan_path)
+        except FileExistsError:
+            pass
+        finally:
+            tmp.unlink()
+        return self.load()
+
+    def shard_dir(self, shard_id: int) -> Path:
+        """Dossier de sortie d'un shard."""
+        return self.shards_dir / f"shard-{shard_id:04d}"
+
+    def _marker(self, shard_id: int, suffix: str) -> Path:
+        return self.shards_dir / f"shard-{shard_id:04d}.{suffix}"
+
+    @staticmethod
+    def _acquire(path: Path, owner: Dict[str, Any]) -> bool:
+        """
+        Crée un fichier de réservation de façon exclusive.
+
+        Une réservation plus ancienne que SHARD_CLAIM_STALE_SECONDS est
+        écartée par renommage : un seul des processus concurrents y parvient.
+        Le fichier renommé doit être celui jugé périmé (même inode, même date) ;
+        sinon, c'est la réservation récente d'un processus qui l'a reprise ou
+        rafraîchie entre-temps, et elle est remise en place.
+        """
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                seen = path.stat()
+                age = time.time() - seen.st_mtime
+                if age < SHARD_CLAIM_STALE_SECONDS:
+                    return False
+                stale = path.with_name(f"{path.name}.{uuid.uuid4().hex}.perimee")
+                os.rename(path, stale)
+                moved = stale.stat()
+            except FileNotFoundError:
+                return False
+            if (moved.st_ino, moved.st_mtime_ns) != (seen.st_ino, seen.st_mtime_ns):
+                try:
+                    os.link(stale, path)
+                except FileExistsError:
+                    pass
+                stale.unlink()
+                return False
+            logger.warning(
+                f"Réservation abandonnée depuis {age:.0f}s reprise : {path.name}"
+            )
+            stale.unlink()
+            return ShardQueue._acquire(path, owner)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(owner, f)
+        return True
+
+    def claim(self, owner: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Réserve le prochain shard ni terminé, ni en échec, ni réservé.
+
+        Returns:
+            Shard réservé, ou None s'il n'en reste aucun
+        """
+        for shard in self.shards():
+            shard_id = shard["id"]
+            if (
+                self._marker(shard_id, "done").exists()
+                or self._marker(shard_id, "failed").exists()
+            ):
+                continue
+            if self._acquire(self._marker(shard_id, "claim"), owner):
+                if self._marker(shard_id, "done").exists():
+                    # Terminé entre la vérification et la réservation
+                    self.release(shard_id)
+                    continue
+                return shard
+        return None
+
+    def heartbeat(self, shard_id: int):
+        """Rafraîchit la réservation d'un shard en cours."""
+        try:
+            os.utime(self._marker(shard_id, "claim"))
+        except FileNotFoundError:
+            pass
+
+    def release(self, shard_id: int):
+        """Libère la réservation d'un shard."""
+        self._marker(shard_id, "claim").unlink(missing_ok=True)
+
+    def mark_done(self, shard_id: int, summary: Dict[str, Any]):
+        """Marque un shard comme terminé et libère sa réservation."""
+        _write_json(self._marker(shard_id, "done"), summary)
+        self.release(shard_id)
+
+    def mark_failed(self, shard_id: int, error: str):
+        """Marque un shard en échec (retenté au prochain lancement)."""
+        _write_json(self._marker(shard_id, "failed"), {"erreur": error, **_owner()})
+        self.release(shard_id)
+
+    def clear_failures(self):
+        """Rend les shards en échec à nouveau disponibles."""
+        for marker in self.shards_dir.glob("shard-*.failed"):
+            marker.unlink(missing_ok=True)
+
+    def done_summaries(self) -> Dict[int, Dict[str, Any]]:
+        """Bilans des shards terminés, par identifiant."""
+        summaries = {}
+        for shard in self.shards():
+            marker = self._marker(shard["id"], "done")
+            if marker.exists():
+                with open(marker, encoding="utf-8") as f:
+                    summaries[shard["id"]] = json.load(f)
+        return summaries
+
+    def status(self) -> Dict[str, int]:
+        """Nombre de shards par état."""
+        counts = {"termines": 0, "en_echec": 0, "en_cours": 0, "en_attente": 0}
+        for shard in self.shards():
+            shard_id = shard["id"]
+            if self._marker(shard_id, "done").exists():
+                counts["termines"] += 1
+            elif self._marker(shard_id, "failed").exists():
+                counts["en_echec"] += 1
+            elif self._marker(shard_id, "claim").exists():
+                counts["en_cours"] += 1
+            else:
+                counts["en_attente"] += 1
+        return counts
+
+    def claim_merge(self, owner: Dict[str, Any]) -> bool:
+        """Réserve la fusion (un seul processus la réalise)."""
+        return self._acquire(self.output_folder / MERGE_CLAIM_FILENAME, owner)
+
+    def cleanup(self):
+        """Supprime le plan, les sorties par shard et la réservation de fusion."""
+        # Le plan d'abord : tant qu'il existe, les marqueurs des shards aussi
+        self.plan_path.unlink(missing_ok=True)
+        shutil.rmtree(self.shards_dir, ignore_errors=True)
+        (self.output_folder / MERGE_CLAIM_FILENAME).unlink(missing_ok=True)
+
+
+class ShardMerger:
+    """Fusion des sorties des shards dans le dossier de sortie."""
+
+    @staticmethod
+    def _merge_geojson(shard_dirs: List[Path], output_folder: Path) -> Dict[str, str]:
+        relocated = {}
+        for shard_dir in shard_dirs:
+            for path in shard_dir.glob("*.geojson"):
+                target = output_folder / path.name
+                os.replace(path, target)
+                relocated[str(path)] = str(target)
+        # Itinéraires d'une génération précédente dans le même dossier
+        merged = set(relocated.values())
+        for path in output_folder.glob("*.geojson"):
+            if str(path) not in merged:
+                path.unlink()
+        return relocated
+
+    @staticmethod
+    def _merge_ndjson(shard_dirs: List[Path], output_folder: Path) -> Dict[str, Any]:
+        target = output_folder / NDJSON_FILENAME
+        tmp = target.with_suffix(".tmp")
+        relocated = {}
+        with open(tmp, "wb") as dst:
+            for shard_dir in shard_dirs:
+                path = shard_dir / NDJSON_FILENAME
+                if not path.exists():
+                    continue
+                # Début du fichier du shard dans le fichier fusionné
+                relocated[str(path)] = (str(target), dst.tell())
+                with open(path, "rb") as src:
+                    shutil.copyfileobj(src, dst)
+        os.replace(tmp, target)
+        return relocated
+
+    @staticmethod
+    def _merge_parquet(shard_dirs: List[Path], output_folder: Path) -> Dict[str, str]:
+        dataset = output_folder / PARQUET_DATASET_DIR
+        dataset.mkdir(parents=True, exist_ok=True)
+        relocated = {}
+        for shard_index, shard_dir in enumerate(shard_dirs):
+            parts = sorted((shard_dir / PARQUET_DATASET_DIR).glob("part-*.parquet"))
+            for part_index, part in enumerate(parts):
+                target = dataset / f"part-s{shard_index:04d}-{part_index:05d}.parquet"
+                os.replace(part, target)
+                relocated[str(part)] = str(target)
+        # Parties d'une génération précédente dans le même dossier
+        merged = set(relocated.values())
+        for part in dataset.glob("part-*.parquet"):
+            if str(part) not in merged:
+                part.unlink()
+        return relocated
+
+    @staticmethod
+    def _merge_geostore(shard_dirs: List[Path], output_folder: Path) -> Dict[str, str]:
+        target = output_folder / GEOSTORE_DIR
+        tmp = target.with_name(target.name + ".tmp")
+        GeometryStore.create(tmp)
+        relocated = {}
+        n_points, n_parts = 0, 0
+        with open(tmp / COORDS_FILENAME, "ab") as coords_file, open(
+            tmp / OFFSETS_FILENAME, "ab"
+        ) as offsets_file:
+            for shard_dir in shard_dirs:
+                store_dir = shard_dir / GEOSTORE_DIR
+                if not GeometryStore.is_store(store_dir):
+                    continue
+                store = GeometryStore(store_dir)
+                coords_file.write(np.ascontiguousarray(store.coords, COORDS_DTYPE))
+                offsets_file.write(
+                    (store.offsets[1:] + n_points).astype(OFFSETS_DTYPE).tobytes()
+                )
+                n_points += store.n_points
+                for part in store.attribute_parts():
+                    shutil.copyfile(part, tmp / f"attributs-{n_parts:05d}.parquet")
+                    n_parts += 1
+                relocated[str(store_dir)] = str(target)
+                del store
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(tmp, target)
+        return relocated
+
+    @staticmethod
+    def _relocate(output: Optional[str], relocated: Dict[str, Any]) -> Optional[str]:
+        """Nouvel emplacement d'une sortie après fusion."""
+        if not output or output in relocated:
+            return relocated.get(output, output)
+        # NDJSON : "chemin@décalage", décalé du début du shard dans la fusion
+        path, separator, offset = output.rpartition("@")
+        if separator and path in relocated:
+            target, base = relocated[path]
+            return f"{target}@{base + int(offset)}"
+        return output
+
+    @staticmethod
+    def merge_manifests(
+        shard_dirs: List[Path], output_folder: Path, relocated: Dict[str, Any]
+    ) -> int:
+        """
+        Fusionne les journaux des shards, emplacements des sorties mis à jour.
+
+        Returns:
+            Nombre de paires du journal fusionné
+        """
+        entries = {}
+        for shard_dir in shard_dirs:
+            if not (shard_dir / MANIFEST_FILENAME).exists():
+                continue
+            shard_manifest = RunManifest(shard_dir, resume=True)
+            shard_manifest.close()
+            for key, entry in shard_manifest.entries.items():
+                if "output" in entry:
+                    entry["output"] = ShardMerger._relocate(entry["output"], relocated)
+                entries[key] = entry
+
+        manifest = RunManifest(output_folder)
+        manifest.entries = entries
+        manifest.compact()
+        manifest.close()
+        return len(entries)
+
+    @staticmethod
+    def merge_inputs(shard_dirs: List[Path], output_folder: Path):
+        """Fusionne les empreintes d'entrées et les tables de zones d'arrêt."""
+        snapshots = [
+            pd.read_parquet(d / INPUT_SNAPSHOT_FILENAME)
+            for d in shard_dirs
+            if (d / INPUT_SNAPSHOT_FILENAME).exists()
+        ]
+        if snapshots:
+            path = output_folder / INPUT_SNAPSHOT_FILENAME
+            tmp = path.with_suffix(".tmp")
+            pd.concat(snapshots, ignore_index=True).drop_duplicates(
+                ["type", "id"]
+            ).to_parquet(tmp, index=False)
+            tmp.replace(path)
+
+        zones = []
+        for d in shard_dirs:
+            if (d / STOP_AREAS_FILENAME).exists():
+                table = pd.read_csv(d / STOP_AREAS_FILENAME, dtype=str)
+                # Les numéros de zone sont propres à chaque shard
+                table.insert(0, "shard", d.name)
+                zones.append(table)
+        if zones:
+            pd.concat(zones, ignore_index=True).to_csv(
+                output_folder / STOP_AREAS_FILENAME, index=False
+            )
+
+    @staticmethod
+    def merge_reports(reports: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Agrège les rapports d'exécution des shards.
+
+        Durées d'étapes, chronomètres, requêtes, erreurs et compteurs sont
+        additionnés ; les pics mémoire et latences maximales sont les maxima
+        des shards. Les percentiles de latence ne s'additionnant pas, ils
+        restent dans les rapports par shard ("par_shard").
+
+        Args:
+            reports: rapports par nom de shard
+
+        Returns:
+            Rapport agrégé
+        """
+        stages: Dict[str, Dict[str, float]] = {}
+        timers: Dict[str, Dict[str, float]] = {}
+        latencies: Dict[str, Dict[str, float]] = {}
+        errors: Dict[str, int] = {}
+        values: Dict[str, Any] = {}
+        for report in reports.values():
+            for name, entry in report.get("etapes", {}).items():
+                total = stages.setdefault(
+                    name, {"duree_s": 0.0, "appels": 0, "pic_rss_processus_mo": 0.0}
+                )
+                total["duree_s"] = round(total["duree_s"] + entry["duree_s"], 3)
+                total["appels"] += entry["appels"]
+                total["pic_rss_processus_mo"] = max(
+                    total["pic_rss_processus_mo"], entry["pic_rss_processus_mo"]
+                )
+            for name, entry in report.get("chronometres", {}).items():
+                total = timers.setdefault(name, {"duree_s": 0.0, "appels": 0})
+                total["duree_s"] = round(total["duree_s"] + entry["duree_s"], 3)
+                total["appels"] += entry["appels"]
+            for kind, entry in report.get("latences", {}).items():
+                total = latencies.setdefault(
+                    kind, {"requetes": 0, "somme_s": 0.0, "max_s": 0.0}
+                )
+                total["requetes"] += entry["requetes"]
+                total["somme_s"] += entry["moyenne_s"] * entry["requetes"]
+                total["max_s"] = max(total["max_s"], entry["max_s"])
+            for kind, count in report.get("erreurs", {}).items():
+                errors[kind] = errors.get(kind, 0) + count
+            for name, value in report.get("valeurs", {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values[name] = values.get(name, 0) + value
+        for entry in latencies.values():
+            total = entry.pop("somme_s")
+            entry["moyenne_s"] = (
+                round(total / entry["requetes"], 4) if entry["requetes"] else 0.0
+            )
+
+        starts = [datetime.fromisoformat(r["debut"]) for r in reports.values()]
+        elapsed = (datetime.now() - min(starts)).total_seconds() if starts else 0.0
+        # Débit et concurrence ne s'additionnent pas
+        values.pop("concurrence", None)
+        values["itineraires_par_seconde"] = (
+            round(values.get("paires", 0) / elapsed, 2) if elapsed else 0
+        )
+        return {
+            "debut": min(starts).isoformat(timespec="seconds") if starts else None,
+            "duree_totale_s": round(elapsed, 3),
+            "duree_cumulee_shards_s": round(
+                sum(r["duree_totale_s"] for r in reports.values()), 3
+            ),
+            "pic_rss_mo": max((r["pic_rss_mo"] for r in reports.values()), default=0),
+            "shards": len(reports),
+            "etapes": stages,
+            "chronometres": timers,
+            "latences": latencies,
+            "erreurs": errors,
+            "valeurs": values,
+            "par_shard": reports,
+        }
+
+    @classmethod
+    def merge(cls, queue: ShardQueue, output_format: str) -> Dict[str, Any]:
+        """
+        Fusionne les shards terminés dans le dossier de sortie, puis supprime
+        les sorties par shard.
+
+        Args:
+            queue: plan et état des shards
+            output_format: format de sortie des shards
+
+        Returns:
+            Rapport d'exécution agrégé
+        """
+        output_folder = queue.output_folder
+        shard_dirs = [
+            queue.shard_dir(shard["id"])
+            for shard in queue.load()["shards"]
+            if queue.shard_dir(shard["id"]).exists()
+        ]
+        logger.info(f"Fusion de {len(shard_dirs)} shards dans {output_folder}")
+
+        relocated = getattr(cls, f"_merge_{output_format}")(shard_dirs, output_folder)
+        pairs = cls.merge_manifests(shard_dirs, output_folder, relocated)
+        cls.merge_inputs(shard_dirs, output_folder)
+
+        reports = {}
+        for shard_dir in shard_dirs:
+            if (shard_dir / RUN_REPORT_FILENAME).exists():
+                with open(shard_dir / RUN_REPORT_FILENAME, encoding="utf-8") as f:
+                    reports[shard_dir.name] = json.load(f)
+            for profile in shard_dir.glob("profil_*.prof"):
+                os.replace(
+                    profile, output_folder / f"{profile.stem}_{shard_dir.name}.prof"
+                )
+        report = cls.merge_reports(reports)
+        report["valeurs"]["paires_journal"] = pairs
+        _write_json(output_folder / RUN_REPORT_FILENAME, report)
+
+        queue.cleanup()
+        return report
+
+
+def run_shard_worker(
+    output_folder: Path,
+    orchestrator_options: Dict[str, Any],
+    generate_options: Dict[str, Any],
+) -> int:
+    """
+    Traite des shards jusqu'à épuisement du plan (exécuté dans un processus
+    du pool, ou directement sur un nœud).
+
+    Args:
+        output_folder: dossier de sortie de la génération répartie
+        orchestrator_options: arguments de `ItineraryOrchestrator`
+        generate_options: arguments de `generate_itineraries` (hors dossier
+            de sortie, arrêts et reprise)
+
+    Returns:
+        Nombre de shards traités par ce processus
+    """
+    queue = ShardQueue(output_folder)
+    orchestrator = ItineraryOrchestrator(**orchestrator_options)
+    owner = _owner()
+    processed = 0
+    while True:
+        shard = queue.claim(owner)
+        if shard is None:
+            return processed
+        shard_id, shard_dir = shard["id"], queue.shard_dir(shard["id"])
+        logger.info(
+            f"Shard {shard_id} : {len(shard['arrets'])} arrêts, "
+            f"~{shard['paires_estimees']} paires ({', '.join(shard['groupes'][:5])}"
+            f"{'...' if len(shard['groupes']) > 5 else ''})"
+        )
+
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(SHARD_HEARTBEAT_SECONDS):
+                queue.heartbeat(shard_id)
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        start = time.perf_counter()
+        try:
+            count = orchestrator.generate_itineraries(
+                output_folder=shard_dir,
+                stop_ids=shard["arrets"],
+                # Un shard repris (réservation périmée) repart de son journal
+                resume=(shard_dir / MANIFEST_FILENAME).exists(),
+                **generate_options,
+            )
+        except Exception as e:
+            logger.error(f"Échec du shard {shard_id} : {e}", exc_info=True)
+            queue.mark_failed(shard_id, repr(e))
+            continue
+        finally:
+            stop.set()
+            thread.join()
+        queue.mark_done(
+            shard_id,
+            {
+                **owner,
+                "itineraires": count,
+                "duree_s": round(time.perf_counter() - start, 3),
+            },
+        )
+        processed += 1
+
+
+def _already_merged(output_folder: Path) -> int:
+    """
+    Cas d'un plan supprimé pendant le traitement : un autre processus a
+    fusionné les shards.
+
+    Returns:
+        Nombre d'itinéraires du journal fusionné (cf. rapport d'exécution)
+    """
+    report_path = Path(output_folder) / RUN_REPORT_FILENAME
+    pairs = 0
+    if report_path.exists():
+        with open(report_path, encoding="utf-8") as f:
+            pairs = json.load(f).get("valeurs", {}).get("paires_journal", 0)
+    logger.info(f"Shards déjà fusionnés par un autre processus ({pairs} itinéraires)")
+    return pairs
+
+
+def run_sharded(
+    orchestrator_options: Dict[str, Any],
+    output_folder: Path,
+    n_shards: int,
+    shard_by: str = DEFAULT_SHARD_KEY,
+    workers: int = 1,
+    poi_path: Optional[str] = None,
+    arrets_path: Optional[str] = None,
+    max_distance: float = MAX_DISTANCE,
+    limit: Optional[int] = None,
+    communes: Optional[list] = None,
+    output_format: str = "geojson",
+    max_per_type: Optional[int] = None,
+    radii: Optional[List[float]] = None,
+    routing_profiles: Optional[List[str]] = None,
+) -> int:
+    """
+    Génération répartie : planification, traitement des shards par un pool
+    de processus, puis fusion quand tous les shards sont terminés.
+
+    Relancée sur le même dossier de sortie (sur ce nœud ou sur d'autres), elle
+    reprend le plan publié et ne traite que les shards restants.
+
+    Args:
+        orchestrator_options: arguments de `ItineraryOrchestrator`
+        output_folder: dossier de sortie (partagé entre les nœuds)
+        n_shards: nombre de shards
+        shard_by: "commune" ou "epci"
+        workers: nombre de processus de ce nœud
+        poi_path: chemin vers le fichier POI
+        arrets_path: chemin vers le fichier arrêts
+        max_distance: rayon de recherche (m)
+        limit: limite du nombre d'itinéraires par shard (pour tests)
+        communes: liste de codes INSEE de communes à filtrer (optionnel)
+        output_format: format de sortie
+        max_per_type: POI conservés par type et par arrêt (optionnel)
+        radii: rayons à comparer (cf. `generate_itineraries`) ; le plus grand
+            remplace max_distance
+        routing_profiles: profil de routing (un seul, les sorties des shards
+            n'étant pas réparties par profil)
+
+    Returns:
+        Nombre d'itinéraires générés (tous shards terminés confondus)
+    """
+    if radii:
+        max_distance = max(radii)
+    output_folder = Path(output_folder)
+    queue = ShardQueue(output_folder)
+    plan = queue.load()
+    if plan is None:
+        df_poi, df_arrets, poi_tree = ItineraryOrchestrator.load_inputs(
+            poi_path,
+            arrets_path,
+            communes,
+            orchestrator_options.get("index_dir"),
+            orchestrator_options.get("poi_parquet_cache", False),
+        )
+        units = None
+        if orchestrator_options.get("cluster_stops"):
+            _, units = StopAreaService.build_stop_areas(
+                df_arrets,
+                orchestrator_options.get("stop_area_radius", STOP_AREA_RADIUS),
+            )
+        estimates = ShardPlanner.estimate_pairs(
+            df_arrets, df_poi, max_distance, poi_tree, max_per_type
+        )
+        plan = queue.publish(
+            {
+                "cle": shard_by,
+                "format": output_format,
+                "distance": max_distance,
+                "communes": communes,
+                "cree": datetime.now().isoformat(timespec="seconds"),
+                "shards": ShardPlanner.plan(
+                    df_arrets, estimates, n_shards, shard_by, units
+                ),
+            }
+        )
+    if plan["format"] != output_format:
+        raise ValueError(
+            f"Le plan de shards de {output_folder} a été créé pour le format "
+            f"{plan['format']} ; relancez avec ce format ou supprimez {queue.plan_path}"
+        )
+
+    estimates = [shard["paires_estimees"] for shard in plan["shards"]]
+    logger.info(
+        f"Plan : {len(estimates)} shards par {plan['cle']}, "
+        f"{sum(estimates)} paires estimées "
+        f"(de {min(estimates, default=0)} à {max(estimates, default=0)} par shard), "
+        f"{workers} processus sur ce nœud"
+    )
+    queue.clear_failures()
+
+    generate_options = {
+        "poi_path": poi_path,
+        "arrets_path": arrets_path,
+        "max_distance": max_distance,
+        "limit": limit,
+        "communes": communes,
+        "output_format": output_format,
+        "max_per_type": max_per_type,
+        "radii": radii,
+        "routing_profiles": routing_profiles,
+    }
+    if workers <= 1:
+        run_shard_worker(output_folder, orchestrator_options, generate_options)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    run_shard_worker,
+                    output_folder,
+                    orchestrator_options,
+                    generate_options,
+                )
+                for _ in range(workers)
+            ]
+            for future in futures:
+                future.result()
+
+    status = queue.status()
+    count = sum(s["itineraires"] for s in queue.done_summaries().values())
+    if queue.load() is None:
+        return _already_merged(output_folder)
+    if status["termines"] < len(plan["shards"]):
+        logger.warning(
+            f"Shards : {status['termines']} terminés, {status['en_cours']} en cours "
+            f"sur d'autres processus, {status['en_echec']} en échec ; la fusion "
+            "sera faite par le dernier processus (ou en relançant la commande)"
+        )
+        return count
+    if not queue.claim_merge(_owner()):
+        logger.info("Fusion déjà en cours dans un autre processus")
+        return count
+    if queue.load() is None:
+        # Réservation libérée par la fin d'une fusion concurrente
+        (output_folder / MERGE_CLAIM_FILENAME).unlink(missing_ok=True)
+        return _already_merged(output_folder)
+
+    report = ShardMerger.merge(queue, output_format)
+    logger.info(
+        f"=== Génération répartie terminée : {count} itinéraires, "
+        f"{report['shards']} shards, {report['duree_totale_s']:.1f}s "
+        f"(temps cumulé des shards {report['duree_cumulee_shards_s']:.1f}s) ==="
+    )
+    return count
@@ -6,9 +6,16 @@ import logging
 import numpy as np
 import pandas as pd
 from scipy.spatial import cKDTree
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
-from .config import MAX_DISTANCE, EARTH_RADIUS_M
+from .config import (
+    MAX_DISTANCE,
+    EARTH_RADIUS_M,
+    PROJECTION_REF_LAT,
+    PAIR_SEARCH_CHUNK_SIZE,
+    POINT_IN_POLYGON_CHUNK_SIZE,
+)
+from .run_metrics import measure_stage
 
 logger = logging.getLogger(__name__)
 
@@ -44,86 +51,269 @@ class SpatialService:
         return EARTH_RADIUS_M * c
 
     @staticmethod
-    def find_nearby_pois(
+    def project_to_metric(
+        lats: np.ndarray, lons: np.ndarray, ref_lat: float = PROJECTION_REF_LAT
+    ) -> np.ndarray:
+        """
+        Projette des coordonnées géographiques en mètres (équirectangulaire local).
+
+        x = R * lon * cos(ref_lat), y = R * lat : les distances euclidiennes sont
+        exactes à la latitude de référence et l'erreur d'échelle en x vaut
+        cos(ref_lat) / cos(lat) ailleurs (< 1 % sur l'Île-de-France).
+
+        Args:
+            lats, lons: tableaux numpy des coordonnées (degrés)
+            ref_lat: latitude de référence de la projection (degrés)
+
+        Returns:
+            Tableau numpy (N, 2) des coordonnées projetées (m)
+        """
+        x = EARTH_RADIUS_M * np.radians(lons) * np.cos(np.radians(ref_lat))
+        y = EARTH_RADIUS_M * np.radians(lats)
+        return np.column_stack([x, y])
+
+    @staticmethod
+    def projection_radius(
+        max_distance: float, lats: np.ndarray, ref_lat: float = PROJECTION_REF_LAT
+    ) -> float:
+        """
+        Rayon de recherche en mètres projetés garantissant de couvrir
+        `max_distance` réels pour toutes les latitudes données.
+
+        Args:
+            max_distance: rayon réel en mètres
+            lats: latitudes (degrés) des points concernés
+            ref_lat: latitude de référence de la projection (degrés)
+
+        Returns:
+            Rayon à utiliser dans l'espace projeté (m)
+        """
+        max_abs_lat = np.radians(np.max(np.abs(lats)))
+        scale = max(1.0, np.cos(np.radians(ref_lat)) / np.cos(max_abs_lat))
+        # Marge pour l'écart plan / sphère (négligeable à quelques km)
+        return max_distance * scale * 1.001
+
+    @staticmethod
+    def points_in_polygons(
+        lons: np.ndarray, lats: np.ndarray, rings: List[np.ndarray]
+    ) -> np.ndarray:
+        """
+        Test point-dans-polygone vectorisé (lancer de rayon, règle pair-impair).
+
+        Tous les anneaux (contours extérieurs, trous, polygones disjoints) sont
+        traités ensemble : un point est intérieur s'il traverse un nombre
+        impair d'arêtes. Chaque anneau n'est testé que contre les points de son
+        emprise, par blocs de POINT_IN_POLYGON_CHUNK_SIZE points x segments.
+
+        Args:
+            lons, lats: tableaux numpy des coordonnées des points (degrés)
+            rings: anneaux en tableaux (M, 2) de (lon, lat)
+
+        Returns:
+            Masque booléen des points intérieurs
+        """
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        inside = np.zeros(len(lons), dtype=bool)
+        for ring in rings:
+            ring = np.asarray(ring, dtype=np.float64)
+            if len(ring) < 3:
+                continue
+            x1, y1 = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+            candidates = np.flatnonzero(
+                (lons >= x1.min())
+                & (lons <= x1.max())
+                & (lats >= y1.min())
+                & (lats <= y1.max())
+            )
+            step = max(1, POINT_IN_POLYGON_CHUNK_SIZE // len(ring))
+            for start in range(0, len(candidates), step):
+                rows = candidates[start : start + step]
+                px, py = lons[rows, None], lats[rows, None]
+                # Arêtes coupant l'horizontale du point, à droite de celui-ci
+                straddles = (y1 > py) != (y2 > py)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+                crossings = np.count_nonzero(straddles & (px < x_cross), axis=1)
+                inside[rows] ^= (crossings % 2).astype(bool)
+        return inside
+
+    @staticmethod
+    @measure_stage("recherche_paires")
+    def find_nearby_pairs(
         df_arrets: pd.DataFrame,
         df_poi: pd.DataFrame,
         max_distance: float = MAX_DISTANCE,
-    ) -> List[Tuple[str, str, float]]:
+        poi_tree: Optional[cKDTree] = None,
+        max_per_type: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
-        Trouve les paires (arrêt, POI) dans un rayon donné en utilisant KDTree.
+        Trouve les paires (arrêt, POI) dans un rayon donné, sous forme de tableaux.
+
+        Les index KDTree des arrêts et des POI sont construits sur des coordonnées
+        projetées en mètres et croisés par blocs d'arrêts
+        (`sparse_distance_matrix`) : aucune boucle Python par arrêt. Les
+        candidats sont ensuite filtrés par la distance haversine exacte.
 
         Args:
             df_arrets: DataFrame des arrêts
             df_poi: DataFrame des POI
             max_distance: rayon de recherche en mètres
+            poi_tree: KDTree des POI déjà construit sur `project_to_metric`
+                (optionnel, cf. index préparé)
+            max_per_type: ne garde, pour chaque arrêt, que les `max_per_type`
+                POI les plus proches de chaque type_lieu (None = tous les POI
+                du rayon)
 
         Returns:
-            Liste de tuples (arret_id, poi_id, distance_m)
+            Tuple (positions des arrêts dans df_arrets, positions des POI dans
+            df_poi, distances en mètres en float32), triés par arrêt puis POI
         """
         logger.info(
             f"Recherche des POIs dans un rayon de {max_distance}m autour des arrêts"
         )
 
-        # Conversion des coordonnées en radians pour KDTree
-        coords_arrets = np.radians(
-            df_arrets[["ArRLongitude", "ArRLatitude"]].to_numpy()
+        poi_lat_arr = df_poi["poi_lat"].to_numpy(dtype=np.float64)
+        poi_lon_arr = df_poi["poi_lon"].to_numpy(dtype=np.float64)
+        arret_lat_arr = df_arrets["ArRLatitude"].to_numpy(dtype=np.float64)
+        arret_lon_arr = df_arrets["ArRLongitude"].to_numpy(dtype=np.float64)
+
+        if len(poi_lat_arr) == 0 or len(arret_lat_arr) == 0:
+            return (
+                np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.float32),
+            )
+
+        # Index sur coordonnées projetées en mètres
+        coords_arrets = SpatialService.project_to_metric(arret_lat_arr, arret_lon_arr)
+        tree_poi = poi_tree
+        if tree_poi is None:
+            with measure_stage("construction_kdtree"):
+                tree_poi = cKDTree(
+                    SpatialService.project_to_metric(poi_lat_arr, poi_lon_arr)
+                )
+
+        radius = SpatialService.projection_radius(
+            max_distance, np.concatenate([arret_lat_arr, poi_lat_arr])
+        )
+        poi_types = (
+            pd.factorize(df_poi["type_lieu"])[0] if max_per_type is not None else None
         )
-        coords_poi = np.radians(df_poi[["poi_lon", "poi_lat"]].to_numpy())
 
-        tree = cKDTree(coords_poi)
+        # Les arrêts sont traités par blocs pour borner la mémoire des candidats
+        chunks = []
+        in_radius = 0
+        for start in range(0, len(coords_arrets), PAIR_SEARCH_CHUNK_SIZE):
+            stop = start + PAIR_SEARCH_CHUNK_SIZE
+            tree_arrets = cKDTree(coords_arrets[start:stop])
 
-        # Conversion de la distance en radians (approximation)
-        max_distance_rad = max_distance / 111000.0
+            # Toutes les paires candidates du bloc (tableau structuré i, j, v)
+            candidates = tree_arrets.sparse_distance_matrix(
+                tree_poi, radius, output_type="ndarray"
+            )
+            arret_idx = candidates["i"].astype(np.int64) + start
+            poi_idx = candidates["j"].astype(np.int64)
+            del candidates
 
-        # Requête batch sur tous les arrêts
-        neighbours_list = tree.query_ball_point(coords_arrets, r=max_distance_rad)
+            # Distances haversine vectorisées et filtrage par distance max
+            dists = SpatialService.haversine_vectorized(
+                arret_lat_arr[arret_idx],
+                arret_lon_arr[arret_idx],
+                poi_lat_arr[poi_idx],
+                poi_lon_arr[poi_idx],
+            )
+            mask = dists <= max_distance
 
-        # Extraction des arrays pour accès rapide
-        poi_lat_arr = df_poi["poi_lat"].to_numpy()
-        poi_lon_arr = df_poi["poi_lon"].to_numpy()
-        poi_uid_arr = df_poi.get("poi_uid", df_poi.get("id")).to_numpy()
+            arret_idx, poi_idx = arret_idx[mask], poi_idx[mask]
+            dists = dists[mask].astype(np.float32)
+            in_radius += len(dists)
+            if poi_types is not None:
+                # Les paires d'un arrêt sont toutes dans le même bloc
+                mask = SpatialService.select_nearest_per_type(
+                    arret_idx, poi_idx, dists, poi_types, max_per_type
+                )
+                arret_idx, poi_idx, dists = arret_idx[mask], poi_idx[mask], dists[mask]
+            order = np.lexsort((poi_idx, arret_idx))
+            chunks.append((arret_idx[order], poi_idx[order], dists[order]))
 
-        arret_ids = df_arrets["ArRId"].to_numpy()
-        arret_lat_arr = df_arrets["ArRLatitude"].to_numpy()
-        arret_lon_arr = df_arrets["ArRLongitude"].to_numpy()
+        arret_idx = np.concatenate([c[0] for c in chunks])
+        poi_idx = np.concatenate([c[1] for c in chunks])
+        dists = np.concatenate([c[2] for c in chunks])
 
-        pairs = []
+        logger.info(f"Trouvé {in_radius} paires arrêt-POI dans le rayon spécifié")
+        if poi_types is not None:
+            logger.info(
+                f"{len(dists)} paires conservées ({max_per_type} POI les plus "
+                "proches de chaque type par arrêt)"
+            )
+        return arret_idx, poi_idx, dists
 
-        # Traitement vectorisé par arrêt
-        for i, nbrs in enumerate(neighbours_list):
-            if not nbrs:
-                continue
+    @staticmethod
+    def select_nearest_per_type(
+        origin_idx: np.ndarray,
+        poi_idx: np.ndarray,
+        distances: np.ndarray,
+        poi_types: np.ndarray,
+        k: int,
+    ) -> np.ndarray:
+        """
+        Sélectionne les k POI les plus proches de chaque type pour chaque origine.
 
-            lat0 = arret_lat_arr[i]
-            lon0 = arret_lon_arr[i]
+        Un tri lexicographique (origine, type, distance) suivi d'un rang dans
+        chaque groupe (origine, type) : aucune boucle Python.
 
-            # Coords des POI voisins
-            sel_poi_lats = poi_lat_arr[nbrs]
-            sel_poi_lons = poi_lon_arr[nbrs]
+        Args:
+            origin_idx: origine (arrêt ou zone) de chaque paire
+            poi_idx: positions des POI des paires
+            distances: distances des paires (m)
+            poi_types: code du type_lieu de chaque POI (par position dans df_poi)
+            k: nombre de POI conservés par origine et par type
 
-            # Distances haversine vectorisées
-            dists = SpatialService.haversine_vectorized(
-                lat0, lon0, sel_poi_lats, sel_poi_lons
-            )
+        Returns:
+            Masque booléen des paires conservées (ordre des paires inchangé)
+        """
+        types = poi_types[poi_idx]
+        # À distance égale, le POI de plus petite position (sélection stable)
+        order = np.lexsort((poi_idx, distances, types, origin_idx))
+        sorted_origin, sorted_type = origin_idx[order], types[order]
+        new_group = np.ones(len(order), dtype=bool)
+        new_group[1:] = (sorted_origin[1:] != sorted_origin[:-1]) | (
+            sorted_type[1:] != sorted_type[:-1]
+        )
+        group_start = np.maximum.accumulate(
+            np.where(new_group, np.arange(len(order)), 0)
+        )
+        keep = np.zeros(len(order), dtype=bool)
+        keep[order[np.arange(len(order)) - group_start < k]] = True
+        return keep
 
-            # Filtrage par distance max
-            mask = dists <= max_distance
-            if not np.any(mask):
-                continue
+    @staticmethod
+    def find_nearby_pois(
+        df_arrets: pd.DataFrame,
+        df_poi: pd.DataFrame,
+        max_distance: float = MAX_DISTANCE,
+        max_per_type: Optional[int] = None,
+    ) -> List[Tuple[str, str, float]]:
+        """
+        Trouve les paires (arrêt, POI) dans un rayon donné en utilisant KDTree.
 
-            sel_indices = np.array(nbrs)[mask]
-            sel_dists = dists[mask]
-            sel_poi_uids = poi_uid_arr[sel_indices]
-
-            # Ajout des paires
-            arret_id = arret_ids[i]
-            pairs.extend(
-                zip(
-                    [arret_id] * len(sel_poi_uids),
-                    sel_poi_uids.tolist(),
-                    sel_dists.tolist(),
-                )
-            )
+        Variante de `find_nearby_pairs` renvoyant une liste de tuples.
 
-        logger.info(f"Trouvé {len(pairs)} paires arrêt-POI dans le rayon spécifié")
-        return pairs
+        Args:
+            df_arrets: DataFrame des arrêts
+            df_poi: DataFrame des POI
+            max_distance: rayon de recherche en mètres
+            max_per_type: nombre maximal de POI par type_lieu et par arrêt (les
+                plus proches ; None = tous les POI du rayon)
+
+        Returns:
+            Liste de tuples (arret_id, poi_id, distance_m)
+        """
+        arret_idx, poi_idx, dists = SpatialService.find_nearby_pairs(
+            df_arrets, df_poi, max_distance, max_per_type=max_per_type
+        )
+        arret_ids = df_arrets["ArRId"].to_numpy()[arret_idx]
+        poi_uids = df_poi.get("poi_uid", df_poi.get("id")).to_numpy()[poi_idx]
+        return list(zip(arret_ids.tolist(), poi_uids.tolist(), dists.tolist()))
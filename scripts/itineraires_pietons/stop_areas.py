@@ -0,0 +1,249 @@
+"""
+Regroupement des arrêts en zones d'arrêt (Business Logic Layer).
+
+Une même gare apparaît souvent sous plusieurs ArRId (une entrée par mode ou
+par source : "Gare de Trappes" / "Trappes", "Le Vésinet-Centre" /
+"Le Vésinet - Centre"). Les arrêts proches dont les noms normalisés
+correspondent sont regroupés en une zone : l'itinéraire est calculé une seule
+fois par (zone, POI) puis recopié pour chaque arrêt membre dont le POI est
+dans le rayon.
+"""
+
+import logging
+import re
+import unicodedata
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from .config import (
+    STOP_AREA_RADIUS,
+    STOP_AREAS_FILENAME,
+    STOP_NAME_MIN_PREFIX_WORDS,
+    STOP_NAME_STOPWORDS,
+)
+from .spatial_service import SpatialService
+from .run_metrics import measure_stage
+
+logger = logging.getLogger(__name__)
+
+
+class StopAreaService:
+    """Service de regroupement des arrêts d'une même gare en zones d'arrêt."""
+
+    @staticmethod
+    def normalize_name(name: str) -> Tuple[str, ...]:
+        """
+        Normalise un nom d'arrêt en suite de mots comparables.
+
+        Minuscules, sans accents ni ponctuation, sans mots génériques
+        ("gare", "de", "la"...) : "Gare de la Verrière" -> ("verriere",).
+
+        Args:
+            name: nom de l'arrêt
+
+        Returns:
+            Tuple des mots significatifs
+        """
+        text = unicodedata.normalize("NFKD", str(name or ""))
+        text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+        words = re.split(r"[^a-z0-9]+", text)
+        return tuple(w for w in words if w and w not in STOP_NAME_STOPWORDS)
+
+    @staticmethod
+    def names_match(a: Tuple[str, ...], b: Tuple[str, ...]) -> bool:
+        """
+        Deux noms normalisés désignent-ils le même lieu ?
+
+        Vrai si les noms sont égaux, ou si l'un prolonge l'autre sur au moins
+        STOP_NAME_MIN_PREFIX_WORDS mots ("saint quentin en yvelines" /
+        "saint quentin en yvelines montigny...", mais pas "saint" / "saint denis").
+        """
+        if not a or not b:
+            return False
+        if a == b:
+            return True
+        shortest = min(len(a), len(b))
+        return shortest >= STOP_NAME_MIN_PREFIX_WORDS and a[:shortest] == b[:shortest]
+
+    @staticmethod
+    @measure_stage("zones_arrets")
+    def build_stop_areas(
+        df_arrets: pd.DataFrame, radius: float = STOP_AREA_RADIUS
+    ) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Regroupe les arrêts en zones d'arrêt.
+
+        Deux arrêts sont reliés s'ils sont à moins de `radius` mètres et que
+        leurs noms correspondent ; les zones sont les composantes connexes.
+        Chaque zone est représentée par l'arrêt membre le plus proche du
+        barycentre de la zone (origine des itinéraires) ; "rayon_zone" est la
+        distance (m) du représentant à son membre le plus éloigné.
+
+        Args:
+            df_arrets: DataFrame des arrêts
+            radius: distance maximale entre deux arrêts d'une même zone (m)
+
+        Returns:
+            Tuple (df_zones, zone_of) : une ligne par zone (attributs de l'arrêt
+            représentant, plus "zone_id", "nb_arrets" et "rayon_zone"), et
+            l'indice de zone de chaque arrêt (par position dans df_arrets)
+        """
+        n = len(df_arrets)
+        lats = df_arrets["ArRLatitude"].to_numpy(dtype=np.float64)
+        lons = df_arrets["ArRLongitude"].to_numpy(dtype=np.float64)
+        xy = SpatialService.project_to_metric(lats, lons)
+        names = [StopAreaService.normalize_name(name) for name in df_arrets["ArRName"]]
+
+        close = cKDTree(xy).query_pairs(
+            SpatialService.projection_radius(radius, lats), output_type="ndarray"
+        )
+        keep = [StopAreaService.names_match(names[i], names[j]) for i, j in close]
+        close = close[np.asarray(keep, dtype=bool)]
+        graph = coo_matrix(
+            (np.ones(len(close)), (close[:, 0], close[:, 1])), shape=(n, n)
+        )
+        n_zones, zone_of = connected_components(graph, directed=False)
+
+        # Représentant : membre le plus proche du barycentre de sa zone
+        counts = np.bincount(zone_of, minlength=n_zones)
+        centroid = (
+            np.column_stack(
+                [
+                    np.bincount(zone_of, weights=xy[:, k], minlength=n_zones)
+                    for k in (0, 1)
+                ]
+            )
+            / counts[:, None]
+        )
+        offset = np.linalg.norm(xy - centroid[zone_of], axis=1)
+        order = np.lexsort((offset, zone_of))
+        first = np.cumsum(counts) - counts
+        representative = order[first]
+
+        df_zones = df_arrets.take(representative).reset_index(drop=True)
+        df_zones["zone_id"] = np.arange(n_zones)
+        df_zones["nb_arrets"] = counts
+        offsets_m = SpatialService.haversine_vectorized(
+            lats[representative[zone_of]], lons[representative[zone_of]], lats, lons
+        )
+        df_zones["rayon_zone"] = np.maximum.reduceat(offsets_m[order], first)
+
+        logger.info(
+            f"Regroupement des arrêts : {n} arrêts -> {n_zones} zones d'arrêt "
+            f"(rayon {radius:.0f}m)"
+        )
+        return df_zones, zone_of
+
+    @staticmethod
+    def expand_pairs(
+        zone_idx: np.ndarray,
+        poi_idx: np.ndarray,
+        zone_of: np.ndarray,
+        df_arrets: pd.DataFrame,
+        df_poi: pd.DataFrame,
+        max_distance: float,
+        max_per_type: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Répartit les paires (zone, POI) sur les arrêts membres de chaque zone.
+
+        Les paires des zones doivent avoir été cherchées à `max_distance` plus
+        le "rayon_zone" de chaque zone : chaque arrêt membre ne garde que les
+        POI situés à moins de `max_distance` de lui-même, de sorte que les
+        paires sont celles qu'aurait données une recherche arrêt par arrêt.
+
+        Args:
+            zone_idx: positions des zones des paires
+            poi_idx: positions des POI des paires
+            zone_of: indice de zone de chaque arrêt
+            df_arrets: DataFrame des arrêts
+            df_poi: DataFrame des POI
+            max_distance: rayon de recherche de chaque arrêt (m)
+            max_per_type: ne garde, pour chaque arrêt, que les `max_per_type`
+                POI les plus proches de chaque type_lieu (None = tous)
+
+        Returns:
+            Tuple (arret_idx, poi_idx, distances, zone_idx) : une entrée par
+            paire arrêt-POI, les arrêts d'une même paire (zone, POI) étant
+            consécutifs ; les distances à vol d'oiseau sont celles de l'arrêt
+            membre (m) et `zone_idx` donne la zone de chaque paire
+        """
+        counts = np.bincount(zone_of)
+        members = np.argsort(zone_of, kind="stable")
+        first = np.cumsum(counts) - counts
+
+        repeats = counts[zone_idx]
+        route_idx = np.repeat(np.arange(len(zone_idx)), repeats)
+        rank = np.arange(len(route_idx)) - np.repeat(
+            np.cumsum(repeats) - repeats, repeats
+        )
+        arret_idx = members[first[zone_idx[route_idx]] + rank]
+        poi_idx = poi_idx[route_idx]
+
+        distances = SpatialService.haversine_vectorized(
+            df_arrets["ArRLatitude"].to_numpy(dtype=np.float64)[arret_idx],
+            df_arrets["ArRLongitude"].to_numpy(dtype=np.float64)[arret_idx],
+            df_poi["poi_lat"].to_numpy(dtype=np.float64)[poi_idx],
+            df_poi["poi_lon"].to_numpy(dtype=np.float64)[poi_idx],
+        )
+        keep = distances <= max_distance
+        if max_per_type is not None:
+            poi_types = pd.factorize(df_poi["type_lieu"])[0]
+            keep[keep] = SpatialService.select_nearest_per_type(
+                arret_idx[keep],
+                poi_idx[keep],
+                distances[keep].astype(np.float32),
+                poi_types,
+                max_per_type,
+            )
+        logger.info(
+            f"{int(keep.sum())} paires arrêt-POI pour {len(zone_idx)} paires zone-POI"
+        )
+        return (
+            arret_idx[keep].astype(np.int64),
+            poi_idx[keep],
+            distances[keep].astype(np.float32),
+            zone_idx[route_idx][keep],
+        )
+
+    @staticmethod
+    def save_stop_areas(
+        df_arrets: pd.DataFrame,
+        df_zones: pd.DataFrame,
+        zone_of: np.ndarray,
+        output_folder: Path,
+    ) -> Path:
+        """
+        Enregistre la table arrêt -> zone d'arrêt dans le dossier de sortie.
+
+        Args:
+            df_arrets: DataFrame des arrêts
+            df_zones: DataFrame des zones (cf. `build_stop_areas`)
+            zone_of: indice de zone de chaque arrêt
+            output_folder: dossier de sortie
+
+        Returns:
+            Path du fichier CSV créé
+        """
+        table = pd.DataFrame(
+            {
+                "zone_id": zone_of,
+                "zone_arret_id": df_zones["ArRId"].to_numpy()[zone_of],
+                "zone_nom": df_zones["ArRName"].to_numpy()[zone_of],
+                "arret_id": df_arrets["ArRId"].to_numpy(),
+                "arret_nom": df_arrets["ArRName"].to_numpy(),
+                "arret_type": df_arrets["ArRType"].to_numpy(),
+            }
+        ).sort_values(["zone_id", "arret_id"], kind="stable")
+
+        output_folder = Path(output_folder)
+        output_folder.mkdir(parents=True, exist_ok=True)
+        output_file = output_folder / STOP_AREAS_FILENAME
+        table.to_csv(output_file, index=False)
+        return output_file
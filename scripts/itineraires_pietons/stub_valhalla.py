@@ -0,0 +1,593 @@
+"""
+Serveur Valhalla factice pour les tests de charge hors ligne.
+
+Serveur asyncio sans dépendance externe (HTTP/1.1, connexions persistantes)
+qui répond au sous-ensemble de l'API Valhalla utilisé via routingpy :
+- POST /route : tracé synthétique (polyline6) entre les points ;
+- POST /sources_to_targets : distances et durées ;
+- POST /isochrone : polygone atteignable (cercle, ou losange en grille) ;
+- GET /status, et GET /stats pour les compteurs du serveur.
+
+Les tracés sont rectilignes ("ligne") ou en escalier sur une grille d'îlots
+("grille", distance de Manhattan) ; la durée suit la vitesse de marche du
+profil (LOCAL_WALKING_SPEEDS_KMH). Pour éprouver le client (nouvelles
+tentatives, limites de concurrence, débit), le serveur simule :
+- une latence par requête tirée d'une loi constante, uniforme,
+  exponentielle ou log-normale de moyenne donnée ;
+- un nombre de requêtes traitées simultanément (file d'attente au-delà) ;
+- des erreurs 500 et des refus 429 aléatoires, et des 429 au-delà d'un débit
+  maximal (seau à jetons).
+
+Usage :
+    python -m itineraires_pietons.stub_valhalla --latency lognormale --latency-ms 30 --overload-rate 0.05
+    python -m itineraires_pietons --valhalla-url http://127.0.0.1:8002 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import (
+    DEFAULT_ROUTING_PROFILE,
+    EARTH_RADIUS_M,
+    LOCAL_WALKING_SPEEDS_KMH,
+    STUB_VALHALLA_GEOMETRIES,
+    STUB_VALHALLA_GRID_STEP_M,
+    STUB_VALHALLA_HOST,
+    STUB_VALHALLA_LATENCIES,
+    STUB_VALHALLA_LATENCY_MS,
+    STUB_VALHALLA_LOGNORMAL_SIGMA,
+    STUB_VALHALLA_POINT_SPACING_M,
+    STUB_VALHALLA_PORT,
+    VALHALLA_PROFILE,
+)
+from .geometry_reduction import GeometryReducer
+
+logger = logging.getLogger(__name__)
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+}
+ISOCHRONE_CIRCLE_POINTS = 64
+
+
+class StubValhallaServer:
+    """Serveur HTTP asyncio imitant Valhalla avec latence et erreurs simulées."""
+
+    def __init__(
+        self,
+        host: str = STUB_VALHALLA_HOST,
+        port: int = STUB_VALHALLA_PORT,
+        latency: str = "constante",
+        latency_ms: float = STUB_VALHALLA_LATENCY_MS,
+        error_rate: float = 0.0,
+        overload_rate: float = 0.0,
+        rate_limit: Optional[float] = None,
+        workers: Optional[int] = None,
+        geometry: str = "ligne",
+        seed: int = 0,
+        record_requests: bool = False,
+    ):
+        """
+        Args:
+            host: adresse d'écoute
+            port: port d'écoute (0 = port libre choisi par le système)
+            latency: loi de la latence (cf. STUB_VALHALLA_LATENCIES)
+            latency_ms: latence moyenne (ms)
+            error_rate: part des requêtes en erreur 500
+            overload_rate: part des requêtes refusées en 429
+            rate_limit: débit maximal (requêtes/s) au-delà duquel le serveur
+                répond 429 (None = illimité)
+            workers: requêtes traitées simultanément, les suivantes attendent
+                (None = illimité)
+            geometry: "ligne" (tracé direct) ou "grille" (escalier d'îlots)
+            seed: graine des tirages (latences, erreurs)
+            record_requests: conserve les corps des requêtes reçues (tests)
+        """
+        if latency not in STUB_VALHALLA_LATENCIES:
+            raise ValueError(
+                f"Loi de latence inconnue : {latency} "
+                f"(lois disponibles : {', '.join(STUB_VALHALLA_LATENCIES)})"
+            )
+        if geometry not in STUB_VALHALLA_GEOMETRIES:
+            raise ValueError(
+                f"Géométrie inconnue : {geometry} "
+                f"(géométries disponibles : {', '.join(STUB_VALHALLA_GEOMETRIES)})"
+            )
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.overload_rate = overload_rate
+        self.rate_limit = rate_limit
+        self.workers = workers
+        self.geometry = geometry
+        self.rng = random.Random(seed)
+        self.responses: Counter = Counter()
+        self.record_requests = record_requests
+        # (chemin, corps JSON) des requêtes reçues, si record_requests
+        self.requests: List[Tuple[str, Dict[str, Any]]] = []
+        self._tokens = rate_limit or 0.0
+        self._refill = time.monotonic()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._writers: set = set()
+        self.handlers = {
+            "/route": self.route,
+            "/sources_to_targets": self.sources_to_targets,
+            "/isochrone": self.isochrone,
+        }
+
+    # --- Simulation -------------------------------------------------------
+
+    def sample_latency(self) -> float:
+        """Latence (s) d'une requête selon la loi configurée."""
+        mean = self.latency_ms / 1000.0
+        if mean <= 0:
+            return 0.0
+        if self.latency == "uniforme":
+            return self.rng.uniform(0.0, 2.0 * mean)
+        if self.latency == "exponentielle":
+            return self.rng.expovariate(1.0 / mean)
+        if self.latency == "lognormale":
+            sigma = STUB_VALHALLA_LOGNORMAL_SIGMA
+            return self.rng.lognormvariate(math.log(mean) - sigma**2 / 2, sigma)
+        return mean
+
+    def _over_rate_limit(self) -> bool:
+        """Seau à jetons de `rate_limit` jetons/s (rafale d'une seconde)."""
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        self._tokens = min(
+            self.rate_limit, self._tokens + (now - self._refill) * self.rate_limit
+        )
+        self._refill = now
+        if self._tokens < 1.0:
+            return True
+        self._tokens -= 1.0
+        return False
+
+    # --- Géométrie --------------------------------------------------------
+
+    @staticmethod
+    def _speed_ms(body: Dict[str, Any]) -> float:
+        """Vitesse de marche (m/s) du profil demandé (options du coût)."""
+        options = (body.get("costing_options") or {}).get(VALHALLA_PROFILE) or {}
+        profile = options.get("type", DEFAULT_ROUTING_PROFILE)
+        speed = LOCAL_WALKING_SPEEDS_KMH.get(
+            profile, LOCAL_WALKING_SPEEDS_KMH[DEFAULT_ROUTING_PROFILE]
+        )
+        return speed / 3.6
+
+    @staticmethod
+    def _offsets_m(
+        origin: Dict[str, float], destination: Dict[str, float]
+    ) -> Tuple[float, float, float]:
+        """Écarts est-ouest et nord-sud (m) et facteur m/degré de longitude."""
+        lat0 = math.radians(origin["lat"])
+        m_per_deg = math.radians(1.0) * EARTH_RADIUS_M
+        dx = (destination["lon"] - origin["lon"]) * m_per_deg * math.cos(lat0)
+        dy = (destination["lat"] - origin["lat"]) * m_per_deg
+        return dx, dy, m_per_deg
+
+    def leg_length(self, origin: Dict[str, float], destination: Dict[str, float]):
+        """Longueur (m) d'un tronçon selon la géométrie simulée."""
+        dx, dy, _ = self._offsets_m(origin, destination)
+        return abs(dx) + abs(dy) if self.geometry == "grille" else math.hypot(dx, dy)
+
+    def leg_shape(
+        self, origin: Dict[str, float], destination: Dict[str, float]
+    ) -> np.ndarray:
+        """Tracé (lon, lat) d'un tronçon : direct ou en escalier d'îlots."""
+        start = np.array([origin["lon"], origin["lat"]])
+        delta = np.array([destination["lon"], destination["lat"]]) - start
+        if self.geometry == "grille":
+            dx, dy, _ = self._offsets_m(origin, destination)
+            steps = max(1, math.ceil((abs(dx) + abs(dy)) / STUB_VALHALLA_GRID_STEP_M))
+            fractions = np.arange(steps + 1) / steps
+            # Alternance de pas est-ouest puis nord-sud
+            x = np.repeat(fractions, 2)[1:]
+            y = np.repeat(fractions, 2)[:-1]
+            return start + np.column_stack([x, y]) * delta
+        n = max(
+            2,
+            math.ceil(
+                self.leg_length(origin, destination) / STUB_VALHALLA_POINT_SPACING_M
+            )
+            + 1,
+        )
+        return start + np.linspace(0.0, 1.0, n)[:, None] * delta
+
+    # --- Points d'accès ---------------------------------------------------
+
+    def route(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Réponse /route : un tronçon par paire de points successifs."""
+        locations = body["locations"]
+        if len(locations) < 2:
+            raise ValueError("Au moins deux points sont requis")
+        speed = self._speed_ms(body)
+        legs = []
+        for origin, destination in zip(locations[:-1], locations[1:]):
+            length = self.leg_length(origin, destination)
+            legs.append(
+                {
+                    "shape": GeometryReducer.encode_polyline(
+                        self.leg_shape(origin, destination), precision=6
+                    ),
+                    "summary": {"time": length / speed, "length": length / 1000.0},
+                }
+            )
+        return {
+            "trip": {
+                "locations": locations,
+                "legs": legs,
+                "summary": {
+                    "time": sum(leg["summary"]["time"] for leg in legs),
+                    "length": sum(leg["summary"]["length"] for leg in legs),
+                },
+                "units": "kilometers",
+                "status": 0,
+                "status_message": "Found route between points",
+            }
+        }
+
+    def sources_to_targets(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Réponse /sources_to_targets : distances (km) et durées (s)."""
+        speed = self._speed_ms(body)
+        rows = []
+        for i, source in enumerate(body["sources"]):
+            row = []
+            for j, target in enumerate(body["targets"]):
+                length = self.leg_length(source, target)
+                row.append(
+                    {
+                        "from_index": i,
+                        "to_index": j,
+                        "distance": round(length / 1000.0, 3),
+                        "time": round(length / speed),
+                    }
+                )
+            rows.append(row)
+        return {"sources_to_targets": rows, "units": "kilometers"}
+
+    def isochrone(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Réponse /isochrone : un polygone par contour (du plus grand au plus petit)."""
+        center = body["locations"][0]
+        speed = self._speed_ms(body)
+        lat0 = math.radians(center["lat"])
+        m_per_deg = math.radians(1.0) * EARTH_RADIUS_M
+        features = []
+        for contour in body.get("contours", []):
+            radius = contour["time"] * 60.0 * speed
+            if self.geometry == "grille":
+                # Boule de la distance de Manhattan : losange
+                angles = np.arange(5) * (np.pi / 2)
+            else:
+                angles = np.linspace(0.0, 2 * np.pi, ISOCHRONE_CIRCLE_POINTS + 1)
+            lon = center["lon"] + radius * np.cos(angles) / (m_per_deg * math.cos(lat0))
+            lat = center["lat"] + radius * np.sin(angles) / m_per_deg
+            features.append(
+                {
+                    "type": "Feature",
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [np.column_stack([lon, lat]).tolist()],
+                    },
+                    "properties": {"contour": contour["time"], "metric": "time"},
+                }
+            )
+        return {"type": "FeatureCollection", "features": features[::-1]}
+
+    # --- HTTP -------------------------------------------------------------
+
+    @staticmethod
+    async def _read_request(
+        reader: asyncio.StreamReader,
+    ) -> Optional[Tuple[str, str, bytes, bool]]:
+        """Lit une requête ; renvoie (méthode, chemin, corps, keep-alive) ou None."""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise ValueError("Ligne de requête invalide")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        length = int(headers.get("content-length", 0) or 0)
+        body = await reader.readexactly(length) if length else b""
+        connection = headers.get("connection", "")
+        keep_alive = (
+            connection != "close"
+            if version == "HTTP/1.1"
+            else connection == "keep-alive"
+        )
+        return method, target.split("?")[0], body, keep_alive
+
+    async def _send_json(
+        self, writer: asyncio.StreamWriter, status: int, body, keep_alive: bool
+    ):
+        self.responses[status] += 1
+        payload = json.dumps(body).encode()
+        head = [
+            f"HTTP/1.1 {status} {REASONS[status]}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(payload)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+    @staticmethod
+    def _error(status: int, message: str) -> Dict[str, Any]:
+        """Corps d'erreur au format Valhalla."""
+        return {"error_code": status, "error": message, "status_code": status}
+
+    async def _dispatch(
+        self,
+        writer: asyncio.StreamWriter,
+        method: str,
+        path: str,
+        body: bytes,
+        keep_alive: bool,
+    ):
+        self.responses[path] += 1
+        if method == "GET" and path == "/status":
+            await self._send_json(writer, 200, {"version": "stub"}, keep_alive)
+            return
+        if method == "GET" and path == "/stats":
+            await self._send_json(writer, 200, self.stats(), keep_alive)
+            return
+        if path not in self.handlers:
+            await self._send_json(
+                writer, 404, self._error(404, f"Route inconnue : {path}"), keep_alive
+            )
+            return
+        if method != "POST":
+            await self._send_json(
+                writer, 405, self._error(405, "Méthode POST attendue"), keep_alive
+            )
+            return
+
+        # Refus immédiats : débit maximal dépassé ou surcharge simulée
+        if self._over_rate_limit() or self.rng.random() < self.overload_rate:
+            await self._send_json(
+                writer, 429, self._error(429, "Trop de requêtes"), keep_alive
+            )
+            return
+
+        async with self._semaphore:
+            await asyncio.sleep(self.sample_latency())
+            if self.rng.random() < self.error_rate:
+                status, response = 500, self._error(500, "Erreur simulée")
+            else:
+                try:
+                    payload = json.loads(body)
+                    if self.record_requests:
+                        self.requests.append((path, payload))
+                    status, response = 200, self.handlers[path](payload)
+                except (ValueError, KeyError, TypeError) as e:
+                    status, response = 400, self._error(400, f"Requête invalide : {e}")
+        await self._send_json(writer, status, response, keep_alive)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """Traite les requêtes successives d'une connexion."""
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ValueError as e:
+                    await self._send_json(writer, 400, self._error(400, str(e)), False)
+                    break
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                await self._dispatch(writer, method, path, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs du serveur : requêtes par point d'accès et réponses par statut."""
+        return {
+            "requetes": {
+                path: self.responses[path]
+                for path in ["/route", "/sources_to_targets", "/isochrone"]
+            },
+            "reponses": {
+                str(status): count
+                for status, count in self.responses.items()
+                if isinstance(status, int)
+            },
+        }
+
+    async def _start(self) -> asyncio.AbstractServer:
+        # Sémaphore créé dans la boucle du serveur
+        self._semaphore = asyncio.Semaphore(self.workers or sys.maxsize)
+        server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port
+        )
+        self.port = server.sockets[0].getsockname()[1]
+        return server
+
+    async def serve(self):
+        """Démarre le serveur et traite les connexions jusqu'à interruption."""
+        server = await self._start()
+        logger.info(
+            f"Valhalla factice à l'écoute sur http://{self.host}:{self.port} "
+            f"(latence {self.latency} {self.latency_ms:g} ms, "
+            f"erreurs {self.error_rate:.0%}, 429 {self.overload_rate:.0%}, "
+            f"géométrie {self.geometry})"
+        )
+        async with server:
+            await server.serve_forever()
+
+    def start_background(self) -> str:
+        """
+        Démarre le serveur dans un thread (boucle asyncio dédiée).
+
+        Returns:
+            URL du serveur, à passer à `RoutingService` (valhalla_url)
+        """
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            server = self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+            # Arrêt : fermeture de l'écoute et des connexions en cours
+            server.close()
+            for writer in list(self._writers):
+                writer.close()
+            self._loop.run_until_complete(
+                asyncio.gather(*asyncio.all_tasks(self._loop), return_exceptions=True)
+            )
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="stub-valhalla", daemon=True)
+        self._thread.start()
+        started.wait()
+        return f"http://{self.host}:{self.port}"
+
+    def stop(self):
+        """Arrête un serveur démarré par `start_background`."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """Options de simulation du serveur (partagées avec routing_harness)."""
+    parser.add_argument(
+        "--latency",
+        choices=STUB_VALHALLA_LATENCIES,
+        default="constante",
+        help="Loi de la latence simulée (défaut: constante)",
+    )
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=STUB_VALHALLA_LATENCY_MS,
+        help=f"Latence moyenne en ms (défaut: {STUB_VALHALLA_LATENCY_MS:g})",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Part des requêtes en erreur 500 (défaut: 0)",
+    )
+    parser.add_argument(
+        "--overload-rate",
+        type=float,
+        default=0.0,
+        help="Part des requêtes refusées en 429 (défaut: 0)",
+    )
+    parser.add_argument(
+        "--server-rate-limit",
+        type=float,
+        default=None,
+        help="Débit maximal du serveur en requêtes/s, 429 au-delà (défaut: illimité)",
+    )
+    parser.add_argument(
+        "--server-workers",
+        type=int,
+        default=None,
+        help="Requêtes traitées simultanément par le serveur (défaut: illimité)",
+    )
+    parser.add_argument(
+        "--geometry",
+        choices=STUB_VALHALLA_GEOMETRIES,
+        default="ligne",
+        help="Tracés directs ou en escalier sur une grille d'îlots (défaut: ligne)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Graine des tirages (défaut: 0)"
+    )
+
+
+def server_from_arguments(
+    args: argparse.Namespace, host: str = STUB_VALHALLA_HOST, port: int = 0
+) -> StubValhallaServer:
+    """Serveur configuré par les options de `add_server_arguments`."""
+    return StubValhallaServer(
+        host,
+        port,
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        overload_rate=args.overload_rate,
+        rate_limit=args.server_rate_limit,
+        workers=args.server_workers,
+        geometry=args.geometry,
+        seed=args.seed,
+    )
+
+
+def main():
+    """Point d'entrée du serveur Valhalla factice."""
+    parser = argparse.ArgumentParser(
+        description="Serveur Valhalla factice (route, sources_to_targets, isochrone)"
+    )
+    parser.add_argument(
+        "--host",
+        default=STUB_VALHALLA_HOST,
+        help=f"Adresse d'écoute (défaut: {STUB_VALHALLA_HOST})",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=STUB_VALHALLA_PORT,
+        help=f"Port d'écoute (défaut: {STUB_VALHALLA_PORT})",
+    )
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    server = server_from_arguments(args, args.host, args.port)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        logger.info(f"Compteurs du serveur : {server.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
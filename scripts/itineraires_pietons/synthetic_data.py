@@ -0,0 +1,397 @@
+"""
+Génération de jeux de données synthétiques d'arrêts et de POI (Data Layer).
+
+Les sources réelles (POI_IDF.csv, référentiel des arrêts) ne sont pas
+diffusables : ce module produit des jeux de même schéma (POI_COLUMNS,
+ARRETS_COLUMNS) et de structure réaliste, à une échelle allant d'une commune
+à 10 fois l'Île-de-France, pour mesurer les performances du pipeline
+(cf. benchmark) :
+- les communes sont réparties sur une grille perturbée autour de
+  SYNTHETIC_CENTER, à densité constante quelle que soit l'échelle, et
+  regroupées en EPCI et départements voisins ;
+- le poids de chaque commune (log-normal, renforcé vers le centre comme
+  Paris et la petite couronne) répartit arrêts et POI ;
+- les arrêts sont des quais groupés par station (même nom, à quelques
+  dizaines de mètres), en majorité de bus ;
+- les POI suivent la fréquence des types d'all_poi_types.txt (loi de Zipf sur
+  le rang), une partie est concentrée autour des stations, et une petite
+  part de doublons exacts est ajoutée.
+
+Usage :
+    python -m itineraires_pietons.synthetic_data --scale idf -o itineraires_pietons/data/synthetique
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import (
+    ALL_POI_TYPES_FILE,
+    ARRETS_COLUMNS,
+    DATA_DIR,
+    EARTH_RADIUS_M,
+    POI_COLUMNS,
+    POI_TYPES,
+    SYNTHETIC_CENTER,
+    SYNTHETIC_COMMUNE_AREA_KM2,
+    SYNTHETIC_COMMUNES_PER_DEPARTEMENT,
+    SYNTHETIC_COMMUNES_PER_EPCI,
+    SYNTHETIC_DUPLICATE_POI_SHARE,
+    SYNTHETIC_POI_BATCH_SIZE,
+    SYNTHETIC_POI_PER_COMMUNE,
+    SYNTHETIC_SCALES,
+    SYNTHETIC_STOP_TYPES,
+    SYNTHETIC_STOPS_PER_COMMUNE,
+)
+
+logger = logging.getLogger(__name__)
+
+POI_FILENAME = "poi_synthetiques.csv"
+ARRETS_FILENAME = "arrets_synthetiques.parquet"
+
+# Quais par station (bornes de tirage uniforme) et dispersion autour de la station
+QUAYS_PER_STATION = {"bus": (1, 2), "rail": (2, 4), "metro": (2, 4), "tram": (2, 3)}
+QUAY_SPREAD_M = 25.0
+# Part des POI tirés autour d'une station, et leur dispersion
+POI_NEAR_STOP_SHARE = 0.35
+POI_NEAR_STOP_SPREAD_M = 200.0
+
+
+def load_all_poi_types() -> list:
+    """Types de POI de la source complète, du plus fréquent au moins fréquent."""
+    if not ALL_POI_TYPES_FILE.exists():
+        return list(POI_TYPES)
+    with open(ALL_POI_TYPES_FILE, "r", encoding="latin-1") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class SyntheticDataGenerator:
+    """Générateur de jeux d'arrêts et de POI synthétiques."""
+
+    def __init__(
+        self,
+        n_communes: int = SYNTHETIC_SCALES["commune"],
+        stops_per_commune: float = SYNTHETIC_STOPS_PER_COMMUNE,
+        poi_per_commune: float = SYNTHETIC_POI_PER_COMMUNE,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            n_communes: nombre de communes générées (cf. SYNTHETIC_SCALES)
+            stops_per_commune: nombre moyen d'arrêts (quais) par commune
+            poi_per_commune: nombre moyen de POI par commune
+            seed: graine du générateur aléatoire (jeux reproductibles)
+        """
+        if n_communes < 1:
+            raise ValueError("Il faut au moins une commune")
+        self.n_communes = n_communes
+        self.stops_per_commune = stops_per_commune
+        self.poi_per_commune = poi_per_commune
+        self.rng = np.random.default_rng(seed)
+        # Côté (m) de la cellule d'une commune
+        self.cell_m = np.sqrt(SYNTHETIC_COMMUNE_AREA_KM2) * 1000.0
+
+    @staticmethod
+    def to_lonlat(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Coordonnées locales (m, autour de SYNTHETIC_CENTER) -> (lon, lat)."""
+        lon0, lat0 = SYNTHETIC_CENTER
+        lat = lat0 + np.degrees(y / EARTH_RADIUS_M)
+        lon = lon0 + np.degrees(x / (EARTH_RADIUS_M * np.cos(np.radians(lat0))))
+        return lon, lat
+
+    def _group(self, xy: np.ndarray, size: int) -> np.ndarray:
+        """Regroupe les communes voisines par paquets d'environ `size` (grille)."""
+        side = self.cell_m * np.sqrt(size)
+        cells = np.floor(xy / side).astype(np.int64)
+        _, group = np.unique(cells, axis=0, return_inverse=True)
+        return group.ravel()
+
+    def generate_communes(self) -> pd.DataFrame:
+        """
+        Génère les communes : centre, poids et rattachement administratif.
+
+        Returns:
+            DataFrame (x, y en mètres, poids, INSEE_COM, nom_commune_standard,
+            nom_epci, nom_departement)
+        """
+        n = self.n_communes
+        grid = int(np.ceil(np.sqrt(n)))
+        ij = np.stack(np.meshgrid(np.arange(grid), np.arange(grid)), -1).reshape(-1, 2)
+        cells = (ij - (grid - 1) / 2.0) * self.cell_m
+        # Les n cellules les plus proches du centre : région à peu près ronde
+        cells = cells[np.argsort(np.hypot(cells[:, 0], cells[:, 1]), kind="stable")[:n]]
+        xy = cells + self.rng.uniform(-0.3, 0.3, cells.shape) * self.cell_m
+
+        # Centre dense (Paris, petite couronne) et dispersion log-normale
+        r_km = np.hypot(xy[:, 0], xy[:, 1]) / 1000.0
+        weight = self.rng.lognormal(0.0, 0.8, n) * (
+            1.0 + 15.0 * np.exp(-((r_km / 6.0) ** 2))
+        )
+
+        departement = self._group(xy, SYNTHETIC_COMMUNES_PER_DEPARTEMENT)
+        epci = self._group(xy, SYNTHETIC_COMMUNES_PER_EPCI)
+        # Numéro de la commune dans son département
+        order = np.lexsort((np.arange(n), departement))
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n) - np.searchsorted(
+            departement[order], departement[order]
+        )
+        insee = pd.Series(departement + 1).astype(str).str.zfill(2) + pd.Series(
+            rank + 1
+        ).astype(str).str.zfill(3)
+
+        return pd.DataFrame(
+            {
+                "x": xy[:, 0],
+                "y": xy[:, 1],
+                "poids": weight / weight.sum(),
+                "INSEE_COM": insee,
+                "nom_commune_standard": "Commune " + insee,
+                "nom_epci": "EPCI " + pd.Series(epci + 1).astype(str),
+                "nom_departement": "Département "
+                + pd.Series(departement + 1).astype(str),
+            }
+        )
+
+    def generate_stops(self, communes: pd.DataFrame) -> pd.DataFrame:
+        """
+        Génère les arrêts : stations réparties selon le poids des communes,
+        chacune déclinée en quais de même nom.
+
+        Args:
+            communes: communes (cf. `generate_communes`)
+
+        Returns:
+            DataFrame des arrêts (ARRETS_COLUMNS)
+        """
+        types = np.array(list(SYNTHETIC_STOP_TYPES))
+        shares = np.array(list(SYNTHETIC_STOP_TYPES.values()))
+        bounds = np.array([QUAYS_PER_STATION[t] for t in types])
+        mean_quays = float(shares @ bounds.mean(axis=1))
+        n_stations = max(
+            1, round(self.n_communes * self.stops_per_commune / mean_quays)
+        )
+
+        commune = self.rng.choice(
+            len(communes), n_stations, p=communes["poids"].to_numpy()
+        )
+        kind = self.rng.choice(len(types), n_stations, p=shares / shares.sum())
+        quays = self.rng.integers(bounds[kind, 0], bounds[kind, 1] + 1)
+        spread = self.cell_m / 2.5
+        station_xy = np.column_stack(
+            [communes["x"].to_numpy()[commune], communes["y"].to_numpy()[commune]]
+        ) + self.rng.normal(0.0, spread, (n_stations, 2))
+
+        station = np.repeat(np.arange(n_stations), quays)
+        xy = station_xy[station] + self.rng.normal(
+            0.0, QUAY_SPREAD_M, (len(station), 2)
+        )
+        lon, lat = self.to_lonlat(xy[:, 0], xy[:, 1])
+        stop_commune = commune[station]
+
+        df = pd.DataFrame(
+            {
+                "ArRId": pd.Series(self.rng.permutation(len(station)) + 10000).astype(
+                    str
+                ),
+                "ArRName": "Station "
+                + pd.Series(station + 1).astype(str)
+                + " ("
+                + communes["nom_commune_standard"].to_numpy()[stop_commune]
+                + ")",
+                "ArRLatitude": lat,
+                "ArRLongitude": lon,
+                "ArRType": types[kind[station]],
+            }
+        )
+        for column in [
+            "INSEE_COM",
+            "nom_departement",
+            "nom_epci",
+            "nom_commune_standard",
+        ]:
+            df[column] = communes[column].to_numpy()[stop_commune]
+        return df[ARRETS_COLUMNS]
+
+    def iter_pois(
+        self, communes: pd.DataFrame, df_arrets: pd.DataFrame
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Génère les POI par lots de SYNTHETIC_POI_BATCH_SIZE (mémoire bornée
+        aux grandes échelles).
+
+        Args:
+            communes: communes (cf. `generate_communes`)
+            df_arrets: arrêts générés
+
+        Returns:
+            Itérateur de DataFrames de POI (POI_COLUMNS)
+        """
+        n_poi = max(1, round(self.n_communes * self.poi_per_commune))
+        for first in range(0, n_poi, SYNTHETIC_POI_BATCH_SIZE):
+            yield self.generate_pois(
+                communes,
+                df_arrets,
+                min(SYNTHETIC_POI_BATCH_SIZE, n_poi - first),
+                first_id=first + 1,
+            )
+
+    def generate_pois(
+        self,
+        communes: pd.DataFrame,
+        df_arrets: pd.DataFrame,
+        n_poi: int,
+        first_id: int = 1,
+    ) -> pd.DataFrame:
+        """
+        Génère un lot de POI : une partie autour des stations, le reste selon
+        le poids des communes ; types tirés selon leur fréquence réelle.
+
+        Args:
+            communes: communes (cf. `generate_communes`)
+            df_arrets: arrêts générés
+            n_poi: nombre de POI du lot (hors doublons)
+            first_id: numéro du premier POI du lot
+
+        Returns:
+            DataFrame des POI (POI_COLUMNS)
+        """
+        n_near = int(n_poi * POI_NEAR_STOP_SHARE) if len(df_arrets) else 0
+
+        commune = self.rng.choice(
+            len(communes), n_poi - n_near, p=communes["poids"].to_numpy()
+        )
+        xy_communes = np.column_stack(
+            [communes["x"].to_numpy()[commune], communes["y"].to_numpy()[commune]]
+        ) + self.rng.normal(0.0, self.cell_m / 2.5, (len(commune), 2))
+        lon, lat = self.to_lonlat(xy_communes[:, 0], xy_communes[:, 1])
+
+        stops = self.rng.integers(0, len(df_arrets), n_near) if n_near else []
+        spread_deg = np.degrees(POI_NEAR_STOP_SPREAD_M / EARTH_RADIUS_M)
+        near_lat = df_arrets["ArRLatitude"].to_numpy()[stops] + self.rng.normal(
+            0.0, spread_deg, n_near
+        )
+        near_lon = df_arrets["ArRLongitude"].to_numpy()[stops] + self.rng.normal(
+            0.0, spread_deg / np.cos(np.radians(SYNTHETIC_CENTER[1])), n_near
+        )
+        lat = np.concatenate([lat, near_lat])
+        lon = np.concatenate([lon, near_lon])
+
+        # Loi de Zipf sur le rang des types (fichier trié par fréquence)
+        types = np.array(load_all_poi_types())
+        frequency = 1.0 / np.arange(1, len(types) + 1)
+        kind = self.rng.choice(len(types), n_poi, p=frequency / frequency.sum())
+
+        ids = pd.Series(np.arange(first_id, first_id + n_poi)).astype(str)
+        prefix = np.where(self.rng.random(n_poi) < 0.8, "node/", "way/")
+        df = pd.DataFrame(
+            {
+                "id": prefix + ids,
+                "nom_poi": types[kind] + " " + ids,
+                "type_lieu": types[kind],
+                "source": np.where(self.rng.random(n_poi) < 0.7, "osm", "bdtopo"),
+                "poi_lat": lat,
+                "poi_lon": lon,
+            }
+        )
+        duplicates = self.rng.choice(
+            n_poi, int(n_poi * SYNTHETIC_DUPLICATE_POI_SHARE), replace=False
+        )
+        df = pd.concat([df, df.iloc[duplicates]], ignore_index=True)
+        return df.iloc[self.rng.permutation(len(df))][POI_COLUMNS]
+
+    def generate(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Génère un jeu complet.
+
+        Returns:
+            Tuple (df_poi, df_arrets)
+        """
+        communes = self.generate_communes()
+        df_arrets = self.generate_stops(communes)
+        df_poi = pd.concat(self.iter_pois(communes, df_arrets), ignore_index=True)
+        return df_poi, df_arrets
+
+    def write(self, output_dir: Path) -> Dict[str, Path]:
+        """
+        Génère un jeu et l'écrit aux formats des sources réelles (CSV des POI,
+        parquet des arrêts).
+
+        Args:
+            output_dir: dossier de sortie
+
+        Returns:
+            Chemins des fichiers écrits ("poi", "arrets")
+        """
+        start = time.perf_counter()
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        paths = {
+            "poi": output_dir / POI_FILENAME,
+            "arrets": output_dir / ARRETS_FILENAME,
+        }
+        communes = self.generate_communes()
+        df_arrets = self.generate_stops(communes)
+        df_arrets.to_parquet(paths["arrets"], index=False)
+        n_poi = 0
+        for i, df_poi in enumerate(self.iter_pois(communes, df_arrets)):
+            df_poi.to_csv(
+                paths["poi"], index=False, header=i == 0, mode="a" if i else "w"
+            )
+            n_poi += len(df_poi)
+        logger.info(
+            f"Jeu synthétique de {self.n_communes} communes : {len(df_arrets)} arrêts, "
+            f"{n_poi} POI écrits dans {output_dir} "
+            f"en {time.perf_counter() - start:.1f}s"
+        )
+        return paths
+
+
+def main():
+    """Point d'entrée du générateur de données synthétiques."""
+    parser = argparse.ArgumentParser(
+        description="Génère des jeux synthétiques d'arrêts et de POI"
+    )
+    parser.add_argument(
+        "--scale",
+        choices=list(SYNTHETIC_SCALES),
+        default="commune",
+        help="Échelle du jeu (défaut: commune)",
+    )
+    parser.add_argument(
+        "--communes",
+        type=int,
+        default=None,
+        help="Nombre de communes (remplace --scale)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=str(DATA_DIR / "synthetique"),
+        help="Dossier de sortie (défaut: data/synthetique)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Graine aléatoire (défaut: 0)"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    generator = SyntheticDataGenerator(
+        args.communes or SYNTHETIC_SCALES[args.scale], seed=args.seed
+    )
+    paths = generator.write(Path(args.output))
+    print(f"\n✓ POI : {paths['poi']}\n✓ Arrêts : {paths['arrets']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
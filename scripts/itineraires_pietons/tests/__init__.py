@@ -0,0 +1 @@
+"""Tests du package itineraires_pietons (python -m pytest depuis scripts/)."""
@@ -0,0 +1,38 @@
+"""Tests du chargement des données (cf. data_loader)."""
+
+import os
+
+import pandas as pd
+
+from itineraires_pietons.config import POI_COLUMNS, POI_TYPES
+from itineraires_pietons.data_loader import DataLoader
+
+
+def write_poi_csv(path, n, type_lieu, mtime):
+    pd.DataFrame(
+        {
+            "id": [f"{path.stem}-{i}" for i in range(n)],
+            "nom_poi": [f"POI {i}" for i in range(n)],
+            "type_lieu": type_lieu,
+            "source": "osm",
+            "poi_lat": 48.85 + 0.001 * pd.RangeIndex(n),
+            "poi_lon": 2.35,
+        }
+    )[POI_COLUMNS].to_csv(path, index=False)
+    os.utime(path, (mtime, mtime))
+
+
+def test_poi_parquet_cache_follows_the_source(tmp_path):
+    cache = tmp_path / "cache"
+    a, b = tmp_path / "a.csv", tmp_path / "b.csv"
+    write_poi_csv(a, 10, POI_TYPES[0], mtime=2_000_000_000)
+    # Source différente, plus ancienne que la conversion précédente
+    write_poi_csv(b, 4, POI_TYPES[1], mtime=1_000_000_000)
+
+    df_a = DataLoader.load_poi(str(DataLoader.convert_poi_to_parquet(str(a), cache)))
+    assert set(df_a["id"]) == {f"a-{i}" for i in range(10)}
+
+    df_b = DataLoader.load_poi(str(DataLoader.convert_poi_to_parquet(str(b), cache)))
+    assert set(df_b["id"]) == {f"b-{i}" for i in range(4)}
+    # Partitions de a.csv supprimées
+    assert not (cache / f"type_lieu={POI_TYPES[0]}").exists()
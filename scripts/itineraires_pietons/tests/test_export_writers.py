@@ -0,0 +1,104 @@
+"""Tests des écrivains de sortie (cf. export_writers)."""
+
+import pyarrow.parquet as pq
+
+from itineraires_pietons.config import PARQUET_DATASET_DIR, PARQUET_ROW_GROUP_SIZE
+from itineraires_pietons.export_writers import GeoJSONFilesWriter, ParquetWriter
+
+
+def make_feature(i, poi_nom="Boulangerie"):
+    return {
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": [[2.3, 48.8], [2.31, 48.81]]},
+        "properties": {
+            "arret_id": f"A{i // 10}",
+            "arret_nom": "Gare",
+            "poi_id": str(i),
+            "poi_nom": poi_nom,
+            "distance_reelle": 120.5,
+            "duree_marche": 1.5,
+        },
+    }
+
+
+def test_parquet_type_drift_after_first_row_group(tmp_path):
+    n = PARQUET_ROW_GROUP_SIZE
+    with ParquetWriter(tmp_path) as writer:
+        for i in range(n):
+            writer.write(make_feature(i), "")
+        writer.write(make_feature(n, poi_nom=float("nan")), "")
+        writer.write(make_feature(n + 1, poi_nom=12), "")
+
+    table = pq.read_table(tmp_path / PARQUET_DATASET_DIR)
+    assert table.num_rows == n + 2
+    assert table.column("poi_nom").to_pylist()[-2:] == [None, "12"]
+
+
+def test_parquet_resume_ignores_unfinished_part(tmp_path):
+    committed = []
+    writer = ParquetWriter(tmp_path)
+    for i in range(PARQUET_ROW_GROUP_SIZE + 3):
+        writer.write(make_feature(i), "")
+    # Interruption brutale : le fichier en cours n'est jamais fermé
+    del writer
+
+    with ParquetWriter(
+        tmp_path, append=True, on_commit=lambda *args: committed.append(args)
+    ) as writer:
+        for i in range(3):
+            writer.write(make_feature(1000 + i), "")
+
+    table = pq.read_table(tmp_path / PARQUET_DATASET_DIR)
+    assert sorted(table.column("poi_id").to_pylist()) == ["1000", "1001", "1002"]
+    assert len(committed) == 3
+
+
+def test_parquet_append_after_removing_a_part(tmp_path):
+    done = {}
+
+    def on_commit(arret_id, poi_id, location):
+        done[(arret_id, poi_id)] = location
+
+    for run in range(3):
+        with ParquetWriter(tmp_path, append=run > 0, on_commit=on_commit) as writer:
+            for i in range(run * 10, run * 10 + 10):
+                writer.write(make_feature(i), "")
+
+    # Génération incrémentale : toutes les paires du deuxième fichier disparaissent
+    removed = {
+        key: loc for key, loc in done.items() if loc.endswith("part-00001.parquet")
+    }
+    ParquetWriter.remove_features(tmp_path, removed)
+    for key in removed:
+        del done[key]
+
+    with ParquetWriter(tmp_path, append=True, on_commit=on_commit) as writer:
+        for i in range(100, 105):
+            writer.write(make_feature(i), "")
+
+    table = pq.read_table(tmp_path / PARQUET_DATASET_DIR)
+    rows = set(
+        zip(table.column("arret_id").to_pylist(), table.column("poi_id").to_pylist())
+    )
+    assert rows == set(done)
+    assert len(rows) == table.num_rows == 25
+
+
+def test_geojson_removal_keeps_files_shared_with_kept_pairs(tmp_path):
+    done = {}
+    with GeoJSONFilesWriter(
+        tmp_path, on_commit=lambda a, p, location: done.update({(a, p): location})
+    ) as writer:
+        # Deux quais d'une même gare : même nom de fichier pour un POI donné
+        for arret_id in ("Q1", "Q2"):
+            feature = make_feature(0)
+            feature["properties"]["arret_id"] = arret_id
+            writer.write(feature, "78621_Gare_0.geojson")
+        writer.write(make_feature(1), "78621_Gare_1.geojson")
+
+    removed = {key: done[key] for key in [("Q1", "0"), ("A0", "1")]}
+    in_use = {done[("Q2", "0")]}
+    GeoJSONFilesWriter.remove_features(tmp_path, removed, in_use)
+
+    assert (tmp_path / "78621_Gare_0.geojson").exists()
+    assert not (tmp_path / "78621_Gare_1.geojson").exists()
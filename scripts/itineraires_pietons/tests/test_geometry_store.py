@@ -0,0 +1,23 @@
+"""Tests du stockage géométrique (cf. geometry_store)."""
+
+import json
+
+from itineraires_pietons.geometry_store import benchmark
+
+
+def test_benchmark_reads_the_same_points_on_both_sides(tmp_path):
+    path = tmp_path / "itineraires.ndjson"
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(50):
+            coordinates = [[2.3 + k * 1e-4, 48.8 + i * 1e-4] for k in range(i % 7)]
+            feature = {
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": coordinates},
+                "properties": {"arret_id": f"A{i}", "poi_id": str(i)},
+            }
+            f.write(json.dumps(feature) + "\n")
+
+    results = benchmark([path])
+
+    assert results["geojson"]["itineraires"] == results["geostore"]["itineraires"] == 50
+    assert results["geojson"]["points"] == results["geostore"]["points"] > 0
@@ -0,0 +1,63 @@
+"""Tests de l'orchestrateur (cf. orchestrator)."""
+
+import json
+
+import pandas as pd
+
+from itineraires_pietons.benchmark import StubRoutingService
+from itineraires_pietons.config import MANIFEST_FILENAME, NDJSON_FILENAME
+from itineraires_pietons.orchestrator import ItineraryOrchestrator
+from itineraires_pietons.synthetic_data import SyntheticDataGenerator
+
+
+def generate(paths, output_folder, **options):
+    orchestrator = ItineraryOrchestrator()
+    orchestrator.routing_service = StubRoutingService()
+    return orchestrator.generate_itineraries(
+        poi_path=str(paths["poi"]),
+        arrets_path=str(paths["arrets"]),
+        output_folder=output_folder,
+        output_format="ndjson",
+        **options,
+    )
+
+
+def output_pairs(output_folder):
+    with open(output_folder / NDJSON_FILENAME, encoding="utf-8") as f:
+        properties = [json.loads(line)["properties"] for line in f]
+    return {(p["arret_id"], p["poi_id"]) for p in properties}
+
+
+def test_incremental_run_on_some_communes_keeps_the_others(tmp_path):
+    paths = SyntheticDataGenerator(n_communes=3, poi_per_commune=60).write(
+        tmp_path / "jeu"
+    )
+    output_folder = tmp_path / "sortie"
+    generate(paths, output_folder)
+    before = output_pairs(output_folder)
+
+    commune = str(pd.read_parquet(paths["arrets"])["INSEE_COM"].iloc[0])
+    generate(paths, output_folder, communes=[commune], incremental=True)
+    assert output_pairs(output_folder) == before
+    with open(output_folder / MANIFEST_FILENAME, encoding="utf-8") as f:
+        assert sum(1 for _ in f) >= len(before)
+
+    # Une génération incrémentale complète ne recalcule rien
+    assert generate(paths, output_folder, incremental=True) == 0
+    assert output_pairs(output_folder) == before
+
+    # Un arrêt supprimé de la commune traitée perd ses sorties, pas les autres
+    df_arrets = pd.read_parquet(paths["arrets"])
+    stop = next(
+        a
+        for a, _ in sorted(before)
+        if a
+        in set(
+            df_arrets.loc[
+                df_arrets["INSEE_COM"].astype(str) == commune, "ArRId"
+            ].astype(str)
+        )
+    )
+    df_arrets[df_arrets["ArRId"].astype(str) != stop].to_parquet(paths["arrets"])
+    generate(paths, output_folder, communes=[commune], incremental=True)
+    assert output_pairs(output_folder) == {key for key in before if key[0] != stop}
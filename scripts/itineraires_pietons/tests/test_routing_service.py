@@ -0,0 +1,21 @@
+"""Tests du service de routing (cf. routing_service)."""
+
+from itineraires_pietons.routing_service import RoutingService
+from itineraires_pietons.stub_valhalla import StubValhallaServer
+
+
+def test_isochrone_request_keeps_all_contours():
+    server = StubValhallaServer(port=0, latency_ms=0, record_requests=True)
+    url = server.start_background()
+    try:
+        rings = RoutingService(url).calculate_isochrone((2.35, 48.85), 600)
+    finally:
+        server.stop()
+
+    assert rings
+    [(path, body)] = server.requests
+    assert path == "/isochrone"
+    # denoise=0 doit être envoyé explicitement (défaut Valhalla : 1.0)
+    assert body["denoise"] == 0
+    assert body["polygons"] is True
+    assert body["contours"] == [{"time": 10.0}]
@@ -0,0 +1,30 @@
+"""Tests du journal d'exécution (cf. run_manifest)."""
+
+import json
+
+from itineraires_pietons.config import MANIFEST_FILENAME
+from itineraires_pietons.run_manifest import RunManifest
+
+
+def test_resume_after_truncated_line(tmp_path):
+    manifest = RunManifest(tmp_path)
+    manifest.mark_done("A1", "P1", "a.geojson")
+    manifest.mark_done("A1", "P2", "b.geojson")
+    manifest.close()
+    # Interruption brutale au milieu de l'écriture d'une entrée
+    path = tmp_path / MANIFEST_FILENAME
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"arret_id": "A1", "poi_id": "P3", "sta')
+
+    manifest = RunManifest(tmp_path, resume=True)
+    assert manifest.done_pairs() == {("A1", "P1"), ("A1", "P2")}
+    manifest.mark_done("A1", "P3", "c.geojson")
+    manifest.close()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["poi_id"] for line in lines] == ["P1", "P2", "P3"]
+    assert RunManifest(tmp_path, resume=True).done_pairs() == {
+        ("A1", "P1"),
+        ("A1", "P2"),
+        ("A1", "P3"),
+    }
@@ -0,0 +1,43 @@
+"""Tests de l'instrumentation (cf. run_metrics)."""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from itineraires_pietons import run_metrics
+from itineraires_pietons.config import LATENCY_BUCKETS
+from itineraires_pietons.run_metrics import RunMetrics
+
+
+def test_latency_histogram_percentiles_and_buckets(tmp_path):
+    samples = np.random.default_rng(0).lognormal(np.log(0.05), 0.8, 20_000)
+    metrics = RunMetrics()
+    for seconds in samples:
+        metrics.observe_latency("directions", float(seconds))
+
+    report = metrics.report()["latences"]["directions"]
+    assert report["requetes"] == len(samples)
+    assert report["max_s"] == pytest.approx(samples.max(), abs=1e-4)
+    for q in (50, 95, 99):
+        assert report[f"p{q}_s"] == pytest.approx(np.percentile(samples, q), rel=0.05)
+
+    # Mémoire constante : classes fixes, pas d'échantillons conservés
+    histogram = metrics.latencies["directions"]
+    assert sum(histogram.bins) == len(samples)
+
+    prom = metrics.write_prometheus(tmp_path / "metrics.prom").read_text()
+    for bound in LATENCY_BUCKETS:
+        expected = int((samples <= bound).sum())
+        assert f'kind="directions",le="{bound}"}} {expected}\n' in prom
+
+
+@pytest.mark.parametrize("platform, ru_maxrss", [("linux", 512_000), ("darwin", 512e6)])
+def test_max_rss_units(monkeypatch, platform, ru_maxrss):
+    monkeypatch.setattr(run_metrics.sys, "platform", platform)
+    monkeypatch.setattr(
+        run_metrics.resource,
+        "getrusage",
+        lambda who: SimpleNamespace(ru_maxrss=ru_maxrss),
+    )
+    assert run_metrics._max_rss_mb() == pytest.approx(512.0)
@@ -0,0 +1,72 @@
+"""Tests de la génération répartie (cf. sharding)."""
+
+import json
+import os
+import time
+
+from itineraires_pietons import sharding
+from itineraires_pietons.config import RUN_REPORT_FILENAME, SHARD_CLAIM_STALE_SECONDS
+from itineraires_pietons.sharding import ShardMerger, ShardQueue, run_sharded
+
+
+def test_run_sharded_after_merge_by_another_node(tmp_path, monkeypatch):
+    queue = ShardQueue(tmp_path)
+    queue.publish(
+        {
+            "cle": "commune",
+            "format": "ndjson",
+            "shards": [{"id": 0, "arrets": ["A0"], "paires_estimees": 10}],
+        }
+    )
+
+    def merged_elsewhere(output_folder, *args):
+        # Un autre nœud termine le dernier shard, fusionne et nettoie
+        report = {"valeurs": {"paires_journal": 42}}
+        (output_folder / RUN_REPORT_FILENAME).write_text(json.dumps(report))
+        ShardQueue(output_folder).cleanup()
+        return 0
+
+    monkeypatch.setattr(sharding, "run_shard_worker", merged_elsewhere)
+    assert run_sharded({}, tmp_path, 1, output_format="ndjson") == 42
+    assert queue.load() is None
+    assert queue.claim({}) is None
+
+
+def test_stale_claim_taken_over_once(tmp_path, monkeypatch):
+    queue = ShardQueue(tmp_path)
+    queue.shards_dir.mkdir()
+    claim = queue.shards_dir / "shard-0000.claim"
+    claim.write_text('{"pid": "arrete"}')
+    old = time.time() - SHARD_CLAIM_STALE_SECONDS - 60
+    os.utime(claim, (old, old))
+
+    rename = os.rename
+    raced = []
+
+    def rename_after_other_takeover(src, dst):
+        if not raced:
+            # Un autre processus écarte la réservation périmée et prend la sienne
+            raced.append(True)
+            assert ShardQueue._acquire(claim, {"pid": "autre"})
+        rename(src, dst)
+
+    monkeypatch.setattr(sharding.os, "rename", rename_after_other_takeover)
+    assert not ShardQueue._acquire(claim, {"pid": "moi"})
+    assert json.loads(claim.read_text()) == {"pid": "autre"}
+    assert [p.name for p in queue.shards_dir.iterdir()] == [claim.name]
+
+
+def test_geojson_merge_removes_files_of_an_earlier_run(tmp_path):
+    (tmp_path / "78621_Ancien_1.geojson").write_text("{}")
+    shard_dir = tmp_path / "shards" / "shard-0000"
+    shard_dir.mkdir(parents=True)
+    (shard_dir / "78621_Gare_2.geojson").write_text("{}")
+
+    relocated = ShardMerger._merge_geojson([shard_dir], tmp_path)
+
+    assert sorted(p.name for p in tmp_path.glob("*.geojson")) == [
+        "78621_Gare_2.geojson"
+    ]
+    assert relocated == {
+        str(shard_dir / "78621_Gare_2.geojson"): str(tmp_path / "78621_Gare_2.geojson")
+    }
@@ -0,0 +1,117 @@
+"""Précision de la recherche des paires face au filtrage haversine d'origine."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from itineraires_pietons.config import EARTH_RADIUS_M
+from itineraires_pietons.spatial_service import SpatialService
+
+
+def destination(lats, lons, bearings, distances):
+    """Points à `distances` mètres (sur la sphère) dans la direction `bearings`."""
+    lat1, lon1 = np.radians(lats), np.radians(lons)
+    delta = distances / EARTH_RADIUS_M
+    lat2 = np.arcsin(
+        np.sin(lat1) * np.cos(delta) + np.cos(lat1) * np.sin(delta) * np.cos(bearings)
+    )
+    lon2 = lon1 + np.arctan2(
+        np.sin(bearings) * np.sin(delta) * np.cos(lat1),
+        np.cos(delta) - np.sin(lat1) * np.sin(lat2),
+    )
+    return np.degrees(lat2), np.degrees(lon2)
+
+
+def make_dataset(max_distance, seed=0):
+    """Arrêts en France (dont un groupe dense à Paris) et POI proches, dont une
+    bande de POI à max_distance +/- 1 cm de chaque arrêt."""
+    rng = np.random.default_rng(seed)
+    stop_lats = np.concatenate(
+        [rng.uniform(42.5, 51.0, 150), 48.85 + rng.normal(0, 0.02, 150)]
+    )
+    stop_lons = np.concatenate(
+        [rng.uniform(-4.5, 7.5, 150), 2.35 + rng.normal(0, 0.03, 150)]
+    )
+    df_arrets = pd.DataFrame(
+        {
+            "ArRId": [f"A{i}" for i in range(len(stop_lats))],
+            "ArRLatitude": stop_lats,
+            "ArRLongitude": stop_lons,
+        }
+    )
+
+    lats, lons = [], []
+    for spread, per_stop in [(2.0 * max_distance, 20), (max_distance, 10)]:
+        origins = np.repeat(np.arange(len(stop_lats)), per_stop)
+        lat, lon = destination(
+            stop_lats[origins],
+            stop_lons[origins],
+            rng.uniform(0, 2 * np.pi, len(origins)),
+            rng.uniform(0, spread, len(origins)),
+        )
+        lats.append(lat)
+        lons.append(lon)
+    # Bande limite : juste à l'intérieur et juste à l'extérieur du rayon
+    origins = np.repeat(np.arange(len(stop_lats)), 8)
+    offsets = np.tile([-0.01, 0.01], len(origins) // 2)
+    lat, lon = destination(
+        stop_lats[origins],
+        stop_lons[origins],
+        rng.uniform(0, 2 * np.pi, len(origins)),
+        max_distance + offsets,
+    )
+    lats.append(lat)
+    lons.append(lon)
+
+    lats, lons = np.concatenate(lats), np.concatenate(lons)
+    df_poi = pd.DataFrame(
+        {
+            "id": [f"P{i}" for i in range(len(lats))],
+            "poi_lat": lats,
+            "poi_lon": lons,
+            "type_lieu": "commerce",
+        }
+    )
+    return df_arrets, df_poi
+
+
+def haversine_reference(df_arrets, df_poi, max_distance):
+    """Paires de la version d'origine : haversine exacte sur chaque arrêt."""
+    poi_lats = df_poi["poi_lat"].to_numpy()
+    poi_lons = df_poi["poi_lon"].to_numpy()
+    pairs = {}
+    for i, (lat0, lon0) in enumerate(
+        df_arrets[["ArRLatitude", "ArRLongitude"]].to_numpy()
+    ):
+        dists = SpatialService.haversine_vectorized(lat0, lon0, poi_lats, poi_lons)
+        for j in np.flatnonzero(dists <= max_distance):
+            pairs[(i, int(j))] = dists[j]
+    return pairs
+
+
+@pytest.mark.parametrize("max_distance", [50.0, 300.0, 500.0, 1000.0, 2500.0])
+def test_find_nearby_pairs_matches_haversine(max_distance):
+    df_arrets, df_poi = make_dataset(max_distance)
+    reference = haversine_reference(df_arrets, df_poi, max_distance)
+
+    arret_idx, poi_idx, dists = SpatialService.find_nearby_pairs(
+        df_arrets, df_poi, max_distance
+    )
+    found = dict(zip(zip(arret_idx.tolist(), poi_idx.tolist()), dists.tolist()))
+
+    assert set(found) == set(reference)
+    keys = sorted(reference)
+    np.testing.assert_allclose(
+        [found[k] for k in keys], [reference[k] for k in keys], rtol=1e-6
+    )
+    # La bande limite est bien exercée des deux côtés du rayon
+    band = np.abs(
+        SpatialService.haversine_vectorized(
+            df_arrets["ArRLatitude"].to_numpy()[arret_idx],
+            df_arrets["ArRLongitude"].to_numpy()[arret_idx],
+            df_poi["poi_lat"].to_numpy()[poi_idx],
+            df_poi["poi_lon"].to_numpy()[poi_idx],
+        )
+        - max_distance
+    )
+    assert (band < 0.02).sum() >= len(df_arrets) * 4 * 0.9
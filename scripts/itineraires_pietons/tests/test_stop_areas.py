@@ -0,0 +1,76 @@
+"""Tests des zones d'arrêt (cf. stop_areas)."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from itineraires_pietons.spatial_service import SpatialService
+from itineraires_pietons.stop_areas import StopAreaService
+
+normalize = StopAreaService.normalize_name
+
+
+@pytest.mark.parametrize(
+    "a, b, expected",
+    [
+        ("Gare de Trappes", "Trappes", True),
+        ("Le Vésinet-Centre", "Le Vésinet - Centre", True),
+        ("Saint-Quentin-en-Yvelines", "Saint-Quentin-en-Yvelines Montigny", True),
+        ("Saint", "Saint-Denis", False),
+        ("Saint-Denis", "Saint-Ouen", False),
+        ("Trappes", "Trappes Centre", False),
+    ],
+)
+def test_names_match(a, b, expected):
+    assert StopAreaService.names_match(normalize(a), normalize(b)) is expected
+
+
+def make_stations(seed=0):
+    """Gares de trois quais à ~60 m les uns des autres et POI alentour."""
+    rng = np.random.default_rng(seed)
+    centers = np.column_stack(
+        [48.80 + rng.uniform(0, 0.1, 40), 2.20 + rng.uniform(0, 0.2, 40)]
+    )
+    quays = centers.repeat(3, axis=0) + rng.normal(0, 0.0005, (120, 2))
+    df_arrets = pd.DataFrame(
+        {
+            "ArRId": [f"A{i}" for i in range(120)],
+            "ArRName": [f"Gare de Station {i // 3}" for i in range(120)],
+            "ArRLatitude": quays[:, 0],
+            "ArRLongitude": quays[:, 1],
+        }
+    )
+    poi = centers.repeat(60, axis=0) + rng.normal(0, 0.004, (2400, 2))
+    df_poi = pd.DataFrame(
+        {
+            "id": [f"P{i}" for i in range(2400)],
+            "poi_lat": poi[:, 0],
+            "poi_lon": poi[:, 1],
+            "type_lieu": rng.choice(["boulangerie", "pharmacie", "ecole"], 2400),
+        }
+    )
+    return df_arrets, df_poi
+
+
+@pytest.mark.parametrize("max_per_type", [None, 2])
+def test_clustered_pairs_match_per_stop_search(max_per_type):
+    df_arrets, df_poi = make_stations()
+    max_distance = 300.0
+    arret_idx, poi_idx, dists = SpatialService.find_nearby_pairs(
+        df_arrets, df_poi, max_distance, max_per_type=max_per_type
+    )
+
+    df_zones, zone_of = StopAreaService.build_stop_areas(df_arrets)
+    assert len(df_zones) < len(df_arrets)
+    zone_idx, zone_poi_idx, _ = SpatialService.find_nearby_pairs(
+        df_zones, df_poi, max_distance + float(df_zones["rayon_zone"].max())
+    )
+    got_arret, got_poi, got_dists, got_zone = StopAreaService.expand_pairs(
+        zone_idx, zone_poi_idx, zone_of, df_arrets, df_poi, max_distance, max_per_type
+    )
+
+    expected = dict(zip(zip(arret_idx.tolist(), poi_idx.tolist()), dists.tolist()))
+    got = dict(zip(zip(got_arret.tolist(), got_poi.tolist()), got_dists.tolist()))
+    assert got == expected
+    assert (got_dists <= max_distance).all()
+    assert (zone_of[got_arret] == got_zone).all()
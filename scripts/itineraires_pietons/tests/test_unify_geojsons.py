@@ -0,0 +1,50 @@
+"""Tests de l'agrégation des itinéraires (cf. unify_geojsons)."""
+
+import io
+import json
+
+import pytest
+
+from itineraires_pietons.unify_geojsons import iter_geojson_features, unify
+
+
+def make_feature(i):
+    return {
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": [[2.3, 48.8 + i * 1e-4]]},
+        "properties": {"arret_id": f"A{i}", "poi_id": str(i), "nom": 'Gare "[}{],\\'},
+    }
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024])
+def test_stream_reader_matches_json_load(chunk_size):
+    collection = {
+        "type": "FeatureCollection",
+        "name": "itineraires",
+        "features": [make_feature(i) for i in range(20)],
+        "bbox": [2.3, 48.8, 2.31, 48.81],
+    }
+    text = json.dumps(collection, indent=2, ensure_ascii=False)
+    assert (
+        list(iter_geojson_features(io.StringIO(text), chunk_size))
+        == collection["features"]
+    )
+    feature = make_feature(0)
+    assert list(
+        iter_geojson_features(io.StringIO(json.dumps(feature)), chunk_size)
+    ) == [feature]
+
+
+def test_unify_keeps_existing_output_on_error(tmp_path):
+    inputs = tmp_path / "sortie"
+    inputs.mkdir()
+    (inputs / "a.geojson").write_text(json.dumps(make_feature(0)), encoding="utf-8")
+    (inputs / "b.geojson").write_text('{"type": "Feature", "geo', encoding="utf-8")
+    output = tmp_path / "agrege.geojson"
+    output.write_text("précédent", encoding="utf-8")
+
+    with pytest.raises(json.JSONDecodeError):
+        unify([inputs], output, workers=1)
+
+    assert output.read_text(encoding="utf-8") == "précédent"
+    assert list(tmp_path.glob("*.tmp")) == []
@@ -1,37 +1,572 @@
+"""
+Agrégation des itinéraires générés en un seul fichier (Presentation Layer).
+
+Les fichiers GeoJSON (un par itinéraire), NDJSON et les stockages
+géométriques d'un ou plusieurs dossiers de sortie sont lus en parallèle par un pool de processus, filtrés par commune
+et type de POI, dédoublonnés puis écrits en flux (GeoJSON ou NDJSON). La
+mémoire reste bornée quelle que soit la taille des entrées : au-delà de
+UNIFY_PARTITION_BYTES, les Features sont réparties sur disque en partitions
+par empreinte, puis dédoublonnées une partition à la fois.
+
+Usage :
+    python -m itineraires_pietons.unify_geojsons itineraires_pietons/data/output_SQY -o itineraires_SQY.geojson
+"""
+
+import argparse
+import hashlib
 import json
+import logging
+import math
+import os
+import re
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .config import (
+    GEOSTORE_DIR,
+    UNIFY_FILES_PER_TASK,
+    UNIFY_PARTITION_BYTES,
+    UNIFY_READ_CHUNK,
+    UNIFY_TASK_BYTES,
+)
+from .geometry_store import GeometryStore
+
+logger = logging.getLogger(__name__)
+
+# Critères de doublon : même paire et même tracé, même paire, ou aucun
+DEDUPE_MODES = ["geometrie", "paire", "aucun"]
+
+# Feature sérialisée et son empreinte de dédoublonnage (None = pas de test)
+Record = Tuple[Optional[bytes], bytes]
+# Portion d'entrée lue par une tâche : (chemin, début, fin), en octets pour un
+# fichier et en itinéraires pour un stockage géométrique
+Segment = Tuple[Path, int, int]
+
+
+def list_input_files(
+    inputs: Sequence[Path], exclude: Optional[Path] = None
+) -> List[Path]:
+    """
+    Liste les fichiers à agréger (*.geojson et *.ndjson des dossiers donnés)
+    et les stockages géométriques (dossier de stockage, ou dossier de sortie
+    qui en contient un).
+
+    Args:
+        inputs: dossiers ou fichiers d'entrée
+        exclude: fichier à ignorer (la sortie, si elle est dans un dossier d'entrée)
+
+    Returns:
+        Chemins triés, sans doublon
+    """
+    files = []
+    for path in map(Path, inputs):
+        if GeometryStore.is_store(path):
+            files.append(path)
+        elif path.is_dir():
+            files.extend(path.glob("*.geojson"))
+            files.extend(path.glob("*.ndjson"))
+            if GeometryStore.is_store(path / GEOSTORE_DIR):
+                files.append(path / GEOSTORE_DIR)
+        elif path.exists():
+            files.append(path)
+        else:
+            raise FileNotFoundError(f"Entrée introuvable : {path}")
+    excluded = exclude.resolve() if exclude else None
+    return sorted({f for f in files if f.resolve() != excluded})
+
+
+def input_size(path: Path) -> int:
+    """Taille en octets d'un fichier d'entrée ou d'un stockage géométrique."""
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+    return path.stat().st_size
+
+
+class JSONStreamReader:
+    """
+    Lecture en flux des valeurs successives d'un document JSON : seule la
+    valeur en cours de décodage est gardée en mémoire (avec au plus
+    UNIFY_READ_CHUNK caractères d'avance).
+    """
+
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, f, chunk_size: int = UNIFY_READ_CHUNK):
+        """
+        Args:
+            f: fichier texte ouvert en lecture
+            chunk_size: caractères lus à chaque remplissage du tampon
+        """
+        self._file = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Complète le tampon (False en fin de fichier)."""
+        chunk = "" if self._eof else self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Prochain caractère significatif ("" en fin de fichier)."""
+        while True:
+            self._pos = self._WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._fill():
+                return self._buffer[self._pos : self._pos + 1]
+
+    def expect(self, chars: str) -> str:
+        """Consomme le prochain caractère significatif, qui doit être dans `chars`."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(
+                f"{' ou '.join(chars)} attendu", self._buffer, self._pos
+            )
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Décode la prochaine valeur JSON complète."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # Valeur coupée par la fin du tampon
+                if self._fill():
+                    continue
+                raise
+            if end == len(self._buffer) and self._fill():
+                continue  # un nombre peut se poursuivre dans la suite
+            self._pos = end
+            return value
+
+    def array(self) -> Iterator[Any]:
+        """Éléments du tableau suivant, décodés un à un."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.expect("]")
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_geojson_features(f, chunk_size: int = UNIFY_READ_CHUNK) -> Iterator[dict]:
+    """
+    Features d'un fichier GeoJSON (Feature ou FeatureCollection), lues en
+    flux : le tableau "features" d'un FeatureCollection n'est jamais chargé
+    en entier, la mémoire est bornée par la plus grosse Feature.
+
+    Args:
+        f: fichier texte ouvert en lecture
+        chunk_size: caractères lus à chaque remplissage du tampon
+
+    Returns:
+        Itérateur de Features
+    """
+    reader = JSONStreamReader(f, chunk_size)
+    reader.expect("{")
+    members = {}
+    separator = "," if reader.peek() != "}" else reader.expect("}")
+    while separator == ",":
+        key = reader.value()
+        reader.expect(":")
+        if key == "features" and reader.peek() == "[":
+            yield from reader.array()
+        else:
+            members[key] = reader.value()
+        separator = reader.expect(",}")
+    if members.get("type") == "Feature":
+        yield members
+
+
+def _iter_features(segment: Segment) -> Iterator[dict]:
+    """
+    Features d'une portion de fichier NDJSON (lignes commençant dans
+    [début, fin[), d'une plage d'itinéraires d'un stockage géométrique ou
+    d'un fichier GeoJSON entier.
+    """
+    path, start, end = segment
+    if path.is_dir():
+        yield from GeometryStore(path).iter_features(start, end)
+        return
+    if path.suffix == ".ndjson":
+        with open(path, "rb") as f:
+            if start:
+                # Ligne commencée avant `start` : lue par la portion précédente
+                f.seek(start - 1)
+                f.readline()
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    yield json.loads(line)
+        return
+    with open(path, encoding="utf-8") as f:
+        yield from iter_geojson_features(f)
+
+
+def plan_tasks(files: List[Path]) -> Iterator[List[Segment]]:
+    """
+    Répartit les fichiers en tâches d'au plus UNIFY_FILES_PER_TASK fichiers
+    et UNIFY_TASK_BYTES octets ; les gros NDJSON et les stockages
+    géométriques sont découpés en portions. Un fichier GeoJSON est toujours
+    lu en entier.
+    """
+    batch, batch_bytes = [], 0
+    for path in files:
+        size = input_size(path)
+        if path.is_dir():
+            n_routes = len(GeometryStore(path))
+            per_task = max(1, UNIFY_TASK_BYTES * n_routes // max(size, 1))
+            for start in range(0, n_routes, per_task):
+                yield [(path, start, min(start + per_task, n_routes))]
+            continue
+        if path.suffix == ".ndjson" and size > UNIFY_TASK_BYTES:
+            for start in range(0, size, UNIFY_TASK_BYTES):
+                yield [(path, start, min(start + UNIFY_TASK_BYTES, size))]
+            continue
+        batch.append((path, 0, size))
+        batch_bytes += size
+        if len(batch) >= UNIFY_FILES_PER_TASK or batch_bytes >= UNIFY_TASK_BYTES:
+            yield batch
+            batch, batch_bytes = [], 0
+    if batch:
+        yield batch
+
+
+def iter_input_features(inputs: Sequence[Path]) -> Iterator[dict]:
+    """
+    Features de toutes les entrées, lues en séquence (sans filtre ni
+    dédoublonnage).
+
+    Args:
+        inputs: dossiers ou fichiers d'entrée (cf. `list_input_files`)
+
+    Returns:
+        Itérateur de Features
+    """
+    for task in plan_tasks(list_input_files(inputs)):
+        for segment in task:
+            yield from _iter_features(segment)
+
+
+def feature_key(feature: dict, dedupe: str) -> Optional[bytes]:
+    """
+    Empreinte de dédoublonnage d'une Feature.
+
+    Args:
+        feature: Feature d'itinéraire
+        dedupe: "geometrie" (paire arrêt-POI et tracé identiques), "paire"
+            (paire seule) ou "aucun"
+
+    Returns:
+        Empreinte de 16 octets, ou None si pas de dédoublonnage
+    """
+    if dedupe == "aucun":
+        return None
+    properties = feature.get("properties") or {}
+    key = [str(properties.get("arret_id")), str(properties.get("poi_id"))]
+    if dedupe == "geometrie":
+        key.append(feature.get("geometry"))
+    canonical = json.dumps(key, separators=(",", ":"), sort_keys=True)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+
+def read_batch(
+    segments: List[Segment],
+    communes: Optional[Set[str]],
+    poi_types: Optional[Set[str]],
+    dedupe: str,
+) -> Tuple[List[Record], int]:
+    """
+    Lit, filtre et sérialise les Features d'une tâche (exécuté dans un
+    processus du pool).
+
+    Args:
+        segments: portions de fichiers de la tâche (cf. `plan_tasks`)
+        communes: codes INSEE retenus (None = tous)
+        poi_types: types de POI retenus (None = tous)
+        dedupe: critère de doublon (cf. `feature_key`)
+
+    Returns:
+        Tuple (Features retenues sérialisées avec leur empreinte, nombre de
+        Features lues)
+    """
+    records, n_read = [], 0
+    for segment in segments:
+        for feature in _iter_features(segment):
+            n_read += 1
+            properties = feature.setdefault("properties", {})
+            if (
+                communes is not None
+                and str(properties.get("code_insee")) not in communes
+            ):
+                continue
+            if poi_types is not None and properties.get("poi_type") not in poi_types:
+                continue
+            properties.setdefault("fichier_source", segment[0].name)
+            payload = json.dumps(feature, ensure_ascii=False, separators=(",", ":"))
+            records.append((feature_key(feature, dedupe), payload.encode()))
+    return records, n_read
+
+
+def _map_batches(
+    batches: Iterable[List[Segment]], args: tuple, workers: int
+) -> Iterator[Tuple[List[Record], int]]:
+    """
+    Applique `read_batch` aux lots, avec au plus `2 * workers` lots en cours,
+    et restitue les résultats dans l'ordre des lots.
+    """
+    if workers <= 1:
+        for batch in batches:
+            yield read_batch(batch, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for batch in batches:
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(read_batch, batch, *args))
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+class FeatureSink:
+    """Écriture en flux de Features sérialisées (GeoJSON ou NDJSON)."""
+
+    def __init__(self, path: Path, output_format: str):
+        """
+        Args:
+            path: fichier de sortie (écrit via un fichier temporaire)
+            output_format: "geojson" (FeatureCollection) ou "ndjson"
+        """
+        self.path = Path(path)
+        self.output_format = output_format
+        self.count = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._file = open(self._tmp, "wb")
+        if output_format == "geojson":
+            self._file.write(b'{"type":"FeatureCollection","features":[\n')
+
+    def write(self, payload: bytes):
+        if self.output_format == "geojson" and self.count:
+            self._file.write(b",\n")
+        self._file.write(payload)
+        if self.output_format == "ndjson":
+            self._file.write(b"\n")
+        self.count += 1
+
+    def close(self):
+        """Termine le fichier et remplace la sortie."""
+        if self.output_format == "geojson":
+            self._file.write(b"\n]}\n")
+        self._file.close()
+        self._tmp.replace(self.path)
+
+    def abort(self):
+        """Abandonne l'écriture : la sortie existante reste intacte."""
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+def unify(
+    inputs: Sequence[Path],
+    output: Path,
+    output_format: Optional[str] = None,
+    communes: Optional[Sequence[str]] = None,
+    poi_types: Optional[Sequence[str]] = None,
+    dedupe: str = "geometrie",
+    workers: Optional[int] = None,
+    partitions: Optional[int] = None,
+) -> dict:
+    """
+    Agrège les itinéraires de plusieurs fichiers en un seul.
+
+    Les Features sont écrites dans l'ordre des fichiers d'entrée (triés) ;
+    avec plusieurs partitions, dans l'ordre des partitions. La première
+    occurrence d'un doublon est conservée.
+
+    Args:
+        inputs: dossiers ou fichiers d'entrée
+        output: fichier de sortie
+        output_format: "geojson" ou "ndjson" (défaut : d'après l'extension)
+        communes: codes INSEE retenus (None = tous)
+        poi_types: types de POI retenus (None = tous)
+        dedupe: critère de doublon (cf. `feature_key`)
+        workers: nombre de processus de lecture (défaut : nombre de cœurs)
+        partitions: nombre de partitions de dédoublonnage (défaut : d'après
+            le volume d'entrée et UNIFY_PARTITION_BYTES)
+
+    Returns:
+        Statistiques (fichiers, lues, filtrées, doublons, écrites)
+    """
+    output = Path(output)
+    output_format = output_format or (
+        "ndjson" if output.suffix == ".ndjson" else "geojson"
+    )
+    files = list_input_files(inputs, exclude=output)
+    total_bytes = sum(input_size(f) for f in files)
+    if partitions is None:
+        partitions = max(1, math.ceil(total_bytes / UNIFY_PARTITION_BYTES))
+    workers = workers or os.cpu_count() or 1
+    logger.info(
+        f"{len(files)} fichiers à agréger ({total_bytes / 1024**2:.1f} Mo, "
+        f"{workers} processus, {partitions} partition(s))"
+    )
+
+    batches = plan_tasks(files)
+    args = (
+        set(map(str, communes)) if communes else None,
+        set(poi_types) if poi_types else None,
+        dedupe,
+    )
+    results = _map_batches(batches, args, workers)
+    sink = FeatureSink(output, output_format)
+    stats = {"fichiers": len(files), "lues": 0, "filtrees": 0, "doublons": 0}
 
-# Dossier contenant les fichiers GeoJSON d'itinéraires piétons vers POI
-INPUT_FOLDER = Path("data/output_SQY")
-OUTPUT_FILE = Path("data/geojson_SQY_itineraires_pietons_agrege.geojson")
+    def write_unique(records: Iterable[Record], seen: set):
+        for digest, payload in records:
+            if digest is not None:
+                if digest in seen:
+                    stats["doublons"] += 1
+                    continue
+                seen.add(digest)
+            sink.write(payload)
 
-# Initialisation de la FeatureCollection finale
-aggregated = {"type": "FeatureCollection", "features": []}
+    try:
+        if partitions == 1:
+            seen = set()
+            for records, n_read in results:
+                stats["lues"] += n_read
+                stats["filtrees"] += n_read - len(records)
+                write_unique(records, seen)
+        else:
+            # Répartition sur disque par empreinte : chaque partition tient en
+            # mémoire lors du dédoublonnage
+            with tempfile.TemporaryDirectory(dir=output.parent) as spool_dir:
+                spools = [
+                    open(Path(spool_dir) / f"partition-{p:04d}.bin", "w+b")
+                    for p in range(partitions)
+                ]
+                for records, n_read in results:
+                    stats["lues"] += n_read
+                    stats["filtrees"] += n_read - len(records)
+                    for digest, payload in records:
+                        p = (
+                            int.from_bytes(digest[:4], "big") % partitions
+                            if digest
+                            else 0
+                        )
+                        spools[p].write(
+                            (digest or b"").hex().encode() + b"\t" + payload + b"\n"
+                        )
+                for spool in spools:
+                    spool.seek(0)
+                    write_unique(
+                        (
+                            (bytes.fromhex(digest.decode()) or None, payload)
+                            for digest, _, payload in (
+                                line.rstrip(b"\n").partition(b"\t") for line in spool
+                            )
+                        ),
+                        set(),
+                    )
+                    spool.close()
+    except BaseException:
+        sink.abort()
+        raise
+    sink.close()
 
-# Parcours des fichiers .geojson
-all_geojson_files = list(INPUT_FOLDER.glob("*.geojson"))
-print(f"Found {len(all_geojson_files)} GeoJSON files in {INPUT_FOLDER}")
+    stats["ecrites"] = sink.count
+    return stats
 
-for file in INPUT_FOLDER.glob("*.geojson"):
-    with open(file, encoding="utf-8") as f:
-        data = json.load(f)
 
-        for feature in data.get("features", []):
-            # Les propriétés sont déjà complètes dans ces fichiers
-            # On peut ajouter le nom du fichier source si besoin
-            feature["properties"]["fichier_source"] = file.name
-            aggregated["features"].append(feature)
+def main():
+    """Point d'entrée de l'agrégation des itinéraires."""
+    parser = argparse.ArgumentParser(
+        description="Agrégation des itinéraires générés en un seul fichier GeoJSON ou NDJSON"
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Dossiers de sortie ou fichiers (*.geojson, *.ndjson) à agréger",
+    )
+    parser.add_argument(
+        "-o", "--output", required=True, help="Fichier de sortie (.geojson ou .ndjson)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["geojson", "ndjson"],
+        default=None,
+        help="Format de sortie (défaut: d'après l'extension)",
+    )
+    parser.add_argument(
+        "--communes",
+        nargs="+",
+        default=None,
+        help="Ne garder que les itinéraires de ces code(s) INSEE",
+    )
+    parser.add_argument(
+        "--poi-types",
+        nargs="+",
+        default=None,
+        help="Ne garder que ces types de POI",
+    )
+    parser.add_argument(
+        "--dedupe",
+        choices=DEDUPE_MODES,
+        default="geometrie",
+        help="Doublons supprimés : même paire et même tracé, même paire, ou aucun "
+        "(défaut: geometrie)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processus de lecture (défaut: nombre de cœurs)",
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=None,
+        help="Partitions de dédoublonnage sur disque (défaut: d'après le volume)",
+    )
+    args = parser.parse_args()
 
-# Écriture dans un nouveau fichier GeoJSON
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f_out:
-    json.dump(aggregated, f_out, ensure_ascii=False, indent=2)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    stats = unify(
+        args.inputs,
+        Path(args.output),
+        output_format=args.format,
+        communes=args.communes,
+        poi_types=args.poi_types,
+        dedupe=args.dedupe,
+        workers=args.workers,
+        partitions=args.partitions,
+    )
+    print(
+        f"✓ {stats['ecrites']} itinéraires agrégés dans {args.output} "
+        f"({stats['fichiers']} fichiers, {stats['lues']} lus, "
+        f"{stats['filtrees']} filtrés, {stats['doublons']} doublons)"
+    )
+    return 0
 
-print(f"Agrégation terminée : {OUTPUT_FILE}")
-print(f"Total features agrégées : {len(aggregated['features'])}")
 
-# Affichage d'un échantillon des propriétés disponibles
-if aggregated["features"]:
-    print("\nPropriétés disponibles dans les features :")
-    sample_props = aggregated["features"][0]["properties"]
-    for key in sample_props.keys():
-        print(f"  - {key}: {sample_props[key]}")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
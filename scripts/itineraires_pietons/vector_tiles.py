@@ -0,0 +1,682 @@
+"""
+Tuiles vectorielles des itinéraires générés (Presentation Layer).
+
+Au-delà de quelques milliers d'itinéraires, un GeoJSON agrégé n'est plus
+affichable dans une carte web. Cette étape d'export découpe les itinéraires
+d'un dossier de sortie (ou d'un fichier produit par unify_geojsons) en une
+pyramide de tuiles z/x/y au format Mapbox Vector Tile, écrite dans un seul
+fichier SQLite au format MBTiles :
+- à chaque zoom, les tracés sont simplifiés (Douglas-Peucker) avec une
+  tolérance fixe en unités de tuile, donc d'autant plus forte que le zoom est
+  faible, puis arrondis sur la grille de la tuile (les tracés réduits à un
+  point disparaissent) ;
+- chaque tracé est découpé aux limites de chacune des tuiles qu'il touche,
+  avec une marge de VECTOR_TILE_BUFFER unités pour éviter les coutures ;
+- les tuiles sont encodées en parallèle par un pool de processus, par lots de
+  tuiles d'un même zoom ; seul le processus principal écrit dans le fichier.
+
+Le fichier est servi par le service de requêtes (option --tiles) ; avec
+--tiles-dir, la pyramide est aussi écrite en fichiers z/x/y.pbf pour un
+serveur statique.
+
+Usage :
+    python -m itineraires_pietons.vector_tiles itineraires_pietons/data/output_SQY -o itineraires_SQY.mbtiles
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import (
+    VECTOR_TILES_FILENAME,
+    VECTOR_TILES_LAYER,
+    VECTOR_TILES_MIN_ZOOM,
+    VECTOR_TILES_MAX_ZOOM,
+    VECTOR_TILE_EXTENT,
+    VECTOR_TILE_BUFFER,
+    VECTOR_TILE_TOLERANCE,
+    VECTOR_TILE_MAX_BYTES,
+    VECTOR_TILES_PER_TASK,
+    VECTOR_TILE_PROPERTIES,
+)
+from .geometry_reduction import GeometryReducer
+from .route_store import RouteStore
+
+logger = logging.getLogger(__name__)
+
+# Commandes de géométrie MVT et type LINESTRING
+MOVE_TO, LINE_TO = 1, 2
+LINESTRING = 2
+
+# Données des itinéraires d'un processus du pool (cf. `_init_worker`)
+_ROUTES: Dict[str, Any] = {}
+
+
+def _varint(value: int) -> bytes:
+    """Entier non signé au format varint de protobuf."""
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _packed_varints(values: np.ndarray) -> bytes:
+    """Suite d'entiers non signés (< 2**35) en varints, vectorisée."""
+    values = np.asarray(values, dtype=np.int64)
+    if not len(values):
+        return b""
+    chunks = (values[:, None] >> (7 * np.arange(5))) & 0x7F
+    n_chunks = np.maximum(
+        1, (np.floor(np.log2(np.maximum(values, 1))).astype(np.int64) // 7) + 1
+    )
+    used = np.arange(5) < n_chunks[:, None]
+    more = np.arange(5) < (n_chunks - 1)[:, None]
+    encoded = chunks | np.where(more, 0x80, 0)
+    return encoded[used].astype(np.uint8).tobytes()
+
+
+def _message(field: int, payload: bytes) -> bytes:
+    """Champ protobuf de longueur variable (sous-message, chaîne, liste)."""
+    return _varint((field << 3) | 2) + _varint(len(payload)) + payload
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return (values << 1) ^ (values >> 63)
+
+
+class VectorTileBuilder:
+    """Découpe des itinéraires en pyramide de tuiles vectorielles MBTiles."""
+
+    def __init__(
+        self,
+        min_zoom: int = VECTOR_TILES_MIN_ZOOM,
+        max_zoom: int = VECTOR_TILES_MAX_ZOOM,
+        workers: int = 1,
+        extent: int = VECTOR_TILE_EXTENT,
+        buffer: int = VECTOR_TILE_BUFFER,
+        tolerance: float = VECTOR_TILE_TOLERANCE,
+    ):
+        """
+        Args:
+            min_zoom: zoom minimal de la pyramide
+            max_zoom: zoom maximal de la pyramide
+            workers: nombre de processus d'encodage (1 = dans ce processus)
+            extent: unités de coordonnées par côté de tuile
+            buffer: marge (unités de tuile) conservée autour de chaque tuile
+            tolerance: tolérance de simplification (unités de tuile)
+        """
+        if not 0 <= min_zoom <= max_zoom:
+            raise ValueError(f"Zooms invalides : {min_zoom} à {max_zoom}")
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.workers = workers
+        self.options = {"extent": extent, "buffer": buffer, "tolerance": tolerance}
+
+    @staticmethod
+    def to_mercator(lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        """Coordonnées Web Mercator normalisées ([0, 1], y vers le sud)."""
+        lat = np.clip(lat, -85.0511, 85.0511)
+        x = (lon + 180.0) / 360.0
+        y = (
+            1 - np.log(np.tan(np.radians(lat)) + 1 / np.cos(np.radians(lat))) / np.pi
+        ) / 2
+        return np.column_stack([x, y])
+
+    @staticmethod
+    def load_routes(features: Sequence[dict]) -> Dict[str, Any]:
+        """
+        Prépare les tracés et attributs des itinéraires pour le découpage.
+
+        Args:
+            features: Features des itinéraires (tracés en coordonnées ou en
+                polyline ; les itinéraires sans tracé sont ignorés)
+
+        Returns:
+            Dictionnaire : "coords" (tracés concaténés, Web Mercator),
+            "offsets" (début de chaque tracé), "tags" (paires (clé, valeur) de
+            chaque itinéraire), "keys" (noms des clés), "bounds" (emprise en
+            degrés)
+        """
+        lines, tags = [], []
+        keys = {}
+        for feature in features:
+            properties = feature.get("properties") or {}
+            coords = (feature.get("geometry") or {}).get("coordinates")
+            if not coords and properties.get("polyline"):
+                coords = GeometryReducer.decode_polyline(properties["polyline"])
+            if not coords or len(coords) < 2:
+                continue
+            lines.append(np.asarray(coords, dtype=np.float64)[:, :2])
+            tags.append(
+                [
+                    (keys.setdefault(name, len(keys)), properties[name])
+                    for name in VECTOR_TILE_PROPERTIES
+                    if properties.get(name) is not None
+                ]
+            )
+        if not lines:
+            raise ValueError("Aucun itinéraire avec un tracé à découper en tuiles")
+
+        lonlat = np.concatenate(lines)
+        offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum([len(line) for line in lines], out=offsets[1:])
+        return {
+            "coords": VectorTileBuilder.to_mercator(lonlat[:, 0], lonlat[:, 1]),
+            "offsets": offsets,
+            "tags": tags,
+            "keys": list(keys),
+            "bounds": lonlat.min(axis=0).tolist() + lonlat.max(axis=0).tolist(),
+        }
+
+    def simplify(
+        self, coords: np.ndarray, offsets: np.ndarray, zoom: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Simplifie tous les tracés pour un zoom, en une passe vectorisée.
+
+        Args:
+            coords: tracés concaténés (Web Mercator normalisé)
+            offsets: début de chaque tracé dans coords, suivi de len(coords)
+            zoom: niveau de zoom
+
+        Returns:
+            Tuple (tracés simplifiés en unités de tuile du zoom, leurs offsets)
+        """
+        world = coords * float(2**zoom * self.options["extent"])
+        keep = GeometryReducer.simplify_mask(world, self.options["tolerance"], offsets)
+        kept = np.zeros(len(offsets), dtype=np.int64)
+        np.cumsum(np.add.reduceat(keep, offsets[:-1]), out=kept[1:])
+        return world[keep], kept
+
+    @staticmethod
+    def assign_tiles(
+        lines: np.ndarray, offsets: np.ndarray, zoom: int, extent: int, buffer: int
+    ) -> List[Tuple[int, int, np.ndarray]]:
+        """
+        Tuiles d'un zoom touchées par chaque tracé (emprise élargie de la marge).
+
+        Args:
+            lines: tracés concaténés, en unités de tuile du zoom
+            offsets: début de chaque tracé dans lines
+            zoom: niveau de zoom
+            extent: unités de coordonnées par côté de tuile
+            buffer: marge (unités de tuile) autour de chaque tuile
+
+        Returns:
+            Liste de (x, y, indices des itinéraires) par tuile non vide
+        """
+        n = 2**zoom
+        starts = offsets[:-1]
+        low = np.column_stack(
+            [np.minimum.reduceat(lines[:, i], starts) for i in range(2)]
+        )
+        high = np.column_stack(
+            [np.maximum.reduceat(lines[:, i], starts) for i in range(2)]
+        )
+        first = np.clip(np.floor((low - buffer) / extent), 0, n - 1).astype(np.int64)
+        last = np.clip(np.floor((high + buffer) / extent), 0, n - 1).astype(np.int64)
+        span = last - first + 1
+        counts = span[:, 0] * span[:, 1]
+
+        # Une ligne par (itinéraire, tuile) de l'emprise
+        route = np.repeat(np.arange(len(counts)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        tx = first[route, 0] + k % span[route, 0]
+        ty = first[route, 1] + k // span[route, 0]
+        order = np.lexsort((route, ty, tx))
+        route, tx, ty = route[order], tx[order], ty[order]
+        new_tile = np.ones(len(route), dtype=bool)
+        new_tile[1:] = (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1])
+        tile_starts = np.flatnonzero(new_tile)
+        return [
+            (int(tx[s]), int(ty[s]), routes)
+            for s, routes in zip(tile_starts, np.split(route, tile_starts[1:]))
+        ]
+
+    @staticmethod
+    def clip_line(points: np.ndarray, low: float, high: float) -> List[np.ndarray]:
+        """
+        Découpe une polyligne au carré [low, high]² (Liang-Barsky vectorisé).
+
+        Args:
+            points: sommets (N, 2) en coordonnées de tuile
+            low: borne inférieure (x et y)
+            high: borne supérieure (x et y)
+
+        Returns:
+            Parties de la polyligne contenues dans le carré
+        """
+        if len(points) < 2:
+            return []
+        if points.min() >= low and points.max() <= high:
+            return [points]
+        p0, d = points[:-1], np.diff(points, axis=0)
+        t0 = np.zeros(len(d))
+        t1 = np.ones(len(d))
+        valid = np.ones(len(d), dtype=bool)
+        for axis in (0, 1):
+            for p, q in (
+                (-d[:, axis], p0[:, axis] - low),
+                (d[:, axis], high - p0[:, axis]),
+            ):
+                parallel = p == 0
+                valid &= ~(parallel & (q < 0))
+                t = q / np.where(parallel, 1.0, p)
+                t0 = np.where(p < 0, np.maximum(t0, t), t0)
+                t1 = np.where(p > 0, np.minimum(t1, t), t1)
+        segments = np.flatnonzero(valid & (t0 <= t1))
+        if not len(segments):
+            return []
+        a = p0[segments] + t0[segments, None] * d[segments]
+        b = p0[segments] + t1[segments, None] * d[segments]
+
+        # Nouvelle partie après un segment sorti du carré ou avant un segment
+        # qui y entre
+        start = np.ones(len(segments), dtype=bool)
+        start[1:] = (
+            (segments[1:] != segments[:-1] + 1)
+            | (t1[segments[:-1]] < 1)
+            | (t0[segments[1:]] > 0)
+        )
+        counts = 1 + start
+        position = np.cumsum(counts) - counts
+        clipped = np.empty((counts.sum(), 2))
+        clipped[position[start]] = a[start]
+        clipped[position + start] = b
+        return np.split(clipped, position[start][1:])
+
+    @staticmethod
+    def encode_geometry(parts: List[np.ndarray]) -> bytes:
+        """
+        Commandes de géométrie MVT (MoveTo / LineTo, deltas en zigzag) d'une
+        ligne en une ou plusieurs parties.
+        """
+        commands = []
+        cursor = np.zeros(2, dtype=np.int64)
+        for part in parts:
+            deltas = _zigzag(np.diff(part, axis=0, prepend=cursor[None, :]))
+            cursor = part[-1]
+            commands += [
+                [(1 << 3) | MOVE_TO],
+                deltas[0],
+                [((len(part) - 1) << 3) | LINE_TO],
+                deltas[1:].ravel(),
+            ]
+        return _packed_varints(np.concatenate(commands))
+
+    @staticmethod
+    def encode_value(value: Any) -> bytes:
+        """Valeur d'attribut MVT (chaîne, booléen, entier ou réel)."""
+        if isinstance(value, (bool, np.bool_)):
+            return b"\x38" + _varint(int(value))
+        if isinstance(value, (int, np.integer)):
+            value = int(value)
+            if value >= 0:
+                return b"\x28" + _varint(value)
+            return b"\x30" + _varint((value << 1) ^ (value >> 63))
+        if isinstance(value, (float, np.floating)):
+            return b"\x19" + struct.pack("<d", float(value))
+        return _message(1, str(value).encode("utf-8"))
+
+    @staticmethod
+    def to_mbtiles_metadata(
+        keys: List[str],
+        bounds: List[float],
+        min_zoom: int,
+        max_zoom: int,
+        fields: Dict[str, str],
+    ) -> Dict[str, str]:
+        """Table metadata d'un MBTiles de tuiles vectorielles."""
+        west, south, east, north = bounds
+        center_zoom = min(max(min_zoom, 13), max_zoom)
+        return {
+            "name": VECTOR_TILES_LAYER,
+            "format": "pbf",
+            "type": "overlay",
+            "minzoom": str(min_zoom),
+            "maxzoom": str(max_zoom),
+            "bounds": f"{west:.6f},{south:.6f},{east:.6f},{north:.6f}",
+            "center": f"{(west + east) / 2:.6f},{(south + north) / 2:.6f},{center_zoom}",
+            "json": json.dumps(
+                {
+                    "vector_layers": [
+                        {
+                            "id": VECTOR_TILES_LAYER,
+                            "fields": {key: fields[key] for key in keys},
+                            "minzoom": min_zoom,
+                            "maxzoom": max_zoom,
+                        }
+                    ]
+                },
+                ensure_ascii=False,
+            ),
+        }
+
+    def build(
+        self,
+        source: Path,
+        output_path: Optional[Path] = None,
+        tiles_dir: Optional[Path] = None,
+    ) -> Dict[str, Any]:
+        """
+        Construit la pyramide de tuiles des itinéraires d'une source.
+
+        Args:
+            source: dossier de sortie d'une génération ou fichier agrégé
+                (.geojson ou .ndjson)
+            output_path: fichier MBTiles (défaut : VECTOR_TILES_FILENAME dans
+                le dossier source, ou la source avec l'extension .mbtiles)
+            tiles_dir: écrit aussi les tuiles en z/x/y.pbf dans ce dossier
+
+        Returns:
+            Statistiques : tuiles, volumes et durées par zoom
+        """
+        start = time.perf_counter()
+        source = Path(source)
+        if output_path is None:
+            output_path = (
+                source.with_suffix(".mbtiles")
+                if source.is_file()
+                else source / VECTOR_TILES_FILENAME
+            )
+        output_path = Path(output_path)
+        routes = self.load_routes(RouteStore.read_features(source))
+        n_routes = len(routes["offsets"]) - 1
+        logger.info(
+            f"{n_routes} itinéraires à découper en tuiles, zooms "
+            f"{self.min_zoom} à {self.max_zoom} ({self.workers} processus)"
+        )
+
+        tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        db = sqlite3.connect(tmp_path)
+        db.executescript(
+            "CREATE TABLE metadata (name TEXT, value TEXT);"
+            "CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, "
+            "tile_row INTEGER, tile_data BLOB);"
+            "CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);"
+        )
+
+        initargs = (routes["tags"], routes["keys"], self.options)
+        pool = None
+        if self.workers > 1:
+            pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=initargs,
+            )
+        else:
+            _init_worker(*initargs)
+
+        stats: Dict[str, Any] = {"itineraires": n_routes, "zooms": {}}
+        large_tiles = 0
+        try:
+            for zoom in range(self.min_zoom, self.max_zoom + 1):
+                zoom_start = time.perf_counter()
+                lines, offsets = self.simplify(
+                    routes["coords"], routes["offsets"], zoom
+                )
+                tiles = self.assign_tiles(
+                    lines,
+                    offsets,
+                    zoom,
+                    self.options["extent"],
+                    self.options["buffer"],
+                )
+                # Chaque tâche reçoit les tracés simplifiés de ses tuiles
+                batches = [
+                    [
+                        (
+                            x,
+                            y,
+                            [(r, lines[offsets[r] : offsets[r + 1]]) for r in rows],
+                        )
+                        for x, y, rows in tiles[i : i + VECTOR_TILES_PER_TASK]
+                    ]
+                    for i in range(0, len(tiles), VECTOR_TILES_PER_TASK)
+                ]
+                results = (
+                    pool.map(_encode_tile_batch, batches)
+                    if pool is not None
+                    else map(_encode_tile_batch, batches)
+                )
+                sizes = []
+                for encoded in results:
+                    db.executemany(
+                        "INSERT INTO tiles VALUES (?, ?, ?, ?)",
+                        (
+                            (zoom, x, (1 << zoom) - 1 - y, sqlite3.Binary(data))
+                            for x, y, data in encoded
+                        ),
+                    )
+                    sizes += [len(data) for _, _, data in encoded]
+                db.commit()
+
+                sizes = np.asarray(sizes, dtype=np.int64)
+                large_tiles += int((sizes > VECTOR_TILE_MAX_BYTES).sum())
+                zoom_stats = {
+                    "tuiles": int(len(sizes)),
+                    "octets": int(sizes.sum()),
+                    "octets_moyen": int(sizes.mean()) if len(sizes) else 0,
+                    "octets_max": int(sizes.max()) if len(sizes) else 0,
+                    "duree_s": round(time.perf_counter() - zoom_start, 3),
+                }
+                stats["zooms"][zoom] = zoom_stats
+                logger.info(
+                    f"Zoom {zoom} : {zoom_stats['tuiles']} tuiles, "
+                    f"{zoom_stats['octets'] / 1e6:.2f} Mo "
+                    f"(moyenne {zoom_stats['octets_moyen'] / 1e3:.1f} Ko, "
+                    f"max {zoom_stats['octets_max'] / 1e3:.1f} Ko) "
+                    f"en {zoom_stats['duree_s']:.1f}s"
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        fields = {}
+        for route_tags in routes["tags"]:
+            for key, value in route_tags:
+                name = routes["keys"][key]
+                if fields.get(name) != "String":
+                    fields[name] = (
+                        "Number"
+                        if isinstance(value, (int, float))
+                        and not isinstance(value, bool)
+                        else "String"
+                    )
+        metadata = self.to_mbtiles_metadata(
+            routes["keys"], routes["bounds"], self.min_zoom, self.max_zoom, fields
+        )
+        db.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+        db.commit()
+        db.close()
+        os.replace(tmp_path, output_path)
+        if tiles_dir is not None:
+            self.extract(output_path, Path(tiles_dir))
+
+        stats["tuiles"] = sum(z["tuiles"] for z in stats["zooms"].values())
+        stats["octets"] = output_path.stat().st_size
+        stats["tuiles_volumineuses"] = large_tiles
+        stats["duree_totale_s"] = round(time.perf_counter() - start, 3)
+        if large_tiles:
+            logger.warning(
+                f"{large_tiles} tuiles dépassent {VECTOR_TILE_MAX_BYTES / 1e3:.0f} Ko : "
+                f"augmenter le zoom minimal (--min-zoom)"
+            )
+        logger.info(
+            f"Tuiles vectorielles : {stats['tuiles']} tuiles, "
+            f"{stats['octets'] / 1e6:.2f} Mo dans {output_path} "
+            f"en {stats['duree_totale_s']:.1f}s"
+        )
+        return stats
+
+    @staticmethod
+    def extract(mbtiles_path: Path, tiles_dir: Path) -> int:
+        """
+        Écrit les tuiles d'un MBTiles en fichiers z/x/y.pbf (non compressés)
+        et sa table metadata en metadata.json, pour un serveur statique.
+
+        Returns:
+            Nombre de tuiles écrites
+        """
+        db = sqlite3.connect(f"file:{mbtiles_path}?mode=ro", uri=True)
+        count = 0
+        try:
+            for zoom, x, row, data in db.execute(
+                "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles"
+            ):
+                path = tiles_dir / str(zoom) / str(x) / f"{(1 << zoom) - 1 - row}.pbf"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(gzip.decompress(data))
+                count += 1
+            metadata = dict(db.execute("SELECT name, value FROM metadata"))
+        finally:
+            db.close()
+        with open(tiles_dir / "metadata.json", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        logger.info(f"{count} tuiles écrites dans {tiles_dir}")
+        return count
+
+
+def _init_worker(tags: List[list], keys: List[str], options: Dict[str, Any]):
+    """Initialise les attributs des itinéraires d'un processus d'encodage."""
+    _ROUTES.update({"tags": tags, "keys": keys, **options})
+
+
+def _encode_tile_batch(
+    tiles: List[Tuple[int, int, List[Tuple[int, np.ndarray]]]],
+) -> List[Tuple[int, int, bytes]]:
+    """
+    Encode un lot de tuiles d'un même zoom (tâche d'un processus du pool).
+
+    Args:
+        tiles: (x, y, [(itinéraire, tracé simplifié en unités de tuile du
+            zoom), ...]) de chaque tuile
+
+    Returns:
+        (x, y, tuile MVT compressée en gzip) des tuiles non vides
+    """
+    extent, buffer = _ROUTES["extent"], _ROUTES["buffer"]
+    encoded = []
+    for x, y, routes in tiles:
+        origin = np.array([x * extent, y * extent], dtype=np.float64)
+        features, values, value_index = [], [], {}
+        for route, line in routes:
+            parts = []
+            for part in VectorTileBuilder.clip_line(
+                line - origin, -buffer, extent + buffer
+            ):
+                part = np.round(part).astype(np.int64)
+                distinct = np.ones(len(part), dtype=bool)
+                distinct[1:] = np.any(part[1:] != part[:-1], axis=1)
+                if distinct.sum() >= 2:
+                    parts.append(part[distinct])
+            if not parts:
+                continue
+
+            tags = []
+            for key, value in _ROUTES["tags"][route]:
+                slot = value_index.get((type(value), value))
+                if slot is None:
+                    slot = value_index[(type(value), value)] = len(values)
+                    values.append(value)
+                tags += [key, slot]
+            features.append(
+                _message(
+                    2,
+                    b"\x08"
+                    + _varint(route + 1)
+                    + _message(2, _packed_varints(np.asarray(tags, dtype=np.int64)))
+                    + b"\x18"
+                    + _varint(LINESTRING)
+                    + _message(4, VectorTileBuilder.encode_geometry(parts)),
+                )
+            )
+        if not features:
+            continue
+
+        layer = (
+            b"\x78\x02"
+            + _message(1, VECTOR_TILES_LAYER.encode())
+            + b"".join(features)
+            + b"".join(_message(3, key.encode("utf-8")) for key in _ROUTES["keys"])
+            + b"".join(_message(4, VectorTileBuilder.encode_value(v)) for v in values)
+            + b"\x28"
+            + _varint(extent)
+        )
+        encoded.append((x, y, gzip.compress(_message(3, layer), mtime=0)))
+    return encoded
+
+
+def main():
+    """Point d'entrée : pyramide de tuiles vectorielles d'une génération."""
+    parser = argparse.ArgumentParser(
+        description="Découpe des itinéraires générés en tuiles vectorielles (MBTiles)"
+    )
+    parser.add_argument(
+        "source",
+        help="Dossier de sortie d'une génération ou fichier agrégé (.geojson, .ndjson)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help=f"Fichier MBTiles (défaut: {VECTOR_TILES_FILENAME} dans le dossier source)",
+    )
+    parser.add_argument(
+        "--min-zoom",
+        type=int,
+        default=VECTOR_TILES_MIN_ZOOM,
+        help=f"Zoom minimal (défaut: {VECTOR_TILES_MIN_ZOOM})",
+    )
+    parser.add_argument(
+        "--max-zoom",
+        type=int,
+        default=VECTOR_TILES_MAX_ZOOM,
+        help=f"Zoom maximal (défaut: {VECTOR_TILES_MAX_ZOOM})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Nombre de processus d'encodage (défaut: nombre de cœurs)",
+    )
+    parser.add_argument(
+        "--tiles-dir",
+        default=None,
+        help="Écrit aussi les tuiles en z/x/y.pbf dans ce dossier (serveur statique)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    builder = VectorTileBuilder(args.min_zoom, args.max_zoom, args.workers)
+    stats = builder.build(
+        Path(args.source),
+        Path(args.output) if args.output else None,
+        Path(args.tiles_dir) if args.tiles_dir else None,
+    )
+    print(
+        f"\n✓ {stats['tuiles']} tuiles ({stats['octets'] / 1e6:.2f} Mo) "
+        f"générées en {stats['duree_totale_s']:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())